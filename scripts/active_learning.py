@@ -0,0 +1,415 @@
+"""Picks which frameworks of a screening to simulate next, by active learning.
+
+Running the GCMC stage of screening.py on tens of thousands of frameworks is
+unaffordable, while its cheaper stages have already described every
+framework: the structure stage records the cell, density and composition of
+each framework, the pores stage its pore geometry, and the henry stage its
+Henry coefficient and heat of adsorption.  A Gaussian process surrogate fitted
+on these descriptors against the GCMC loadings measured so far predicts the
+loading of every other framework, with an uncertainty.  Each round then
+simulates the batch of frameworks with the largest expected improvement over
+the best loading found (or with the largest uncertainty), until the budget of
+GCMC runs is spent.
+
+The frameworks of a batch are picked one at a time, each as though the ones
+before it had been simulated and their predicted loading found (the kriging
+believer): the mean predictions stay the same, but the uncertainty falls
+around the picked frameworks, so a batch does not crowd one corner of the
+descriptor space.  With too few loadings to fit, the first batch spreads out
+over the descriptors instead.
+
+The loadings are stored in the screening manifest as gcmc stage records, so
+screening.py reuses them, and each round's report is kept under its
+'active_learning' entry: how many frameworks have been simulated, the best
+loading found, and the overlap of the predicted top-k frameworks with those of
+the round before, which approaches 1 as the ranking converges.
+
+    python active_learning.py --OutputFolder ../interface/screening --Sorbate CO2 --Budget 200 --Batch 20
+"""
+
+import argparse
+import concurrent.futures
+import math
+import os
+import pathlib
+import time
+import warnings
+
+import numpy as np
+from scipy.linalg import cho_solve, cholesky, solve_triangular
+from scipy.stats import norm
+
+import screening
+
+ACQUISITIONS = ('ei', 'uncertainty')
+# The length scales (per sqrt of the number of descriptors) and noise variances of the fitted surrogate
+LENGTH_SCALES = (0.25, 0.5, 1.0, 2.0, 4.0)
+NOISES = (1e-3, 1e-2, 1e-1)
+
+
+def descriptors(frameworks):
+    '''
+    Builds the descriptors of frameworks from their screening stage records: cell parameters, volume per atom,
+    density and composition from the structure stage, pore geometry from the pores stage and the Henry coefficient
+    and heat of adsorption from the henry stage. Missing entries are NaN.
+
+    :param frameworks: (list) the screening manifest entries of the frameworks
+    :return features: (ndarray) the descriptors of each framework, one row each
+    '''
+    results = [{stage: record.get('result', {}) for stage, record in framework['stages'].items()}
+               for framework in frameworks]
+    elements = sorted({element for result in results for element in result.get('structure', {}).get('composition', {})})
+    rows = []
+    for result in results:
+        structure, geometry, henry = (result.get(stage, {}) for stage in ('structure', 'pores', 'henry'))
+        cell = structure.get('cell', [np.nan] * 6)
+        composition = structure.get('composition', {})
+        rows.append([*sorted(cell[:3]), *cell[3:], structure.get('volume', np.nan) / structure.get('atoms', np.nan),
+                     structure.get('density', np.nan), *(composition.get(element, 0.0) for element in elements),
+                     geometry.get('accessible_fraction', np.nan), geometry.get('largest_included_sphere', np.nan),
+                     geometry.get('dimensions', np.nan), np.log1p(geometry.get('pockets', np.nan)),
+                     np.log10(henry.get('henry', np.nan)), henry.get('heat', np.nan)])
+    return np.array(rows, dtype=float).reshape(len(frameworks), -1)
+
+
+def standardise(features):
+    '''
+    Scales each descriptor to zero mean and unit variance, replacing missing values by the mean and dropping
+    descriptors that are the same for every framework.
+
+    :param features: (ndarray) the descriptors, one row per framework
+    :return standardised: (ndarray) the scaled descriptors
+    '''
+    with warnings.catch_warnings():
+        # Descriptors missing for every framework, e.g. the henry stage ones when it was not run, are dropped
+        warnings.simplefilter('ignore', RuntimeWarning)
+        mean, std = np.nanmean(features, axis=0), np.nanstd(features, axis=0)
+    varying = std > 0
+    standardised = (features[:, varying] - mean[varying]) / std[varying]
+    return np.nan_to_num(standardised)
+
+
+class Surrogate:
+    """A Gaussian process with a squared exponential kernel over standardised
+    descriptors, whose length scale and noise maximise the likelihood of the
+    loadings it is fitted to."""
+
+    def __init__(self, length_scales=LENGTH_SCALES, noises=NOISES):
+        self.length_scales = length_scales
+        self.noises = noises
+
+    def _kernel(self, a, b):
+        squared = np.sum(a * a, axis=1)[:, np.newaxis] + np.sum(b * b, axis=1) - 2 * a @ b.T
+        return np.exp(-np.maximum(squared, 0) / (2 * self.length_scale ** 2))
+
+    def fit(self, features, values):
+        self.features = features
+        self.offset, self.scale = float(np.mean(values)), float(np.std(values)) or 1.0
+        targets = (values - self.offset) / self.scale
+        best = -np.inf
+        for length_scale, noise in [(length, noise) for length in self.length_scales for noise in self.noises]:
+            self.length_scale = length_scale * math.sqrt(max(features.shape[1], 1))
+            factor = cholesky(self._kernel(features, features) + noise * np.eye(len(features)), lower=True)
+            weights = cho_solve((factor, True), targets)
+            likelihood = -0.5 * targets @ weights - np.sum(np.log(np.diag(factor)))
+            if likelihood > best:
+                best = likelihood
+                fitted = (self.length_scale, noise, factor, weights)
+        self.length_scale, self.noise, self.factor, self.weights = fitted
+        return self
+
+    def _projected(self, features):
+        # The kernel between the fitted descriptors and features, through the inverse Cholesky factor
+        return solve_triangular(self.factor, self._kernel(self.features, features), lower=True)
+
+    def predict(self, features):
+        """Returns the mean and standard deviation of the loading of each row of features."""
+        projected = self._projected(features)
+        mean = self._kernel(features, self.features) @ self.weights
+        variance = np.maximum(1.0 - np.sum(projected * projected, axis=0), 0.0)
+        return self.offset + self.scale * mean, self.scale * np.sqrt(variance)
+
+
+def expected_improvement(mean, std, best):
+    '''
+    Computes the expected improvement of each prediction over the best loading found.
+
+    :param mean: (ndarray) the predicted loadings
+    :param std: (ndarray) their standard deviations
+    :param best: (float) the best loading found
+    :return improvement: (ndarray) the expected improvement of each prediction
+    '''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = (mean - best) / std
+        improvement = (mean - best) * norm.cdf(z) + std * norm.pdf(z)
+    return np.where(std > 0, improvement, np.maximum(mean - best, 0.0))
+
+
+def spread_batch(features, batch):
+    '''
+    Picks frameworks spread over the descriptors, each the furthest from those picked before, starting from the one
+    furthest from the mean.
+
+    :param features: (ndarray) the standardised descriptors of the candidate frameworks
+    :param batch: (int) the number of frameworks to pick
+    :return picked: (list) the indices of the picked frameworks
+    '''
+    distance = np.sum(features * features, axis=1)
+    picked = []
+    for _ in range(min(batch, len(features))):
+        picked.append(int(np.argmax(distance)))
+        distance = np.minimum(distance, np.sum((features - features[picked[-1]]) ** 2, axis=1))
+        distance[picked] = -np.inf
+    return picked
+
+
+def select_batch(surrogate, features, batch, acquisition='ei', best=None):
+    '''
+    Picks a batch of frameworks to simulate, each with the largest acquisition value given the kriging believer
+    updates of the ones picked before it.
+
+    :param surrogate: (Surrogate) the fitted surrogate
+    :param features: (ndarray) the standardised descriptors of the candidate frameworks
+    :param batch: (int) the number of frameworks to pick
+    :param acquisition: (str) 'ei' for expected improvement over best, 'uncertainty' for the standard deviation
+    :param best: (float) the best loading found
+    :return picked: (list) the indices of the picked frameworks
+    :return scores: (list) the acquisition value of each when it was picked
+    '''
+    mean, std = surrogate.predict(features)
+    variance = std ** 2
+    projected = surrogate._projected(features)
+    noise = surrogate.noise * surrogate.scale ** 2
+    picked, scores, columns = [], [], []
+    for _ in range(min(batch, len(features))):
+        std = np.sqrt(np.maximum(variance, 0.0))
+        score = expected_improvement(mean, std, best) if acquisition == 'ei' else std.copy()
+        score[picked] = -np.inf
+        pick = int(np.argmax(score))
+        picked.append(pick)
+        scores.append(float(score[pick]))
+        # The posterior covariance with the picked framework, less the parts explained by those picked before it
+        column = surrogate.scale ** 2 * (surrogate._kernel(features, features[[pick]])[:, 0] -
+                                         projected.T @ projected[:, pick])
+        for previous in columns:
+            column -= previous * previous[pick]
+        column /= math.sqrt(max(variance[pick], 0.0) + noise)
+        variance -= column ** 2
+        columns.append(column)
+    return picked, scores
+
+
+def top_k(names, scores, k):
+    """Returns the set of the k names with the largest scores, leaving out those scored NaN."""
+    order = [index for index in np.argsort(scores)[::-1] if not np.isnan(scores[index])]
+    return {names[index] for index in order[:k]}
+
+
+def schedule(output_directory, settings, paths, budget, batch=10, acquisition='ei', k=10, processes=None):
+    '''
+    Simulates batches of the frameworks passing the pores stage of a screening in the gcmc stage until budget
+    frameworks have been simulated, picking each batch with the surrogate fitted to the loadings so far.
+    The loadings and a report of each round are added to the screening manifest.
+
+    :param output_directory: (pathlib.Path) the screening output folder
+    :param settings: (dict) the gcmc stage settings
+    :param paths: (dict) the framework_cache directory and the DL_MONTE executable
+    :param budget: (int) the number of frameworks to have simulated, counting those simulated before
+    :param batch: (int) the number of frameworks simulated per round
+    :param acquisition: (str) 'ei' or 'uncertainty', see select_batch()
+    :param k: (int) the size of the predicted top ranking whose convergence is reported
+    :param processes: (int) the number of worker processes, defaulting to the number of CPUs
+    :return ranking: (list) the names of the predicted top k frameworks, best first
+    '''
+    paths = dict(paths, output=str(output_directory))
+    manifest = screening.read_manifest(output_directory)
+    frameworks = manifest['frameworks']
+    # Those passing the pores stage, and the henry stage too when it was run
+    names = sorted(name for name, framework in frameworks.items()
+                   if framework['stages'].get('pores', {}).get('passed') and
+                   framework['stages'].get('henry', {}).get('passed', True))
+    if not names:
+        raise ValueError(f'No framework in {output_directory} has passed the pores stage of screening.py')
+    features = standardise(descriptors([frameworks[name] for name in names]))
+    rounds = manifest.setdefault('active_learning', [])
+    previous = set(rounds[-1]['top_k']) if rounds else set()
+    processes = processes or os.cpu_count() or 1
+
+    def measured():
+        # The frameworks with a loading measured with these settings
+        return np.array([frameworks[name]['stages'].get('gcmc', {}).get('settings') == settings and
+                         'result' in frameworks[name]['stages']['gcmc'] for name in names], dtype=bool)
+
+    while True:
+        start = time.perf_counter()
+        done = measured()
+        loadings = np.array([frameworks[name]['stages']['gcmc']['result']['loading'] if done[index] else np.nan
+                             for index, name in enumerate(names)])
+        candidates = np.flatnonzero(~done & np.array([
+            'error' not in frameworks[name]['stages'].get('gcmc', {}) or
+            frameworks[name]['stages']['gcmc']['settings'] != settings for name in names]))
+        scores = np.where(done, loadings, np.nan)
+        report = {'simulated': int(done.sum()), 'best': float(np.nanmax(loadings)) if done.any() else None}
+        if done.sum() >= 2:
+            surrogate = Surrogate().fit(features[done], loadings[done])
+            mean, _ = surrogate.predict(features[~done])
+            scores[~done] = mean
+            report['length_scale'] = surrogate.length_scale
+        ranking = top_k(names, scores, k)
+        report.update(top_k=sorted(ranking), overlap=len(ranking & previous) / max(len(ranking), 1))
+        previous = ranking
+
+        size = min(batch, budget - int(done.sum()), len(candidates))
+        if size > 0:
+            if done.sum() >= 2:
+                picked, acquired = select_batch(surrogate, features[candidates], size, acquisition,
+                                                best=report['best'])
+                report['acquisition'] = acquired
+            else:
+                picked = spread_batch(features[candidates], size)
+            queued = [names[index] for index in candidates[picked]]
+            with concurrent.futures.ProcessPoolExecutor(min(processes, len(queued))) as pool:
+                futures = {name: pool.submit(screening.run_stage, 'gcmc', name, frameworks[name]['cif'], settings,
+                                             paths) for name in queued}
+                for name, future in futures.items():
+                    frameworks[name]['stages']['gcmc'] = future.result()
+            report['queued'] = queued
+        report['seconds'] = time.perf_counter() - start
+        rounds.append(report)
+        screening.write_manifest(output_directory, manifest)
+        best = np.nan if report['best'] is None else report['best']
+        print('round {0}: {1} simulated, best loading {2:.4g}, top-{3} overlap {4:.2f}, {5} queued'.format(
+            len(rounds), report['simulated'], best, k, report['overlap'], len(report.get('queued', []))))
+        if size <= 0:
+            break
+
+    ranked = sorted(ranking, key=lambda name: scores[names.index(name)], reverse=True)
+    for rank, name in enumerate(ranked, 1):
+        print(f'  {rank}. {name}: loading {scores[names.index(name)]:.4g}' +
+              ('' if measured()[names.index(name)] else ' (predicted)'))
+    return ranked
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-o', '--OutputFolder',
+                        type=str,
+                        action='store',
+                        required=True,
+                        metavar='OUTPUT_FOLDER',
+                        help='Output folder of a screening.py run through the pores stage at least.')
+
+    parser.add_argument('-s', '--Sorbate',
+                        type=str,
+                        action='store',
+                        required=False,
+                        metavar='SORBATE',
+                        default='CO2',
+                        help='Gas name of the sorbate in sorbates.lookup.')
+
+    parser.add_argument('-t', '--Temperature',
+                        type=float,
+                        action='store',
+                        required=False,
+                        metavar='TEMPERATURE',
+                        default=298.0,
+                        help='Specified temperature (in K).')
+
+    parser.add_argument('-p', '--Pressure',
+                        type=float,
+                        action='store',
+                        required=False,
+                        metavar='PRESSURE',
+                        default=1e4,
+                        help='Target pressure the frameworks are ranked at, in Pa.')
+
+    parser.add_argument('-b', '--Budget',
+                        type=int,
+                        action='store',
+                        required=True,
+                        metavar='BUDGET',
+                        help='Number of frameworks to have simulated, counting those simulated before.')
+
+    parser.add_argument('--Batch',
+                        type=int,
+                        action='store',
+                        required=False,
+                        default=10,
+                        help='Number of frameworks simulated per round.')
+
+    parser.add_argument('--Acquisition',
+                        type=str,
+                        action='store',
+                        required=False,
+                        choices=ACQUISITIONS,
+                        default='ei',
+                        help='Pick the frameworks with the largest expected improvement (ei) or uncertainty.')
+
+    parser.add_argument('--TopK',
+                        type=int,
+                        action='store',
+                        required=False,
+                        default=10,
+                        help='Size of the predicted top ranking whose convergence is reported.')
+
+    parser.add_argument('-n', '--Processes',
+                        type=int,
+                        action='store',
+                        required=False,
+                        metavar='PROCESSES',
+                        default=None,
+                        help='Number of worker processes. Defaults to the number of CPUs.')
+
+    parser.add_argument('--FrameworkCharges',
+                        action='store_true',
+                        help='Use the framework charges from the CIF file (_atom_site_charge) instead of neutral '
+                             'atoms.')
+
+    parser.add_argument('--ChargeTolerance',
+                        type=float,
+                        action='store',
+                        required=False,
+                        metavar='CHARGE_TOLERANCE',
+                        default=0.0,
+                        help='Largest charge difference (in e) between framework atoms merged into one atom type.')
+
+    parser.add_argument('--GCMCSteps',
+                        type=int,
+                        action='store',
+                        required=False,
+                        default=int(1e5),
+                        help='Steps of each GCMC run.')
+
+    parser.add_argument('--GCMCTime',
+                        type=float,
+                        action='store',
+                        required=False,
+                        default=300.0,
+                        help='Longest time (in s) of each GCMC run.')
+
+    parser.add_argument('--Executable',
+                        type=str,
+                        action='store',
+                        required=False,
+                        default='/usr/local/bin/DLMONTE-SRL.X',
+                        help='DL_MONTE executable.')
+
+    parser.add_argument('--FrameworkCache',
+                        type=str,
+                        action='store',
+                        required=False,
+                        metavar='FRAMEWORK_CACHE',
+                        default=None,
+                        help='Directory caching frameworks read from CIF files. Defaults to '
+                             'OUTPUT_FOLDER/.framework_cache.')
+    args = parser.parse_args()
+
+    gcmc_settings = screening.default_settings(args.Sorbate, args.Temperature, args.Pressure,
+                                               gcmc_steps=args.GCMCSteps, gcmc_time=args.GCMCTime,
+                                               keep_charges=args.FrameworkCharges,
+                                               charge_tolerance=args.ChargeTolerance)['gcmc']
+    output = pathlib.Path(args.OutputFolder)
+    cache_paths = {'framework_cache': args.FrameworkCache or str(output / '.framework_cache'),
+                   'executable': args.Executable}
+    schedule(output, gcmc_settings, cache_paths, args.Budget, batch=args.Batch, acquisition=args.Acquisition,
+             k=args.TopK, processes=args.Processes)
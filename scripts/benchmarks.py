@@ -0,0 +1,1498 @@
+"""Timing benchmarks for the framework preparation scripts.
+
+Each benchmark prints a small table to stdout.  Run them from the scripts
+directory (or /run inside the container), e.g.:
+
+    python benchmarks.py cif-readers --cif ../interface/Cu_BTC.cif --sizes 1,100,1000
+
+"""
+
+import argparse
+import concurrent.futures
+import contextlib
+import copy
+import io
+import pathlib
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import tracemalloc
+import warnings
+from itertools import combinations_with_replacement
+
+import numpy as np
+import dlmontepython.htk.sources.dlfield as dlfield
+from dlmontepython.htk.sources.dlconfig import CONFIG
+from ase.neighborlist import neighbor_list
+from scipy.linalg import cho_solve, cholesky
+from scipy.spatial import cKDTree
+from scipy.special import erfc
+from ase.spacegroup import crystal
+
+import active_learning
+import cif_hack
+import dlmolecule
+import forcefield
+import framework_cache
+import henry
+import input_cache
+import pores
+import preflight
+import shared_framework
+import sorbates
+import symmetry
+
+DEFAULT_CIF = pathlib.Path(__file__).resolve().parent.parent / 'interface' / 'Cu_BTC.cif'
+
+
+def best_time(func, repeat=3):
+    '''
+    Calls func repeat times and returns the fastest wall-clock time, in seconds.
+
+    :param func: (callable) a function taking no arguments
+    :param repeat: (int) the number of timed calls
+    :return best: (float) the shortest time taken by a single call
+    '''
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def same_tags(tags_1, tags_2):
+    '''
+    Compares two dictionaries of CIF tags, treating NumPy array columns as equal to lists holding the same numbers.
+
+    :param tags_1: (dict) tags of a cif_hack.CIFBlock
+    :param tags_2: (dict) tags of a cif_hack.CIFBlock
+    :return: (bool) True if both hold the same tags and values
+    '''
+    if list(tags_1) != list(tags_2):
+        return False
+    for key, value_1 in tags_1.items():
+        value_2 = tags_2[key]
+        if isinstance(value_1, np.ndarray) or isinstance(value_2, np.ndarray):
+            if not np.array_equal(np.asarray(value_1), np.asarray(value_2)):
+                return False
+        elif value_1 != value_2:
+            return False
+    return True
+
+
+def peak_memory(func):
+    '''
+    Calls func once and returns the peak memory allocated by Python during the call, in MB.
+    Memory-mapped file pages are not counted.
+
+    :param func: (callable) a function taking no arguments
+    :return peak: (float) the peak traced allocation, in MB
+    '''
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1e6
+
+
+def synthetic_cif(template_text, n_copies):
+    '''
+    Makes a large synthetic CIF by repeating the rows of the last loop in a template CIF n_copies times.
+    For a typical framework CIF this is the _atom_site loop, so the result looks like a very big asymmetric unit.
+
+    :param template_text: (str) the text of a CIF file with a single data block
+    :param n_copies: (int) how many times to repeat each row of the final loop
+    :return output: (str) the text of the synthetic CIF
+    '''
+    lines = template_text.rstrip('\n').split('\n')
+    last_loop = max(i for i, line in enumerate(lines) if line.strip().lower() == 'loop_')
+    first_row = last_loop + 1
+    while lines[first_row].strip().startswith('_'):
+        first_row += 1
+    rows = lines[first_row:]
+    return '\n'.join(lines[:first_row] + rows * n_copies) + '\n'
+
+
+def bloated_cif(template_text, n_rows):
+    '''
+    Makes a database-style CIF by appending a bond loop of n_rows rows to a template CIF.
+    None of the appended data is needed to build the structure.
+
+    :param template_text: (str) the text of a CIF file with a single data block
+    :param n_rows: (int) the number of rows in the appended _geom_bond loop
+    :return output: (str) the text of the bloated CIF
+    '''
+    rows = ['Cu{0}  O{1}  {2:.4f}(3)  .  ?'.format(i, i + 1, 1.9 + (i % 100) * 0.001) for i in range(n_rows)]
+    bond_loop = ['loop_', '_geom_bond_atom_site_label_1', '_geom_bond_atom_site_label_2', '_geom_bond_distance',
+                 '_geom_bond_site_symmetry_2', '_geom_bond_publ_flag']
+    return template_text.rstrip('\n') + '\n\n' + '\n'.join(bond_loop + rows) + '\n'
+
+
+def benchmark_cif_readers(cif_file=DEFAULT_CIF, sizes=(1, 100, 1000), readers=('ase', 'fast'), repeat=3):
+    '''
+    Times cif_hack.parse_cif for each reader on the template CIF and on synthetic CIFs built from it.
+    The blocks returned by each reader are checked against those of the first reader before timing.
+
+    :param cif_file: (pathlib.Path) the template CIF file
+    :param sizes: (tuple) numbers of copies of the final loop rows to benchmark, 1 being the original file
+    :param readers: (tuple) cif_hack reader names, the first being the reference
+    :param repeat: (int) the number of timed calls per reader and size
+    '''
+    template = pathlib.Path(cif_file).read_text(encoding='latin-1')
+    print('{0:>8} {1:>10} {2:>8} {3:>12} {4:>8}'.format('copies', 'bytes', 'reader', 'seconds', 'speedup'))
+    for size in sizes:
+        text = template if size == 1 else synthetic_cif(template, size)
+
+        def parse(reader):
+            return [dict(block) for block in cif_hack.parse_cif(io.StringIO(text), reader)]
+
+        reference = parse(readers[0])
+        reference_time = None
+        for reader in readers:
+            blocks = parse(reader)
+            assert len(blocks) == len(reference) and all(map(same_tags, blocks, reference)), \
+                f'reader {reader} disagrees with {readers[0]}'
+            seconds = best_time(lambda: parse(reader), repeat)
+            if reference_time is None:
+                reference_time = seconds
+            print('{0:>8} {1:>10} {2:>8} {3:>12.5f} {4:>7.1f}x'.format(
+                size, len(text), reader, seconds, reference_time / seconds))
+
+
+def benchmark_cif_structure(cif_file=DEFAULT_CIF, sizes=(0, 10000, 100000), readers=('ase', 'fast', 'lazy'),
+                            repeat=3):
+    '''
+    Times reading only what simulation preparation needs (cell, symmetry operations, symbols and site coordinates)
+    from the template CIF with a bond loop of each size appended.
+
+    :param cif_file: (pathlib.Path) the template CIF file
+    :param sizes: (tuple) numbers of rows in the appended bond loop
+    :param readers: (tuple) cif_hack reader names, the first being the reference
+    :param repeat: (int) the number of timed calls per reader and size
+    '''
+    template = pathlib.Path(cif_file).read_text(encoding='latin-1')
+    print('{0:>8} {1:>10} {2:>8} {3:>12} {4:>8}'.format('bonds', 'bytes', 'reader', 'seconds', 'speedup'))
+    for size in sizes:
+        text = bloated_cif(template, size) if size else template
+
+        def prepare(reader):
+            block = next(cif_hack.parse_cif(io.StringIO(text), reader))
+            return (block.get_cell().cellpar(), block._get_sitesym(), block.get_symbols(),
+                    block._get_site_coordinates()[1])
+
+        reference = prepare(readers[0])
+        reference_time = None
+        for reader in readers:
+            cellpar, sitesym, symbols, coordinates = prepare(reader)
+            assert np.allclose(cellpar, reference[0]) and sitesym == reference[1] and symbols == reference[2] \
+                and np.array_equal(coordinates, reference[3]), f'reader {reader} disagrees with {readers[0]}'
+            seconds = best_time(lambda: prepare(reader), repeat)
+            if reference_time is None:
+                reference_time = seconds
+            print('{0:>8} {1:>10} {2:>8} {3:>12.5f} {4:>7.1f}x'.format(
+                size, len(text), reader, seconds, reference_time / seconds))
+
+
+def concatenated_cif(template_text, n_blocks):
+    '''
+    Makes a database dump style CIF by concatenating n_blocks renamed copies of a single-block template CIF.
+
+    :param template_text: (str) the text of a CIF file with a single data block
+    :param n_blocks: (int) the number of data blocks in the output
+    :return output: (str) the text of the concatenated CIF
+    '''
+    lines = template_text.rstrip('\n').split('\n')
+    header = next(i for i, line in enumerate(lines) if line.strip().lower().startswith('data_'))
+    body = '\n'.join(lines[header + 1:])
+    return ''.join('data_block_{0}\n{1}\n\n'.format(i, body) for i in range(n_blocks))
+
+
+def read_cif_all_images(cif_file, index, reader='ase'):
+    # The read_cif strategy before CIFCollection: parse every block and build every image, then index the list
+    images = [block.get_atoms() for block in cif_hack.parse_cif(str(cif_file), reader) if block.has_structure()]
+    return images[index]
+
+
+def benchmark_cif_collection(cif_file=DEFAULT_CIF, sizes=(10, 100), repeat=1):
+    '''
+    Times and measures the peak memory of reading one structure out of concatenated multi-block CIFs, comparing
+    building every image first against cif_hack.read_cif and a CIFCollection name lookup.
+
+    :param cif_file: (pathlib.Path) the template CIF file
+    :param sizes: (tuple) numbers of data blocks in the concatenated file
+    :param repeat: (int) the number of timed calls per method and size
+    '''
+    template = pathlib.Path(cif_file).read_text(encoding='latin-1')
+    print('{0:>8} {1:>12} {2:>22} {3:>10} {4:>10}'.format('blocks', 'bytes', 'method', 'seconds', 'peak MB'))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for size in sizes:
+            path = pathlib.Path(tmpdir) / f'collection_{size}.cif'
+            path.write_text(concatenated_cif(template, size), encoding='latin-1')
+
+            def by_name():
+                with cif_hack.CIFCollection(str(path)) as collection:
+                    return collection[f'block_{size - 1}'].get_atoms()
+
+            methods = {
+                'all images, [-1]': lambda: read_cif_all_images(path, -1),
+                'read_cif(index=-1)': lambda: next(cif_hack.read_cif(str(path), -1, reader='lazy')),
+                'collection[name]': by_name,
+            }
+            reference = methods['all images, [-1]']()
+            for method, func in methods.items():
+                atoms = func()
+                assert np.allclose(atoms.positions, reference.positions), f'{method} returned a different structure'
+                seconds = best_time(func, repeat)
+                print('{0:>8} {1:>12} {2:>22} {3:>10.4f} {4:>10.2f}'.format(
+                    size, path.stat().st_size, method, seconds, peak_memory(func)))
+
+
+def benchmark_cif_symmetry(cif_file=DEFAULT_CIF, sizes=(1, 2, 3), repeat=3):
+    '''
+    Times expanding the asymmetric unit of a CIF into its unit cell with ase.spacegroup.crystal and with
+    symmetry.crystal, on supercells of the asymmetric unit so the output grows to large unit cells.
+
+    :param cif_file: (pathlib.Path) the template CIF file
+    :param sizes: (tuple) numbers of repeats of the asymmetric unit along each cell vector
+    :param repeat: (int) the number of timed calls per method and size
+    '''
+    block = next(cif_hack.parse_cif(str(cif_file), 'fast'))
+    spacegroup = block.get_spacegroup(True)
+    occupancies = block._get_fractional_occupancies()
+    print('{0:>6} {1:>8} {2:>10} {3:>10} {4:>12} {5:>8}'.format(
+        'size', 'sites', 'atoms', 'method', 'seconds', 'speedup'))
+    for size in sizes:
+        basis = block.get_unsymmetrized_structure().repeat(size)
+        if occupancies is not None:
+            basis_occupancies = list(occupancies) * size ** 3
+        else:
+            basis_occupancies = None
+        operations = symmetry.SymmetryOperations.from_spacegroup(spacegroup)
+        methods = {
+            'ase': lambda: crystal(basis, spacegroup=spacegroup, setting=spacegroup.setting,
+                                   occupancies=basis_occupancies),
+            'compiled': lambda: symmetry.crystal(basis, spacegroup=spacegroup, setting=spacegroup.setting,
+                                                 occupancies=basis_occupancies, operations=operations),
+        }
+        reference = methods['ase']()
+        reference_time = None
+        for method, func in methods.items():
+            atoms = func()
+            assert atoms.get_chemical_symbols() == reference.get_chemical_symbols() \
+                and np.array_equal(atoms.positions, reference.positions) \
+                and np.array_equal(atoms.arrays['spacegroup_kinds'], reference.arrays['spacegroup_kinds']), \
+                f'{method} expansion disagrees with ase'
+            seconds = best_time(func, repeat)
+            if reference_time is None:
+                reference_time = seconds
+            print('{0:>6} {1:>8} {2:>10} {3:>10} {4:>12.4f} {5:>7.1f}x'.format(
+                size, len(basis), len(atoms), method, seconds, reference_time / seconds))
+
+
+def benchmark_spacegroup_cache(cif_file=DEFAULT_CIF, sizes=(10, 100), repeat=1):
+    '''
+    Times building every structure in concatenated multi-block CIFs sharing one space group, with the
+    cif_hack.compiled_spacegroup cache cleared before every block and with it kept between blocks.
+
+    :param cif_file: (pathlib.Path) the template CIF file
+    :param sizes: (tuple) numbers of data blocks in the concatenated file
+    :param repeat: (int) the number of timed calls per method and size
+    '''
+    template = pathlib.Path(cif_file).read_text(encoding='latin-1')
+    print('{0:>8} {1:>10} {2:>10} {3:>8} {4:>8} {5:>8}'.format(
+        'blocks', 'cache', 'seconds', 'speedup', 'hits', 'misses'))
+    for size in sizes:
+        blocks = list(cif_hack.parse_cif(io.StringIO(concatenated_cif(template, size)), 'fast'))
+
+        def ingest(cached):
+            cif_hack.compiled_spacegroup.cache_clear()
+            for block in blocks:
+                if not cached:
+                    cif_hack.compiled_spacegroup.cache_clear()
+                block.get_atoms()
+
+        reference_time = None
+        for cached in (False, True):
+            seconds = best_time(lambda: ingest(cached), repeat)
+            if reference_time is None:
+                reference_time = seconds
+            # Clearing the cache also resets its counters, so they are only shown when it is kept
+            info = cif_hack.compiled_spacegroup.cache_info() if cached else None
+            print('{0:>8} {1:>10} {2:>10.4f} {3:>7.1f}x {4:>8} {5:>8}'.format(
+                size, 'kept' if cached else 'cleared', seconds, reference_time / seconds,
+                info.hits if info else '-', info.misses if info else '-'))
+
+
+def benchmark_framework_cache(cif_file=DEFAULT_CIF, sizes=(1, 3), repeat=3):
+    '''
+    Times reading the framework in the template CIF and in CIFs with enlarged asymmetric units built from it,
+    from the CIF file and from a framework_cache.FrameworkCache entry.
+
+    :param cif_file: (pathlib.Path) the template CIF file
+    :param sizes: (tuple) numbers of copies of the final loop rows, 1 being the original file
+    :param repeat: (int) the number of timed calls per method and size
+    '''
+    template = pathlib.Path(cif_file).read_text(encoding='latin-1')
+    print('{0:>8} {1:>8} {2:>12} {3:>12} {4:>8}'.format('copies', 'atoms', 'method', 'seconds', 'speedup'))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for size in sizes:
+            path = pathlib.Path(tmpdir) / f'framework_{size}.cif'
+            path.write_text(template if size == 1 else synthetic_cif(template, size), encoding='latin-1')
+            cache = framework_cache.FrameworkCache(pathlib.Path(tmpdir) / 'cache')
+            methods = {
+                'cif file': lambda: next(cif_hack.read_cif(str(path), 0)),
+                'cache hit': lambda: cache.get_atoms(path),
+            }
+            reference = methods['cif file']()
+            reference_time = None
+            for method, func in methods.items():
+                atoms = func()
+                assert np.array_equal(atoms.positions, reference.positions) \
+                    and atoms.get_chemical_symbols() == reference.get_chemical_symbols(), \
+                    f'{method} returned a different structure'
+                seconds = best_time(func, repeat)
+                if reference_time is None:
+                    reference_time = seconds
+                print('{0:>8} {1:>8} {2:>12} {3:>12.5f} {4:>7.1f}x'.format(
+                    size, len(atoms), method, seconds, reference_time / seconds))
+
+
+def benchmark_cif_archive(cif_file=DEFAULT_CIF, sizes=(100, 1000), repeat=1):
+    '''
+    Times reading every structure out of a .tar.gz archive of copies of the template CIF, extracting the archive to
+    disk first and streaming the members with cif_hack.iter_cif_archive.
+
+    :param cif_file: (pathlib.Path) the template CIF file
+    :param sizes: (tuple) numbers of CIF files in the archive
+    :param repeat: (int) the number of timed calls per method and size
+    '''
+    template = pathlib.Path(cif_file).read_bytes()
+    print('{0:>8} {1:>12} {2:>12} {3:>10} {4:>8}'.format('files', 'bytes', 'method', 'seconds', 'speedup'))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for size in sizes:
+            archive = pathlib.Path(tmpdir) / f'frameworks_{size}.tar.gz'
+            with tarfile.open(archive, 'w:gz') as tf:
+                for i in range(size):
+                    info = tarfile.TarInfo(f'frameworks/framework_{i}.cif')
+                    info.size = len(template)
+                    tf.addfile(info, io.BytesIO(template))
+
+            def extracted():
+                with tempfile.TemporaryDirectory(dir=tmpdir) as extract_dir:
+                    with tarfile.open(archive) as tf:
+                        tf.extractall(extract_dir)
+                    return [len(next(cif_hack.read_cif(str(path), 0, reader='fast')))
+                            for path in sorted(pathlib.Path(extract_dir).rglob('*.cif'))]
+
+            def streamed():
+                return [len(next(cif_hack.read_cif(io.BytesIO(cif_hack.decompress_cif(data)), 0, reader='fast')))
+                        for _, data in cif_hack.iter_cif_archive(archive)]
+
+            methods = {'extracted': extracted, 'streamed': streamed}
+            reference = methods['extracted']()
+            reference_time = None
+            for method, func in methods.items():
+                assert func() == reference, f'{method} returned different structures'
+                seconds = best_time(func, repeat)
+                if reference_time is None:
+                    reference_time = seconds
+                print('{0:>8} {1:>12} {2:>12} {3:>10.4f} {4:>7.1f}x'.format(
+                    size, archive.stat().st_size, method, seconds, reference_time / seconds))
+
+
+def reference_write_cif(atoms, loop_keys):
+    # write_cif as it was before CIFLoop.write: the formula header from ase's Formula and the atom site loop
+    # formatted row by row with CIFLoop.tostring
+    fd = io.StringIO()
+    fd.write('data_image0\n')
+    formula_sum = ' '.join(f'{symbol}{count}' for symbol, count in atoms.symbols.formula.count().items())
+    fd.write(f'_chemical_formula_structural       {atoms.symbols}\n'
+             f'_chemical_formula_sum              "{formula_sum}"\n')
+    fd.write(cif_hack.format_cell(atoms.cell))
+    fd.write('\n')
+    fd.write(cif_hack.format_generic_spacegroup_info())
+    fd.write('\n')
+    loopdata, coord_headers = cif_hack.atoms_to_loop_data(atoms, True, None, loop_keys)
+    loop = cif_hack.CIFLoop()
+    for header in ['_atom_site_type_symbol', '_atom_site_label', '_atom_site_symmetry_multiplicity',
+                   *coord_headers, '_atom_site_occupancy', *['_' + key for key in loop_keys]]:
+        loop.add(header, *loopdata[header])
+    fd.write(loop.tostring())
+    return fd.getvalue().encode('latin-1')
+
+
+def benchmark_cif_writer(cif_file=DEFAULT_CIF, sizes=(1, 4, 6), repeat=3):
+    '''
+    Times writing supercells of a framework to CIF with the row by row loop formatting and with cif_hack.write_cif,
+    which formats whole columns at once and writes them in chunks. The outputs must be identical byte for byte.
+
+    :param cif_file: (pathlib.Path) the framework CIF file
+    :param sizes: (tuple) numbers of repeats of the unit cell along each axis
+    :param repeat: (int) the number of timed calls per method and size
+    '''
+    framework = next(cif_hack.read_cif(str(cif_file), 0))
+    print('{0:>8} {1:>12} {2:>10} {3:>10} {4:>8}'.format('atoms', 'bytes', 'method', 'seconds', 'speedup'))
+    for size in sizes:
+        atoms = framework.repeat(size)
+        # A per-atom tag, written as an extra loop column
+        loop_keys = {'atom_site_charge': [[f'{charge:.3f}' for charge in np.arange(len(atoms)) % 7 - 3.0]]}
+
+        def written():
+            fd = io.BytesIO()
+            cif_hack.write_cif(fd, atoms, loop_keys=loop_keys)
+            return fd.getvalue()
+
+        methods = {'row': lambda: reference_write_cif(atoms, {key: value[0] for key, value in loop_keys.items()}),
+                   'column': written}
+        reference = methods['row']()
+        reference_time = None
+        for method, func in methods.items():
+            assert func() == reference, f'{method} wrote a different CIF'
+            seconds = best_time(func, repeat)
+            if reference_time is None:
+                reference_time = seconds
+            print('{0:>8} {1:>12} {2:>10} {3:>10.4f} {4:>7.1f}x'.format(
+                len(atoms), len(reference), method, seconds, reference_time / seconds))
+
+
+def reference_assign_framework_tags(struct, structure_dictionary, element_label_addition='S'):
+    # dlmolecule.assign_all_framework_tags as it was before tagging in a single pass: a full-length mask per element
+    # and charge state, without moiety subdivision
+    tag_list = np.zeros_like(struct)
+    tag_dict = {}
+    tag_counter = 1
+    charges = struct.get_initial_charges()
+    for element, element_dict in structure_dictionary.items():
+        indices = element_dict['idx_mask']
+        name = '{0}_{1}'.format(element_dict['symbol'], element_label_addition)
+        sub_tag_list = np.zeros_like(struct)
+        charge_states = np.unique(struct[indices].get_initial_charges())
+        for count, k in enumerate(charge_states):
+            k_indices = (struct.get_initial_charges() == k) & (struct.numbers == element) & (indices == True)
+            if len(charge_states) > 1:
+                tag_dict[tag_counter] = '{0}_{1}'.format(name, count)
+            else:
+                tag_dict[tag_counter] = '{0}'.format(name)
+            sub_tag_list[k_indices] = tag_counter
+            tag_counter += 1
+        tag_list += sub_tag_list
+    return tag_dict, tag_list
+
+
+def benchmark_framework_tags(cif_file=DEFAULT_CIF, sizes=(1, 4, 12), repeat=1):
+    '''
+    Times assigning DL_MONTE atom type tags to supercells of a framework, one element and charge state at a time and
+    in a single pass with dlmolecule.assign_all_framework_tags. Both must give the same tags and tag names.
+
+    :param cif_file: (pathlib.Path) the framework CIF file, with charges
+    :param sizes: (tuple) numbers of repeats of the unit cell along each axis
+    :param repeat: (int) the number of timed calls per method and size
+    '''
+    framework = next(cif_hack.read_cif(str(cif_file), 0))
+    print('{0:>8} {1:>6} {2:>12} {3:>10} {4:>8}'.format('atoms', 'tags', 'method', 'seconds', 'speedup'))
+    for size in sizes:
+        struct = framework.repeat(size)
+        with contextlib.redirect_stdout(io.StringIO()):
+            structure_dictionary = dlmolecule.make_framework_indices(struct)
+
+        def tag(func):
+            with contextlib.redirect_stdout(io.StringIO()):
+                tag_dict, tag_list = func(struct, structure_dictionary)
+            return tag_dict, tag_list.astype(int).tolist()
+
+        methods = {'per-mask': lambda: tag(reference_assign_framework_tags),
+                   'single-pass': lambda: tag(dlmolecule.assign_all_framework_tags)}
+        reference = methods['per-mask']()
+        reference_time = None
+        for method, func in methods.items():
+            assert func() == reference, f'{method} assigned different tags'
+            seconds = best_time(func, repeat)
+            if reference_time is None:
+                reference_time = seconds
+            print('{0:>8} {1:>6} {2:>12} {3:>10.4f} {4:>7.1f}x'.format(
+                len(struct), len(reference[0]), method, seconds, reference_time / seconds))
+
+
+def reference_config_atoms(molecule):
+    # DLMolecule._config_atoms_stringify as it was before reading whole arrays: one ASE.Atom proxy per atom
+    return ['{0} core\n {1} {2} {3} 0'.format(molecule.tags[i.tag], i.position[0], i.position[1], i.position[2])
+            for i in molecule.molecule]
+
+
+def benchmark_framework_arrays(cif_file=DEFAULT_CIF, sizes=(13, 26, 53, 80), repeat=1):
+    '''
+    Times building a DLMolecule framework from a CIF structure and writing its CONFIG and FIELD atom types, with the
+    framework held as an ASE.Atoms object (written atom by atom, as before, and from whole arrays) and as a compact
+    dlmolecule.FrameworkArrays object, and measures the peak memory of the build and the memory held by the
+    framework. All must write identical CONFIG and FIELD text.
+
+    :param cif_file: (pathlib.Path) the framework CIF file
+    :param sizes: (tuple) cutoffs in A, which set the size of the simulation supercell
+    :param repeat: (int) the number of timed calls per method and size
+    '''
+    framework = next(cif_hack.read_cif(str(cif_file), 0))
+    potentials = {f'{symbol}_S': [50.0, 3.0] for symbol in set(framework.get_chemical_symbols())}
+    print('{0:>8} {1:>10} {2:>8} {3:>10} {4:>8} {5:>10} {6:>10}'.format(
+        'atoms', 'method', 'cutoff', 'seconds', 'speedup', 'peak MB', 'held MB'))
+    for size in sizes:
+        def build(compact, atom_loop=False):
+            with contextlib.redirect_stdout(io.StringIO()):
+                molecule = dlmolecule.from_ase(framework, 'framework', potentials, cutoff=size, keep_charges=True,
+                                               compact=compact)
+                if atom_loop:
+                    molecule._config_atoms_stringify = lambda: reference_config_atoms(molecule)
+                config = str(molecule.make_config_empty_framework())
+                atomtypes = [str(atomtype) for atomtype in molecule.get_field_atomtypes()]
+            return molecule, config, atomtypes
+
+        methods = {'atom-loop': lambda: build(False, atom_loop=True), 'atoms': lambda: build(False),
+                   'compact': lambda: build(True)}
+        reference = list(methods['atom-loop']()[1:])
+        reference_time = None
+        for method, func in methods.items():
+            molecule, *written = func()
+            assert written == reference, f'{method} wrote a different CONFIG or FIELD'
+            if method == 'compact':
+                held = molecule.molecule.atoms.nbytes
+            else:
+                held = sum(array.nbytes for array in molecule.molecule.arrays.values())
+            seconds = best_time(func, repeat)
+            if reference_time is None:
+                reference_time = seconds
+            print('{0:>8} {1:>10} {2:>8} {3:>10.4f} {4:>7.1f}x {5:>10.1f} {6:>10.1f}'.format(
+                len(molecule.molecule), method, size, seconds, reference_time / seconds, peak_memory(func),
+                held / 1e6))
+
+
+def reference_field_atomtype(molecule, tag, atom_name):
+    # DLMolecule._get_field_atomtype as it was before the tag index: a scan of every atom's tag per call
+    tag_mask = molecule.molecule.get_tags() == tag
+    test_atom = np.argmax(tag_mask)
+    return dlmolecule.FIELDSPECIES.AtomType(atom_name, 'core', molecule.molecule.get_masses()[test_atom],
+                                            round(molecule.molecule.get_initial_charges()[test_atom], 5))
+
+
+def benchmark_tag_index(cif_file=DEFAULT_CIF, sizes=(13, 26, 53, 80), repeat=3):
+    '''
+    Times writing the FIELD atom types and VDW interactions of a framework with one atom type per atom of its unit
+    cell (charges made distinct with a little noise), scanning the tags for every atom type lookup and using the
+    DLMolecule tag index. Both must give the same FIELD text.
+
+    :param cif_file: (pathlib.Path) the framework CIF file
+    :param sizes: (tuple) cutoffs in A, which set the size of the simulation supercell
+    :param repeat: (int) the number of timed calls per method and size
+    '''
+    framework = next(cif_hack.read_cif(str(cif_file), 0))
+    charges = framework.get_initial_charges() + np.random.default_rng(0).normal(0, 1e-3, len(framework))
+    framework.set_initial_charges(charges - charges.mean())
+    potentials = {f'{symbol}_S': [50.0, 3.0] for symbol in set(framework.get_chemical_symbols())}
+    sorbate_atoms = crystal(['N', 'C'], [(0, 0, 0), (0.1, 0, 0)], cellpar=[10, 10, 10, 90, 90, 90])
+    sorbate = dlmolecule.DLMolecule('sorbate', sorbate_atoms, {1: 'N_G', 2: 'C_G'}, {1: [30.0, 3.3], 2: [30.0, 3.3]})
+    sorbate.set_tags([1, 2])
+    print('{0:>8} {1:>6} {2:>8} {3:>10} {4:>8}'.format('atoms', 'types', 'method', 'seconds', 'speedup'))
+    for size in sizes:
+        with contextlib.redirect_stdout(io.StringIO()):
+            molecule = dlmolecule.from_ase(framework, 'framework', potentials, cutoff=size, keep_charges=True)
+
+        def field(scan):
+            if scan:
+                molecule._get_field_atomtype = lambda tag, name: reference_field_atomtype(molecule, tag, name)
+            else:
+                # Rebuilt for every call, as it would be for every new FIELD file
+                vars(molecule).pop('_get_field_atomtype', None)
+                molecule.invalidate_tag_index()
+            with contextlib.redirect_stdout(io.StringIO()):
+                atomtypes = [str(atomtype) for atomtype in molecule.get_field_atomtypes()]
+                vdw = sorted(str(vdw) for vdw in dlmolecule.get_vdw_interactions([molecule, sorbate], [molecule]))
+            return atomtypes, vdw
+
+        methods = {'scan': lambda: field(True), 'index': lambda: field(False)}
+        reference = methods['scan']()
+        reference_time = None
+        for method, func in methods.items():
+            assert func() == reference, f'{method} wrote different FIELD entries'
+            seconds = best_time(func, repeat)
+            if reference_time is None:
+                reference_time = seconds
+            print('{0:>8} {1:>6} {2:>8} {3:>10.4f} {4:>7.1f}x'.format(
+                len(molecule.molecule), len(molecule.tags), method, seconds, reference_time / seconds))
+
+
+def reference_vdw_interactions(interacting_molecules, self_excluding_molecules):
+    # dlmolecule.get_vdw_interactions as it was before pair tables: Lorentz-Berthelot mixing one atom pair at a time
+    interactions_by_name = {}
+    exclusion_interactions = {}
+    for molecule in interacting_molecules:
+        for tag, name in molecule.tags.items():
+            interactions_by_name[name] = (molecule._get_field_atomtype(tag, name), molecule.potentials[tag])
+    for molecule in self_excluding_molecules:
+        for tag, name in molecule.tags.items():
+            exclusion_interactions[name] = (molecule._get_field_atomtype(tag, name), molecule.potentials[tag])
+    atompairs = set(combinations_with_replacement(interactions_by_name.keys(), 2))
+    tested_atompairs = list(atompairs.difference(combinations_with_replacement(exclusion_interactions.keys(), 2)))
+    output = []
+    for i in tested_atompairs:
+        sigma = round(0.5 * (interactions_by_name[i[0]][1][1] + interactions_by_name[i[1]][1][1]), 3)
+        epsilon = round(np.sqrt(interactions_by_name[i[0]][1][0] * interactions_by_name[i[1]][1][0]), 3)
+        if epsilon > 0:
+            output.append(dlmolecule.FIELD.VDW(interactions_by_name[i[0]][0], interactions_by_name[i[1]][0],
+                                               dlmolecule.INT.InteractionLJLRC(epsilon, sigma)))
+    return output
+
+
+def benchmark_mixing_rules(cif_file=DEFAULT_CIF, sizes=(10, 100, 1000), repeat=1):
+    '''
+    Times writing the VDW interactions of FIELD files for a framework with one atom type per atom of its unit cell
+    (charges made distinct with a little noise) and each of three sorbates in turn, mixing one atom pair at a time
+    and with cached forcefield pair tables. Both must give the same VDW entries, which are compared sorted as the
+    old pair order was that of a set.
+
+    :param cif_file: (pathlib.Path) the framework CIF file
+    :param sizes: (tuple) numbers of FIELD files written
+    :param repeat: (int) the number of timed calls per method and size
+    '''
+    framework = next(cif_hack.read_cif(str(cif_file), 0))
+    charges = framework.get_initial_charges() + np.random.default_rng(0).normal(0, 1e-3, len(framework))
+    framework.set_initial_charges(charges - charges.mean())
+    with contextlib.redirect_stdout(io.StringIO()):
+        molecule = dlmolecule.from_ase(framework, 'framework', forcefield.UFF, cutoff=6, keep_charges=True)
+    sorbate_atoms = crystal(['N', 'C'], [(0, 0, 0), (0.1, 0, 0)], cellpar=[10, 10, 10, 90, 90, 90])
+    sorbates = []
+    for i, (epsilon, sigma) in enumerate([(36.0, 3.31), (79.0, 3.72), (27.0, 2.8)]):
+        sorbate = dlmolecule.DLMolecule(f'sorbate_{i}', sorbate_atoms, {1: f'N{i}_G', 2: f'C{i}_G'},
+                                        {1: [epsilon, sigma, -0.4], 2: [0.5 * epsilon, sigma, 0.4]})
+        sorbate.set_tags([1, 2])
+        sorbates.append(sorbate)
+
+    def fields(func, n_fields):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return [sorted(str(vdw) for vdw in func([molecule, sorbates[i % len(sorbates)]], [molecule]))
+                    for i in range(n_fields)]
+
+    print('{0:>8} {1:>8} {2:>12} {3:>10} {4:>8}'.format('fields', 'pairs', 'method', 'seconds', 'speedup'))
+    for size in sizes:
+        methods = {'per-pair': lambda: fields(reference_vdw_interactions, size),
+                   'pair-table': lambda: fields(dlmolecule.get_vdw_interactions, size)}
+        reference = methods['per-pair']()
+        reference_time = None
+        for method, func in methods.items():
+            assert func() == reference, f'{method} wrote different VDW entries'
+            seconds = best_time(func, repeat)
+            if reference_time is None:
+                reference_time = seconds
+            print('{0:>8} {1:>8} {2:>12} {3:>10.4f} {4:>7.1f}x'.format(
+                size, sum(map(len, reference)), method, seconds, reference_time / seconds))
+
+
+def reference_neighbour_pairs(atoms, cutoff):
+    # The pairs of preflight.neighbour_pairs from ase.neighborlist, which lists every pair from both of its atoms
+    i, j, distances, shifts = neighbor_list('ijdS', atoms, cutoff)
+    positive = shifts[np.arange(len(shifts)), np.argmax(shifts != 0, axis=1)] > 0
+    keep = (i < j) | ((i == j) & positive)
+    return i[keep], j[keep], distances[keep]
+
+
+def benchmark_preflight(cif_file=DEFAULT_CIF, sizes=(1, 4, 8), cutoff=1.2, repeat=3):
+    '''
+    Times finding the atom pairs closer than cutoff in supercells of a framework's conventional cell and of its
+    (triclinic) primitive cell, with ase.neighborlist and with the cell list of preflight.neighbour_pairs, and the
+    whole preflight.validate_structure check. Both searches must find the same pairs at the same distances.
+
+    :param cif_file: (pathlib.Path) the framework CIF file
+    :param sizes: (tuple) numbers of repeats of the unit cell along each axis
+    :param cutoff: (float) the pair distance cutoff, in A
+    :param repeat: (int) the number of timed calls per method and size
+    '''
+    framework = next(cif_hack.read_cif(str(cif_file), 0))
+    cells = {'conventional': framework, 'primitive': dlmolecule.primitive_cell(framework)}
+
+    def pairs(result):
+        i, j, distances = result
+        return sorted(zip(i.tolist(), j.tolist(), np.round(distances, 9).tolist()))
+
+    print('{0:>12} {1:>8} {2:>8} {3:>10} {4:>10} {5:>8}'.format('cell', 'atoms', 'pairs', 'method', 'seconds',
+                                                                'speedup'))
+    for name, cell_atoms in cells.items():
+        for size in sizes:
+            atoms = cell_atoms.repeat(size)
+            methods = {'ase': lambda: reference_neighbour_pairs(atoms, cutoff),
+                       'cell-list': lambda: preflight.neighbour_pairs(atoms.get_scaled_positions(wrap=False),
+                                                                      atoms.cell, cutoff),
+                       'validate': lambda: preflight.validate_structure(atoms)}
+            reference = pairs(methods['ase']())
+            assert pairs(methods['cell-list']()) == reference, 'cell-list found different pairs'
+            reference_time = None
+            for method, func in methods.items():
+                seconds = best_time(func, repeat)
+                if reference_time is None:
+                    reference_time = seconds
+                print('{0:>12} {1:>8} {2:>8} {3:>10} {4:>10.4f} {5:>7.1f}x'.format(
+                    name, len(atoms), len(reference), method, seconds, reference_time / seconds))
+
+
+def same_config(text_1, text_2, tolerance, parse):
+    '''
+    Compares two CONFIG files atom by atom, allowing the coordinates to differ by tolerance.
+
+    :param text_1: (str) the reference CONFIG file
+    :param text_2: (str) the CONFIG file to check
+    :param tolerance: (float) the largest coordinate difference allowed, in A
+    :param parse: (bool) also re-parse both files with dlmontepython and compare their headers and molecules
+    :return: (bool) True if both describe the same configuration
+    '''
+    if parse:
+        config_1, config_2 = CONFIG.from_dlstr(text_1), CONFIG.from_dlstr(text_2)
+        if (config_1.title, config_1.level, config_1.dlformat, config_1.vcell, config_1.nummol) != \
+                (config_2.title, config_2.level, config_2.dlformat, config_2.vcell, config_2.nummol):
+            return False
+        if [(mol['name'], mol['natom']) for mol in config_1.molecules] != \
+                [(mol['name'], mol['natom']) for mol in config_2.molecules]:
+            return False
+    lines_1, lines_2 = text_1.splitlines(), text_2.splitlines()
+    if len(lines_1) != len(lines_2) or lines_1[:7] != lines_2[:7] or lines_1[7::2] != lines_2[7::2]:
+        return False
+    coordinates_1 = np.array(' '.join(lines_1[8::2]).split(), dtype=float)
+    coordinates_2 = np.array(' '.join(lines_2[8::2]).split(), dtype=float)
+    return bool(np.all(np.abs(coordinates_1 - coordinates_2) <= tolerance))
+
+
+def benchmark_config_stream(cif_file=DEFAULT_CIF, sizes=(13, 26, 53), repeat=1, parse_limit=20000):
+    '''
+    Times writing the CONFIG and FIELD files of a framework supercell as one string each, as create_config_field did,
+    and streamed from arrays by DLMolecule.write_config_empty_framework and dlmolecule.write_field, at full and at
+    the default fixed coordinate precision, and measures the peak memory of each write and the CONFIG file size.
+    The streamed FIELD must be identical once re-parsed, as must the CONFIG molecules (re-parsed with dlmontepython
+    up to parse_limit atoms, as its parser takes quadratic time) and atom names, with the coordinates equal to the
+    written precision.
+
+    :param cif_file: (pathlib.Path) the framework CIF file
+    :param sizes: (tuple) cutoffs in A, which set the size of the simulation supercell
+    :param repeat: (int) the number of timed calls per method and size
+    :param parse_limit: (int) the largest number of atoms re-parsed with dlmontepython
+    '''
+    framework = next(cif_hack.read_cif(str(cif_file), 0))
+    sorbate_atoms = crystal(['N', 'C'], [(0, 0, 0), (0.1, 0, 0)], cellpar=[10, 10, 10, 90, 90, 90])
+    sorbate = dlmolecule.DLMolecule('sorbate', sorbate_atoms, {1: 'N_G', 2: 'C_G'}, {1: [30.0, 3.3], 2: [30.0, 3.3]})
+    sorbate.set_tags([1, 2])
+    print('{0:>8} {1:>12} {2:>10} {3:>8} {4:>10} {5:>10}'.format('atoms', 'method', 'seconds', 'speedup', 'peak MB',
+                                                                 'CONFIG MB'))
+    with tempfile.TemporaryDirectory() as directory:
+        config_path = pathlib.Path(directory) / 'CONFIG'
+        field_path = pathlib.Path(directory) / 'FIELD'
+        for size in sizes:
+            with contextlib.redirect_stdout(io.StringIO()):
+                molecule = dlmolecule.from_ase(framework, 'framework', forcefield.UFF, cutoff=size,
+                                               keep_charges=True, compact=True)
+
+            def write(precision=None, stream=True):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    field = dlmolecule.make_field(molecule, [sorbate])
+                    with open(config_path, 'w') as fd:
+                        if stream:
+                            molecule.write_config_empty_framework(fd, precision=precision)
+                        else:
+                            fd.write(str(molecule.make_config_empty_framework()))
+                    with open(field_path, 'w') as fd:
+                        if stream:
+                            dlmolecule.write_field(fd, field)
+                        else:
+                            fd.write(str(field))
+
+            methods = {'string': lambda: write(stream=False), 'stream-full': lambda: write(),
+                       f'stream-{dlmolecule.CONFIG_PRECISION}': lambda: write(dlmolecule.CONFIG_PRECISION)}
+            reference = None
+            reference_time = None
+            for method, func in methods.items():
+                func()
+                written = config_path.read_text(), str(dlfield.from_string(field_path.read_text()))
+                if reference is None:
+                    reference = written
+                precision = None if method in ('string', 'stream-full') else dlmolecule.CONFIG_PRECISION
+                tolerance = 0.0 if precision is None else 0.5 * 10.0 ** -precision + 1e-12
+                assert same_config(reference[0], written[0], tolerance, len(molecule.molecule) <= parse_limit), \
+                    f'{method} wrote a different CONFIG'
+                assert written[1] == reference[1], f'{method} wrote a different FIELD'
+                config_size = config_path.stat().st_size
+                seconds = best_time(func, repeat)
+                if reference_time is None:
+                    reference_time = seconds
+                print('{0:>8} {1:>12} {2:>10.4f} {3:>7.1f}x {4:>10.1f} {5:>10.1f}'.format(
+                    len(molecule.molecule), method, seconds, reference_time / seconds, peak_memory(func),
+                    config_size / 1e6))
+
+
+def benchmark_input_cache(cif_file=DEFAULT_CIF, sizes=(12, 26, 53), repeat=3):
+    '''
+    Times preparing the CONFIG and FIELD files of a framework and a sorbate as cif2config.create_config_field does
+    (reading the CIF, checking, building and tagging the supercell, mixing and writing), and copying them from an
+    input_cache.InputCache entry keyed by the same inputs. Both must give identical files.
+
+    :param cif_file: (pathlib.Path) the framework CIF file
+    :param sizes: (tuple) cutoffs in A, which set the size of the simulation supercell
+    :param repeat: (int) the number of timed calls per method and size
+    '''
+    sorbate_atoms = crystal(['N', 'C'], [(0, 0, 0), (0.1, 0, 0)], cellpar=[10, 10, 10, 90, 90, 90])
+    sorbate = dlmolecule.DLMolecule('sorbate', sorbate_atoms, {1: 'N_G', 2: 'C_G'}, {1: [30.0, 3.3], 2: [30.0, 3.3]})
+    sorbate.set_tags([1, 2])
+    print('{0:>8} {1:>10} {2:>10} {3:>8}'.format('cutoff', 'method', 'seconds', 'speedup'))
+    with tempfile.TemporaryDirectory() as directory:
+        directory = pathlib.Path(directory)
+        cache = input_cache.InputCache(directory / 'cache')
+        output_directory = directory / 'run'
+        output_directory.mkdir()
+
+        def prepare(size):
+            with contextlib.redirect_stdout(io.StringIO()):
+                framework = next(cif_hack.read_cif(str(cif_file), 0))
+                preflight.check_structure(framework, 'framework', check_charges=False)
+                molecule = dlmolecule.from_ase(framework, 'framework', forcefield.UFF, cutoff=size)
+                with open(output_directory / 'CONFIG', 'w') as fd:
+                    molecule.write_config_empty_framework(fd)
+                with open(output_directory / 'FIELD', 'w') as fd:
+                    dlmolecule.write_field(fd, dlmolecule.make_field(molecule, [sorbate], cutoff=size))
+
+        def cached(size):
+            key = cache.key(cif_file, forcefield.UFF, [sorbate], cutoff=size)
+            if not cache.restore(key, output_directory):
+                prepare(size)
+                cache.store(key, output_directory)
+
+        def written():
+            return [(output_directory / name).read_text() for name in input_cache.InputCache.FILES]
+
+        for size in sizes:
+            prepare(size)
+            reference = written()
+            cached(size)
+            methods = {'prepare': lambda: prepare(size), 'cached': lambda: cached(size)}
+            reference_time = None
+            for method, func in methods.items():
+                for name in input_cache.InputCache.FILES:
+                    (output_directory / name).unlink()
+                func()
+                assert written() == reference, f'{method} wrote different CONFIG or FIELD files'
+                seconds = best_time(func, repeat)
+                if reference_time is None:
+                    reference_time = seconds
+                print('{0:>8} {1:>10} {2:>10.4f} {3:>7.1f}x'.format(size, method, seconds, reference_time / seconds))
+        print('{0} hits, {1} misses, {2} entries of {3:.1f} MB'.format(cache.hits, cache.misses,
+                                                                     len(cache.entries()), cache.size() / 1e6))
+
+
+def shared_framework_worker(source, size, output_directory):
+    '''
+    Gets a framework in a worker process, from its CIF file as cif2config.create_config_field does or by attaching to
+    a shared_framework.SharedFramework, and writes its CONFIG and FIELD files with a sorbate.
+
+    :param source: (pathlib.Path or shared_framework.SharedFrameworkHandle) the framework CIF file or shared framework
+    :param size: (int) the cutoff in A, which sets the size of the simulation supercell
+    :param output_directory: (pathlib.Path) where the CONFIG and FIELD files are written
+    :return seconds: (float) the time taken to get the framework
+    :return peak: (float) the peak memory allocated by Python while getting it, in MB
+    '''
+    sorbate_atoms = crystal(['N', 'C'], [(0, 0, 0), (0.1, 0, 0)], cellpar=[10, 10, 10, 90, 90, 90])
+    sorbate = dlmolecule.DLMolecule('sorbate', sorbate_atoms, {1: 'N_G', 2: 'C_G'}, {1: [30.0, 3.3], 2: [30.0, 3.3]})
+    sorbate.set_tags([1, 2])
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracemalloc.start()
+        start = time.perf_counter()
+        if isinstance(source, shared_framework.SharedFrameworkHandle):
+            molecule = shared_framework.attach(source)
+        else:
+            framework = next(cif_hack.read_cif(str(source), 0))
+            molecule = dlmolecule.from_ase(framework, 'framework', forcefield.UFF, cutoff=size)
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        with open(output_directory / 'CONFIG', 'w') as fd:
+            molecule.write_config_empty_framework(fd)
+        with open(output_directory / 'FIELD', 'w') as fd:
+            dlmolecule.write_field(fd, dlmolecule.make_field(molecule, [sorbate], cutoff=size))
+    return seconds, peak / 1e6
+
+
+def benchmark_shared_framework(cif_file=DEFAULT_CIF, sizes=(13, 26, 53), workers=4, repeat=1):
+    '''
+    Times a pool of worker processes each writing the CONFIG and FIELD files of the same framework, with every worker
+    reading the CIF and building the supercell itself, and with the supercell prepared once and attached to from a
+    shared_framework.SharedFramework. Every worker must write identical files.
+    Also reports the mean time and peak Python memory each worker spends getting its framework.
+
+    :param cif_file: (pathlib.Path) the framework CIF file
+    :param sizes: (tuple) cutoffs in A, which set the size of the simulation supercell
+    :param workers: (int) the number of worker processes, each running one task
+    :param repeat: (int) the number of timed calls per method and size
+    '''
+    print('{0:>8} {1:>8} {2:>10} {3:>8} {4:>16} {5:>16}'.format('atoms', 'method', 'seconds', 'speedup',
+                                                                'worker seconds', 'worker peak MB'))
+    with tempfile.TemporaryDirectory() as directory, \
+            concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        output_directories = [pathlib.Path(directory) / str(i) for i in range(workers)]
+        for output_directory in output_directories:
+            output_directory.mkdir()
+
+        def run(source, size):
+            results = list(pool.map(shared_framework_worker, [source] * workers, [size] * workers,
+                                    output_directories))
+            return np.mean(results, axis=0)
+
+        def prepared(size):
+            return run(cif_file, size)
+
+        def shared(size):
+            with contextlib.redirect_stdout(io.StringIO()):
+                framework = next(cif_hack.read_cif(str(cif_file), 0))
+                molecule = dlmolecule.from_ase(framework, 'framework', forcefield.UFF, cutoff=size)
+            with shared_framework.SharedFramework(molecule) as block:
+                return run(block.handle, size)
+
+        def written():
+            return [[(output_directory / name).read_text() for name in ('CONFIG', 'FIELD')]
+                    for output_directory in output_directories]
+
+        # Starts the workers, so neither method is timed starting them
+        pool.map(time.sleep, [0.0] * workers)
+        for size in sizes:
+            with contextlib.redirect_stdout(io.StringIO()):
+                n_atoms = len(dlmolecule.from_ase(next(cif_hack.read_cif(str(cif_file), 0)), 'framework',
+                                                  forcefield.UFF, cutoff=size).molecule)
+            methods = {'prepare': prepared, 'shared': shared}
+            reference = None
+            reference_time = None
+            for method, func in methods.items():
+                worker_seconds, worker_peak = func(size)
+                files = written()
+                if reference is None:
+                    reference = files[0]
+                assert all(worker_files == reference for worker_files in files), \
+                    f'{method} wrote different CONFIG or FIELD files'
+                seconds = best_time(lambda: func(size), repeat)
+                if reference_time is None:
+                    reference_time = seconds
+                print('{0:>8} {1:>8} {2:>10.4f} {3:>7.1f}x {4:>16.4f} {5:>16.1f}'.format(
+                    n_atoms, method, seconds, reference_time / seconds, worker_seconds, worker_peak))
+
+
+def import_time(statements, setup='', repeat=3):
+    '''
+    Runs statements in fresh Python processes started in this directory, and returns the fastest time they took.
+
+    :param statements: (str) the Python code to time, e.g. an import
+    :param setup: (str) Python code run before the timed statements
+    :param repeat: (int) the number of processes started
+    :return best: (float) the shortest time taken by the statements in a single process, in seconds
+    '''
+    code = '{0}\nimport time\nstart = time.perf_counter()\n{1}\nprint(time.perf_counter() - start)'.format(
+        setup, statements)
+    directory = pathlib.Path(__file__).resolve().parent
+    return min(float(subprocess.run([sys.executable, '-c', code], cwd=directory, check=True, capture_output=True,
+                                    text=True).stdout.split()[-1]) for _ in range(repeat))
+
+
+def benchmark_sorbate_registry(gases=('Nitrogen', 'CO2', 'water'), repeat=5):
+    '''
+    Times importing sorbates and getting one gas in a fresh process, with every molecule built on import as the module
+    used to, and built lazily by sorbates.lookup. Every lazily built molecule must equal the eagerly built one.
+    dlmolecule is imported before the timing starts, as it is by the runners, so only building the molecules is
+    compared. The last rows time importing sorbates alone, ASE and dlmolecule included, as a process needing no
+    molecule does.
+
+    :param gases: (tuple) names of gases in sorbates.lookup
+    :param repeat: (int) the number of processes started per method and gas
+    '''
+    eager = {key: sorbates.build_sorbate(definition) for key, definition in sorbates.lookup.definitions.items()}
+    for gas in sorbates.lookup:
+        molecule, reference = sorbates.lookup[gas], eager[sorbates.lookup.gases[gas]]
+        assert (molecule.name, molecule.tags, molecule.potentials) == \
+            (reference.name, reference.tags, reference.potentials), f'{gas} has different atom types'
+        assert molecule.molecule == reference.molecule, f'{gas} has different atoms'
+        assert np.array_equal(molecule.molecule.get_initial_charges(), reference.molecule.get_initial_charges()), \
+            f'{gas} has different charges'
+    build_all = ('molecules = {key: sorbates.build_sorbate(definition) for key, definition in '
+                 'sorbates.lookup.definitions.items()}')
+    print('{0:>16} {1:>8} {2:>10} {3:>8}'.format('gas', 'method', 'seconds', 'speedup'))
+    rows = [(gas, {'eager': 'import sorbates\n{0}\nmolecule = molecules[sorbates.lookup.gases[{1!r}]]'.format(
+                       build_all, gas),
+                   'lazy': 'import sorbates\nmolecule = sorbates.lookup[{0!r}]'.format(gas)}, 'import dlmolecule')
+            for gas in gases]
+    rows.append(('(none)', {'eager': 'import sorbates\n{0}'.format(build_all), 'lazy': 'import sorbates'}, ''))
+    for gas, methods, setup in rows:
+        reference_time = None
+        for method, statements in methods.items():
+            seconds = import_time(statements, setup, repeat)
+            if reference_time is None:
+                reference_time = seconds
+            print('{0:>16} {1:>8} {2:>10.4f} {3:>7.1f}x'.format(gas, method, seconds, reference_time / seconds))
+
+
+def reference_insertion_energies(grid, sorbate, centres, rotations):
+    '''
+    Computes the energy of each insertion of sorbate directly from the framework atoms and their periodic images
+    within the cutoff, as henry.insertion_energies approximates from its grids.
+
+    :param grid: (henry.EnergyGrid) the framework, forcefield and options
+    :param sorbate: (DLMolecule) the inserted molecule
+    :param centres: (ndarray) the fractional coordinates of the centre of each insertion
+    :param rotations: (ndarray) the rotation matrix of each insertion
+    :return energies: (ndarray) the energy of each insertion, in K
+    '''
+    framework = grid.framework.molecule
+    scaled = np.linalg.solve(grid.cell.T, np.asarray(framework.positions).T).T % 1.0
+    reach = np.ceil(grid.cutoff / dlmolecule.perpendicular_widths(grid.cell)).astype(int) + 1
+    shifts = np.stack(np.meshgrid(*(np.arange(-r, r + 1) for r in reach), indexing='ij'), axis=-1).reshape(-1, 3)
+    images = ((scaled[np.newaxis] + shifts[:, np.newaxis]) @ grid.cell).reshape(-1, 3)
+    atoms = np.tile(np.arange(len(scaled)), len(shifts))
+    framework_tags = list(grid.framework.tags)
+    atom_types = np.array([framework_tags.index(tag) for tag in framework.get_tags().tolist()])[atoms]
+    charges = framework.get_initial_charges()[atoms]
+    parameters = henry.site_parameters(grid.framework, sorbate, grid.forcefield)
+    counts = np.bincount(atom_types[:len(scaled)], minlength=len(framework_tags))
+
+    sites = henry.insertion_sites(grid, sorbate, centres, rotations) % 1.0 @ grid.cell
+    energies = np.zeros(len(centres))
+    tree = cKDTree(images)
+    for site, (tag, charge) in enumerate(zip(sorbate.molecule.get_tags().tolist(),
+                                             sorbate.molecule.get_initial_charges().tolist())):
+        pairs = cKDTree(sites[:, site]).sparse_distance_matrix(tree, grid.cutoff, output_type='ndarray')
+        index, distance, types = pairs['i'], np.maximum(pairs['v'], 1e-6), atom_types[pairs['j']]
+        epsilon, sigma = parameters[tag]
+        sigma_6 = (sigma[types] / distance) ** 6
+        site_energies = np.bincount(index, 4 * epsilon[types] * (sigma_6 ** 2 - sigma_6), minlength=len(centres))
+        ratio_3 = (sigma / grid.cutoff) ** 3
+        site_energies += np.sum(16 * np.pi * counts / grid.volume * epsilon * sigma ** 3 *
+                                (ratio_3 ** 3 / 9 - ratio_3 / 3))
+        energies += np.minimum(site_energies, henry.ENERGY_CAP)
+        if grid.coulomb and charge != 0:
+            energies += charge * henry.ELECTROSTATIC_CONSTANT * np.bincount(
+                index, charges[pairs['j']] * erfc(grid.alpha * distance) / distance, minlength=len(centres))
+            overlapping = np.bincount(index, distance < grid.overlap_distance, minlength=len(centres)) > 0
+            energies[overlapping] = henry.ENERGY_CAP
+    return np.minimum(energies, henry.ENERGY_CAP)
+
+
+def benchmark_henry(cif_file=DEFAULT_CIF, sizes=(1000, 10000, 100000), gas='CO2', temperature=298.0, repeat=1):
+    '''
+    Times the energies of random insertions of a sorbate into a framework summed directly over the framework atoms,
+    and interpolated from the henry.EnergyGrid grids. The Henry coefficients from both must agree within 5%.
+    Also reports the time tabulating the grids, and reading them back from a henry.GridCache.
+
+    :param cif_file: (pathlib.Path) the framework CIF file
+    :param sizes: (tuple) the numbers of insertions
+    :param gas: (str) the sorbates.lookup name of the sorbate
+    :param temperature: (float) the temperature in K
+    :param repeat: (int) the number of timed calls per method and size
+    '''
+    with contextlib.redirect_stdout(io.StringIO()):
+        framework = henry.prepare_framework(next(cif_hack.read_cif(str(cif_file), 0)))
+    sorbate = sorbates.lookup[gas]
+    with tempfile.TemporaryDirectory() as directory:
+        cache = henry.GridCache(directory)
+        start = time.perf_counter()
+        grid = henry.EnergyGrid(framework, cache=cache)
+        grid.site_grids(sorbate)
+        tabulated = time.perf_counter() - start
+        # A new cache on the same directory, so the grids are read from disk rather than memory
+        cached = best_time(lambda: henry.EnergyGrid(framework, cache=henry.GridCache(directory)).site_grids(sorbate),
+                           repeat)
+    print('{0} grids {1}: tabulated in {2:.2f} s, read from the cache in {3:.4f} s'.format(
+        gas, ' x '.join(map(str, grid.shape)), tabulated, cached))
+
+    print('{0:>10} {1:>8} {2:>10} {3:>8} {4:>14}'.format('insertions', 'method', 'seconds', 'speedup', 'mol/kg/Pa'))
+    rng = np.random.default_rng(0)
+    for size in sizes:
+        centres, rotations = rng.random((size, 3)), henry.random_rotations(size, rng)
+        methods = {'direct': reference_insertion_energies, 'grid': henry.insertion_energies}
+        reference = None
+        reference_time = None
+        for method, func in methods.items():
+            energies = func(grid, sorbate, centres, rotations)
+            coefficient = np.exp(-energies / temperature).mean() / (henry.GAS_CONSTANT * temperature * grid.density)
+            if reference is None:
+                reference = coefficient
+            assert abs(coefficient / reference - 1) < 0.05, f'{method} Henry coefficient differs by more than 5%'
+            seconds = best_time(lambda: func(grid, sorbate, centres, rotations), repeat)
+            if reference_time is None:
+                reference_time = seconds
+            print('{0:>10} {1:>8} {2:>10.4f} {3:>7.1f}x {4:>14.4e}'.format(size, method, seconds,
+                                                                            reference_time / seconds, coefficient))
+
+
+def reference_pore_diameters(grid, centres):
+    '''
+    Computes the pore diameter of each point of a pores.PoreGrid as the largest sphere covering it, stamping the sphere
+    of each centre in turn rather than all the spheres of one radius at once as pores.PoreGrid._cover does.
+
+    :param grid: (pores.PoreGrid) the clearance grid
+    :param centres: (ndarray) the flat indices of the accessible points
+    :return diameters: (ndarray) the flat pore diameter of each point, zero outside every sphere
+    '''
+    diameters = np.zeros(grid.clearance.size)
+    shape = np.array(grid.shape)
+    stencils = {}
+    for centre in centres.tolist():
+        step = int(np.floor(grid.clearance.flat[centre] / pores.RADIUS_STEP))
+        if step not in stencils:
+            stencils[step] = grid._stencil(step * pores.RADIUS_STEP)
+        index = (np.array(np.unravel_index(centre, grid.shape)) + stencils[step]) % shape
+        np.maximum.at(diameters, np.ravel_multi_index(index.T, grid.shape), 2 * step * pores.RADIUS_STEP)
+    return diameters
+
+
+def benchmark_pores(cif_file=DEFAULT_CIF, spacings=(1.0, 0.6, 0.4), gas='Nitrogen', repeat=1):
+    '''
+    Times the pore diameters of the channels of a framework for the probe of a sorbate, stamping the sphere of every
+    accessible centre in turn and, as pores.PoreGrid does, convolving the centres of each radius with a ball.
+    Both must give the same diameters.
+    Also reports the accessible volume fraction and the molecule numbers derived from it.
+
+    :param cif_file: (pathlib.Path) the framework CIF file
+    :param spacings: (tuple) grid spacings in A
+    :param gas: (str) the sorbates.lookup name of the sorbate
+    :param repeat: (int) the number of timed calls per method and spacing
+    '''
+    with contextlib.redirect_stdout(io.StringIO()):
+        framework = dlmolecule.from_ase(next(cif_hack.read_cif(str(cif_file), 0)), 'framework', forcefield.UFF)
+    sorbate = sorbates.lookup[gas]
+    print('{0:>8} {1:>8} {2:>8} {3:>10} {4:>8} {5:>10} {6:>6} {7:>6}'.format(
+        'spacing', 'points', 'method', 'seconds', 'speedup', 'accessible', 'cap', 'nmax'))
+    for spacing in spacings:
+        grid = pores.PoreGrid(framework, spacing)
+        analysis = grid.analyse(pores.probe_diameter(sorbate))
+        components, dimensions = grid._components(grid.clearance >= analysis.probe_diameter / 2)
+        channels = np.flatnonzero(dimensions[components] > 0)
+        methods = {'spheres': lambda: reference_pore_diameters(grid, channels),
+                   'fft': lambda: grid._cover(channels)}
+        reference = None
+        reference_time = None
+        for method, func in methods.items():
+            diameters = func()
+            if reference is None:
+                reference = diameters
+            assert np.array_equal(diameters, reference), f'{method} gave different pore diameters'
+            seconds = best_time(func, repeat)
+            if reference_time is None:
+                reference_time = seconds
+            print('{0:>8} {1:>8} {2:>8} {3:>10.4f} {4:>7.1f}x {5:>10.3f} {6:>6} {7:>6}'.format(
+                spacing, grid.clearance.size, method, seconds, reference_time / seconds,
+                analysis.accessible_fraction, pores.molecule_cap(analysis, sorbate),
+                pores.saturation_loading(analysis, sorbate)))
+
+
+def reference_select_batch(surrogate, features, batch, acquisition='ei', best=None):
+    '''
+    Picks a batch of frameworks as active_learning.select_batch does, but refitting the surrogate to the believed
+    loadings of the frameworks picked so far before each pick, rather than updating the variances in place.
+
+    :param surrogate: (active_learning.Surrogate) the fitted surrogate
+    :param features: (ndarray) the standardised descriptors of the candidate frameworks
+    :param batch: (int) the number of frameworks to pick
+    :param acquisition: (str) 'ei' or 'uncertainty'
+    :param best: (float) the best loading found
+    :return picked: (list) the indices of the picked frameworks
+    '''
+    mean, std = surrogate.predict(features)
+    believer = copy.copy(surrogate)
+    picked = []
+    for _ in range(min(batch, len(features))):
+        score = active_learning.expected_improvement(mean, std, best) if acquisition == 'ei' else std.copy()
+        score[picked] = -np.inf
+        picked.append(int(np.argmax(score)))
+        # The fitted loadings with the mean prediction of each picked framework, at the fitted hyperparameters
+        known = np.vstack([surrogate.features, features[picked]])
+        kernel = believer._kernel(known, known) + surrogate.noise * np.eye(len(known))
+        believer.features = known
+        believer.factor = cholesky(kernel, lower=True)
+        believer.weights = cho_solve((believer.factor, True), np.concatenate([
+            surrogate._kernel(surrogate.features, surrogate.features) @ surrogate.weights +
+            surrogate.noise * surrogate.weights, (mean[picked] - surrogate.offset) / surrogate.scale]))
+        std = believer.predict(features)[1]
+    return picked
+
+
+def synthetic_loadings(samples, dimensions, seed=0):
+    '''
+    Draws random standardised descriptors and a smooth loading of them with a few sharp maxima, standing for a
+    screening whose GCMC loadings are known for every framework.
+
+    :param samples: (int) the number of frameworks
+    :param dimensions: (int) the number of descriptors
+    :param seed: (int) the random seed
+    :return features: (ndarray) the descriptors, one row per framework
+    :return loadings: (ndarray) the loading of each framework
+    '''
+    rng = np.random.default_rng(seed)
+    features = rng.standard_normal((samples, dimensions))
+    directions = rng.standard_normal((dimensions, dimensions)) / np.sqrt(dimensions)
+    peaks = rng.standard_normal((3, dimensions))
+    loadings = np.sin(features @ directions).sum(axis=1) + sum(
+        3 * np.exp(-np.sum((features - peak) ** 2, axis=1)) for peak in peaks)
+    return features, loadings + 0.05 * rng.standard_normal(samples)
+
+
+def benchmark_active_learning(sizes=(500, 2000, 5000), dimensions=8, batch=10, budgets=(20, 50, 100, 200), k=20,
+                              repeat=1):
+    '''
+    Times picking a batch of frameworks by refitting the surrogate after each pick and, as
+    active_learning.select_batch does, by updating the variances in place. Both must pick the same frameworks.
+    Then reports the fraction of the true top k frameworks among the predicted top k as the budget of simulated
+    frameworks grows, picking batches at random, by uncertainty and by expected improvement.
+
+    :param sizes: (tuple) numbers of candidate frameworks
+    :param dimensions: (int) the number of descriptors
+    :param batch: (int) the number of frameworks per batch
+    :param budgets: (tuple) numbers of simulated frameworks at which the ranking is reported
+    :param k: (int) the size of the ranking
+    :param repeat: (int) the number of timed calls per method and size
+    '''
+    print('{0:>8} {1:>10} {2:>10} {3:>8}'.format('size', 'method', 'seconds', 'speedup'))
+    for size in sizes:
+        features, loadings = synthetic_loadings(size, dimensions)
+        surrogate = active_learning.Surrogate().fit(features[:50], loadings[:50])
+        best = float(loadings[:50].max())
+        methods = {'refit': lambda: reference_select_batch(surrogate, features[50:], batch, best=best),
+                   'update': lambda: active_learning.select_batch(surrogate, features[50:], batch, best=best)[0]}
+        reference = None
+        reference_time = None
+        for method, func in methods.items():
+            picked = func()
+            if reference is None:
+                reference = picked
+            assert picked == reference, f'{method} picked different frameworks'
+            seconds = best_time(func, repeat)
+            if reference_time is None:
+                reference_time = seconds
+            print('{0:>8} {1:>10} {2:>10.4f} {3:>7.1f}x'.format(size, method, seconds, reference_time / seconds))
+
+    features, loadings = synthetic_loadings(sizes[0], dimensions)
+    names = list(range(len(features)))
+    truth = active_learning.top_k(names, loadings, k)
+    print('\n{0:>12} '.format('acquisition') + ' '.join('{0:>6}'.format(budget) for budget in budgets))
+    for acquisition in ('random', *active_learning.ACQUISITIONS):
+        rng = np.random.default_rng(1)
+        done = np.zeros(len(features), dtype=bool)
+        done[active_learning.spread_batch(features, batch)] = True
+        recalls = []
+        while done.sum() < max(budgets):
+            surrogate = active_learning.Surrogate().fit(features[done], loadings[done])
+            candidates = np.flatnonzero(~done)
+            if acquisition == 'random':
+                picked = rng.choice(len(candidates), min(batch, len(candidates)), replace=False)
+            else:
+                picked = active_learning.select_batch(surrogate, features[candidates], batch, acquisition,
+                                                      best=float(loadings[done].max()))[0]
+            done[candidates[picked]] = True
+            if done.sum() in budgets:
+                scores = np.where(done, loadings, surrogate.predict(features)[0])
+                recalls.append(len(active_learning.top_k(names, scores, k) & truth) / k)
+        print('{0:>12} '.format(acquisition) + ' '.join('{0:>6.2f}'.format(recall) for recall in recalls))
+
+
+def int_list(input_string):
+    return [int(x) for x in input_string.split(',')]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    cif_readers = subparsers.add_parser('cif-readers', help='Compare cif_hack readers on real and synthetic CIFs.')
+    cif_readers.add_argument('--cif', type=pathlib.Path, default=DEFAULT_CIF, help='Template CIF file.')
+    cif_readers.add_argument('--sizes', type=int_list, default=[1, 100, 1000],
+                             help='Comma-separated numbers of copies of the atom site rows.')
+    cif_readers.add_argument('--readers', type=lambda x: x.split(','), default=['ase', 'fast'],
+                             help='Comma-separated cif_hack readers, the first being the reference.')
+    cif_readers.add_argument('--repeat', type=int, default=3, help='Timed calls per measurement.')
+
+    cif_structure = subparsers.add_parser('cif-structure',
+                                          help='Compare cif_hack readers on the tags needed to build a structure.')
+    cif_structure.add_argument('--cif', type=pathlib.Path, default=DEFAULT_CIF, help='Template CIF file.')
+    cif_structure.add_argument('--sizes', type=int_list, default=[0, 10000, 100000],
+                               help='Comma-separated numbers of rows in the appended bond loop.')
+    cif_structure.add_argument('--readers', type=lambda x: x.split(','), default=['ase', 'fast', 'lazy'],
+                               help='Comma-separated cif_hack readers, the first being the reference.')
+    cif_structure.add_argument('--repeat', type=int, default=3, help='Timed calls per measurement.')
+
+    cif_collection = subparsers.add_parser('cif-collection',
+                                           help='Read one structure out of large concatenated CIF files.')
+    cif_collection.add_argument('--cif', type=pathlib.Path, default=DEFAULT_CIF, help='Template CIF file.')
+    cif_collection.add_argument('--sizes', type=int_list, default=[10, 100],
+                                help='Comma-separated numbers of data blocks in the concatenated file.')
+    cif_collection.add_argument('--repeat', type=int, default=1, help='Timed calls per measurement.')
+
+    cif_symmetry = subparsers.add_parser('cif-symmetry',
+                                         help='Compare symmetry expansions of asymmetric units into unit cells.')
+    cif_symmetry.add_argument('--cif', type=pathlib.Path, default=DEFAULT_CIF, help='Template CIF file.')
+    cif_symmetry.add_argument('--sizes', type=int_list, default=[1, 2, 3],
+                              help='Comma-separated numbers of repeats of the asymmetric unit along each axis.')
+    cif_symmetry.add_argument('--repeat', type=int, default=3, help='Timed calls per measurement.')
+
+    spacegroup_cache = subparsers.add_parser('spacegroup-cache',
+                                             help='Build many structures sharing a space group, with and without '
+                                                  'the compiled spacegroup cache.')
+    spacegroup_cache.add_argument('--cif', type=pathlib.Path, default=DEFAULT_CIF, help='Template CIF file.')
+    spacegroup_cache.add_argument('--sizes', type=int_list, default=[10, 100],
+                                  help='Comma-separated numbers of data blocks in the concatenated file.')
+    spacegroup_cache.add_argument('--repeat', type=int, default=1, help='Timed calls per measurement.')
+
+    framework_cache_parser = subparsers.add_parser('framework-cache',
+                                                   help='Read frameworks from CIF files and from the framework cache.')
+    framework_cache_parser.add_argument('--cif', type=pathlib.Path, default=DEFAULT_CIF, help='Template CIF file.')
+    framework_cache_parser.add_argument('--sizes', type=int_list, default=[1, 3],
+                                        help='Comma-separated numbers of copies of the atom site rows.')
+    framework_cache_parser.add_argument('--repeat', type=int, default=3, help='Timed calls per measurement.')
+
+    cif_archive = subparsers.add_parser('cif-archive',
+                                        help='Read structures out of a .tar.gz archive with and without extracting it.')
+    cif_archive.add_argument('--cif', type=pathlib.Path, default=DEFAULT_CIF, help='Template CIF file.')
+    cif_archive.add_argument('--sizes', type=int_list, default=[100, 1000],
+                             help='Comma-separated numbers of CIF files in the archive.')
+    cif_archive.add_argument('--repeat', type=int, default=1, help='Timed calls per measurement.')
+
+    cif_writer = subparsers.add_parser('cif-writer', help='Write large supercells to CIF row by row and by column.')
+    cif_writer.add_argument('--cif', type=pathlib.Path, default=DEFAULT_CIF, help='Framework CIF file.')
+    cif_writer.add_argument('--sizes', type=int_list, default=[1, 4, 6],
+                            help='Comma-separated numbers of repeats of the unit cell along each axis.')
+    cif_writer.add_argument('--repeat', type=int, default=3, help='Timed calls per measurement.')
+
+    framework_tags = subparsers.add_parser('framework-tags',
+                                           help='Assign DL_MONTE atom type tags to framework supercells of up to a '
+                                                'million atoms.')
+    framework_tags.add_argument('--cif', type=pathlib.Path, default=DEFAULT_CIF, help='Framework CIF file.')
+    framework_tags.add_argument('--sizes', type=int_list, default=[1, 4, 12],
+                                help='Comma-separated numbers of repeats of the unit cell along each axis.')
+    framework_tags.add_argument('--repeat', type=int, default=1, help='Timed calls per measurement.')
+
+    framework_arrays = subparsers.add_parser('framework-arrays',
+                                             help='Build DLMolecule frameworks as ASE.Atoms and as compact arrays.')
+    framework_arrays.add_argument('--cif', type=pathlib.Path, default=DEFAULT_CIF, help='Framework CIF file.')
+    framework_arrays.add_argument('--sizes', type=int_list, default=[13, 26, 53, 80],
+                                  help='Comma-separated cutoffs in A, which set the supercell size.')
+    framework_arrays.add_argument('--repeat', type=int, default=1, help='Timed calls per measurement.')
+
+    tag_index = subparsers.add_parser('tag-index',
+                                      help='Write FIELD atom types and VDW entries with and without the tag index.')
+    tag_index.add_argument('--cif', type=pathlib.Path, default=DEFAULT_CIF, help='Framework CIF file.')
+    tag_index.add_argument('--sizes', type=int_list, default=[13, 26, 53, 80],
+                           help='Comma-separated cutoffs in A, which set the supercell size.')
+    tag_index.add_argument('--repeat', type=int, default=3, help='Timed calls per measurement.')
+
+    mixing_rules = subparsers.add_parser('mixing-rules',
+                                         help='Write the VDW interactions of many framework and sorbate FIELD files.')
+    mixing_rules.add_argument('--cif', type=pathlib.Path, default=DEFAULT_CIF, help='Framework CIF file.')
+    mixing_rules.add_argument('--sizes', type=int_list, default=[10, 100, 1000],
+                              help='Comma-separated numbers of FIELD files.')
+    mixing_rules.add_argument('--repeat', type=int, default=1, help='Timed calls per measurement.')
+
+    preflight_parser = subparsers.add_parser('preflight',
+                                             help='Find close atom pairs in framework supercells with a cell list.')
+    preflight_parser.add_argument('--cif', type=pathlib.Path, default=DEFAULT_CIF, help='Framework CIF file.')
+    preflight_parser.add_argument('--sizes', type=int_list, default=[1, 4, 8],
+                                  help='Comma-separated numbers of repeats of the unit cell along each axis.')
+    preflight_parser.add_argument('--cutoff', type=float, default=1.2, help='Pair distance cutoff in A.')
+    preflight_parser.add_argument('--repeat', type=int, default=3, help='Timed calls per measurement.')
+
+    config_stream = subparsers.add_parser('config-stream',
+                                          help='Write CONFIG and FIELD files as strings and streamed from arrays.')
+    config_stream.add_argument('--cif', type=pathlib.Path, default=DEFAULT_CIF, help='Framework CIF file.')
+    config_stream.add_argument('--sizes', type=int_list, default=[13, 26, 53],
+                               help='Comma-separated cutoffs in A, which set the supercell size.')
+    config_stream.add_argument('--repeat', type=int, default=1, help='Timed calls per measurement.')
+
+    input_cache_parser = subparsers.add_parser('input-cache',
+                                               help='Prepare CONFIG and FIELD files and reuse them from the store.')
+    input_cache_parser.add_argument('--cif', type=pathlib.Path, default=DEFAULT_CIF, help='Framework CIF file.')
+    input_cache_parser.add_argument('--sizes', type=int_list, default=[12, 26, 53],
+                                    help='Comma-separated cutoffs in A, which set the supercell size.')
+    input_cache_parser.add_argument('--repeat', type=int, default=3, help='Timed calls per measurement.')
+
+    shared_framework_parser = subparsers.add_parser('shared-framework',
+                                                    help='Write the files of one framework from many worker '
+                                                         'processes, with and without shared memory.')
+    shared_framework_parser.add_argument('--cif', type=pathlib.Path, default=DEFAULT_CIF, help='Framework CIF file.')
+    shared_framework_parser.add_argument('--sizes', type=int_list, default=[13, 26, 53],
+                                         help='Comma-separated cutoffs in A, which set the supercell size.')
+    shared_framework_parser.add_argument('--workers', type=int, default=4, help='Number of worker processes.')
+    shared_framework_parser.add_argument('--repeat', type=int, default=1, help='Timed calls per measurement.')
+
+    sorbate_registry = subparsers.add_parser('sorbate-registry',
+                                             help='Import sorbates and get one gas, with every molecule built on '
+                                                  'import and built lazily.')
+    sorbate_registry.add_argument('--gases', type=lambda x: x.split(','), default=['Nitrogen', 'CO2', 'water'],
+                                  help='Comma-separated gas names in sorbates.lookup.')
+    sorbate_registry.add_argument('--repeat', type=int, default=5, help='Python processes started per measurement.')
+
+    henry_parser = subparsers.add_parser('henry', help='Compare insertion energies summed directly and interpolated '
+                                                       'from energy grids.')
+    henry_parser.add_argument('--cif', type=pathlib.Path, default=DEFAULT_CIF, help='Framework CIF file.')
+    henry_parser.add_argument('--sizes', type=int_list, default=[1000, 10000, 100000],
+                              help='Comma-separated numbers of insertions.')
+    henry_parser.add_argument('--gas', default='CO2', help='Gas name in sorbates.lookup.')
+    henry_parser.add_argument('--temperature', type=float, default=298.0, help='Temperature in K.')
+    henry_parser.add_argument('--repeat', type=int, default=1, help='Timed calls per measurement.')
+
+    pores_parser = subparsers.add_parser('pores', help='Compare pore diameters stamped sphere by sphere and by '
+                                                       'FFT convolution.')
+    pores_parser.add_argument('--cif', type=pathlib.Path, default=DEFAULT_CIF, help='Framework CIF file.')
+    pores_parser.add_argument('--spacings', type=lambda x: [float(y) for y in x.split(',')], default=[1.0, 0.6, 0.4],
+                              help='Comma-separated grid spacings in A.')
+    pores_parser.add_argument('--gas', default='Nitrogen', help='Gas name in sorbates.lookup.')
+    pores_parser.add_argument('--repeat', type=int, default=1, help='Timed calls per measurement.')
+
+    active_learning_parser = subparsers.add_parser('active-learning',
+                                                   help='Pick batches of frameworks to simulate on synthetic '
+                                                        'descriptors, and report how the ranking converges.')
+    active_learning_parser.add_argument('--sizes', type=int_list, default=[500, 2000, 5000],
+                                        help='Comma-separated numbers of candidate frameworks.')
+    active_learning_parser.add_argument('--budgets', type=int_list, default=[20, 50, 100, 200],
+                                        help='Comma-separated numbers of simulated frameworks, multiples of the '
+                                             'batch size.')
+    active_learning_parser.add_argument('--batch', type=int, default=10, help='Frameworks per batch.')
+    active_learning_parser.add_argument('--repeat', type=int, default=1, help='Timed calls per measurement.')
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+
+    if args.benchmark == 'cif-readers':
+        benchmark_cif_readers(args.cif, args.sizes, args.readers, args.repeat)
+    elif args.benchmark == 'cif-structure':
+        benchmark_cif_structure(args.cif, args.sizes, args.readers, args.repeat)
+    elif args.benchmark == 'cif-collection':
+        benchmark_cif_collection(args.cif, args.sizes, args.repeat)
+    elif args.benchmark == 'cif-symmetry':
+        benchmark_cif_symmetry(args.cif, args.sizes, args.repeat)
+    elif args.benchmark == 'spacegroup-cache':
+        benchmark_spacegroup_cache(args.cif, args.sizes, args.repeat)
+    elif args.benchmark == 'framework-cache':
+        benchmark_framework_cache(args.cif, args.sizes, args.repeat)
+    elif args.benchmark == 'cif-archive':
+        benchmark_cif_archive(args.cif, args.sizes, args.repeat)
+    elif args.benchmark == 'cif-writer':
+        benchmark_cif_writer(args.cif, args.sizes, args.repeat)
+    elif args.benchmark == 'framework-tags':
+        benchmark_framework_tags(args.cif, args.sizes, args.repeat)
+    elif args.benchmark == 'framework-arrays':
+        benchmark_framework_arrays(args.cif, args.sizes, args.repeat)
+    elif args.benchmark == 'tag-index':
+        benchmark_tag_index(args.cif, args.sizes, args.repeat)
+    elif args.benchmark == 'mixing-rules':
+        benchmark_mixing_rules(args.cif, args.sizes, args.repeat)
+    elif args.benchmark == 'preflight':
+        benchmark_preflight(args.cif, args.sizes, args.cutoff, args.repeat)
+    elif args.benchmark == 'config-stream':
+        benchmark_config_stream(args.cif, args.sizes, args.repeat)
+    elif args.benchmark == 'input-cache':
+        benchmark_input_cache(args.cif, args.sizes, args.repeat)
+    elif args.benchmark == 'shared-framework':
+        benchmark_shared_framework(args.cif, args.sizes, args.workers, args.repeat)
+    elif args.benchmark == 'sorbate-registry':
+        benchmark_sorbate_registry(args.gases, args.repeat)
+    elif args.benchmark == 'henry':
+        benchmark_henry(args.cif, args.sizes, args.gas, args.temperature, args.repeat)
+    elif args.benchmark == 'pores':
+        benchmark_pores(args.cif, args.spacings, args.gas, args.repeat)
+    elif args.benchmark == 'active-learning':
+        benchmark_active_learning(args.sizes, batch=args.batch, budgets=args.budgets, repeat=args.repeat)
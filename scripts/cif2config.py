@@ -4,125 +4,26 @@ import dlmolecule as dlm
 import pathlib
 import sorbates
 import cif_hack
+import forcefield as ff
+import preflight
+import pores
 
 # TODO: add argparsing funcionality
 # TODO: hack ASE so it imports charges. Done?
 
-MOF_LJ = {
-    'Zn_S': [62.4, 2.46],
-    'O_S': [30.19, 3.12],
-    'C_S': [47.86, 3.47],
-    'H_S': [7.65, 2.85],
-    'N_S': [38.95, 3.26],
-    'Br_S': [186.19, 3.52],
-    'Se_S': [146.3, 3.75],
-    'Al_S': [253.9, 4.01],
-    'Cu_S': [0, 0],
-
-}
-
-UFF_LJ = {
-    'C_S': [52.800000, 3.431000],
-    'O_S': [30.200000, 3.118000],
-    'H_S': [22.140000, 2.571000],
-    'N_S': [34.700000, 3.261000],
-    'F_S': [25.140000, 2.997000],
-    'Na_S': [15.090000, 2.658000],
-    'Mg_S': [55.820000, 2.691000],
-    'Al_S': [253.940000, 4.008000],
-    'Si_S': [202.150000, 3.826000],
-    'P_S': [153.370000, 3.695000],
-    'S_S': [137.780000, 3.595000],
-    'Cl_S': [114.150000, 3.516000],
-    'K_S': [17.600000, 3.396000],
-    'Ca_S': [119.680000, 3.028000],
-    'Sc_S': [9.550000, 2.936000],
-    'Ti_S': [8.550000, 2.829000],
-    'V_S': [8.050000, 2.801000],
-    'Cr_S': [7.540000, 2.693000],
-    'Mn_S': [6.540000, 2.638000],
-    'Fe_S': [6.540000, 2.594000],
-    'Co_S': [7.040000, 2.559000],
-    'Ni_S': [7.540000, 2.525000],
-    'Cu_S': [2.510000, 3.114000],
-    'Zr_S': [34.700000, 2.783000],
-    'Mo_S': [28.160000, 2.719000],
-    'Be_S': [42.740000, 2.446000],
-    'B_S': [90.510000, 3.638000],
-    'Zn_S': [62.350000, 2.462000],
-    'Ga_S': [208.690000, 3.905000],
-    'Ge_S': [190.580000, 3.813000],
-    'As_S': [155.380000, 3.769000],
-    'Se_S': [146.330000, 3.746000],
-    'Br_S': [126.220000, 3.732000],
-    'Rb_S': [20.110000, 3.665000],
-    'Sr_S': [118.170000, 3.244000],
-    'Y_S': [36.210000, 2.980000],
-    'Nb_S': [29.670000, 2.820000],
-    'Tc_S': [24.140000, 2.671000],
-    'Ru_S': [28.160000, 2.640000],
-    'Rh_S': [26.650000, 2.609000],
-    'Pd_S': [24.140000, 2.583000],
-    'Ag_S': [18.100000, 2.805000],
-    'Cd_S': [114.650000, 2.537000],
-    'In_S': [301.210000, 3.976000],
-    'Sn_S': [285.120000, 3.913000],
-    'Sb_S': [225.780000, 3.938000],
-    'Te_S': [200.140000, 3.982000],
-    'Cs_S': [22.630000, 4.024000],
-    'Ba_S': [183.040000, 3.299000],
-    'La_S': [8.550000, 3.138000],
-    'Ce_S': [6.540000, 3.168000],
-    'Pr_S': [5.030000, 3.213000],
-    'Nd_S': [5.030000, 3.185000],
-    'Pm_S': [4.530000, 3.160000],
-    'Sm_S': [4.020000, 3.136000],
-    'Eu_S': [4.020000, 3.112000],
-    'Gd_S': [4.530000, 3.001000],
-    'Tb_S': [3.520000, 3.074000],
-    'Dy_S': [3.520000, 3.054000],
-    'Ho_S': [3.520000, 3.037000],
-    'Er_S': [3.520000, 3.021000],
-    'Tm_S': [3.020000, 3.006000],
-    'Yb_S': [114.650000, 2.989000],
-    'Lu_S': [20.620000, 3.243000],
-    'Hf_S': [36.210000, 2.798000],
-    'Ta_S': [40.730000, 2.824000],
-    'W_S': [33.690000, 2.734000],
-    'Re_S': [33.190000, 2.632000],
-    'Os_S': [18.610000, 2.780000],
-    'Ir_S': [36.710000, 2.530000],
-    'Pt_S': [40.230000, 2.454000],
-    'Au_S': [19.610000, 2.934000],
-    'Hg_S': [193.600000, 2.410000],
-    'Tl_S': [341.940000, 3.873000],
-    'Pb_S': [333.390000, 3.828000],
-    'Bi_S': [260.480000, 3.893000],
-    'Po_S': [163.430000, 4.195000],
-    'At_S': [142.810000, 4.232000],
-    'Rn_S': [124.710000, 4.245000],
-    'Ra_S': [203.150000, 3.276000],
-    'Ac_S': [16.590000, 3.099000],
-    'Th_S': [13.070000, 3.025000],
-    'Pa_S': [11.060000, 3.050000],
-    'U_S': [11.060000, 3.025000],
-    'Np_S': [9.550000, 3.050000],
-    'Pu_S': [8.050000, 3.050000],
-    'Am_S': [7.040000, 3.012000],
-    'Cm_S': [6.540000, 2.963000],
-    'Bk_S': [6.540000, 2.975000],
-    'Cf_S': [6.540000, 2.952000],
-    'Es_S': [6.030000, 2.939000],
-    'Fm_S': [6.030000, 2.927000],
-    'Md_S': [5.530000, 2.917000],
-    'No_S': [5.530000, 2.894000],
-    'Lw_S': [5.530000, 2.883000]
-}
+# The registered forcefields, which index like the {type: [epsilon, sigma]} dictionaries they replace
+MOF_LJ = ff.get_forcefield('MOF')
+UFF_LJ = ff.get_forcefield('UFF')
 
 
-def create_config_field(input_file, output_directory=pathlib.Path('/run/'), sorbate_molecules=[sorbates.Nitrogen],
-                        use_cif_hack = False):
-    if use_cif_hack:
+def prepare_framework(input_file, use_cif_hack=False, framework_cache=None, keep_charges=False, charge_tolerance=0.0,
+                      forcefield='UFF', validate=True, cutoff=12):
+    # The framework DLMolecule of create_config_field, which shared_framework.SharedFramework can share between workers
+    sim_title = cif_hack.cif_name(input_file)
+    forcefield = ff.get_forcefield(forcefield)
+    if use_cif_hack and framework_cache is not None:
+        framework = framework_cache.get_atoms(input_file)
+    elif use_cif_hack:
         try:
             placeholder = cif_hack.parse_cif_ase(str(input_file))
             framework = next(placeholder).get_atoms()
@@ -131,19 +32,70 @@ def create_config_field(input_file, output_directory=pathlib.Path('/run/'), sorb
             # framework = read(input_file, store_tags=True)
     else:
         framework = read(input_file, store_tags=True)
-    sim_title = str(input_file.stem)
+
+    if validate:
+        # Fails in milliseconds on a broken structure, rather than after a whole simulation
+        preflight.check_structure(framework, sim_title, check_charges=keep_charges)
+
+    dl_framework = dlm.from_ase(framework, sim_title, forcefield, cutoff=cutoff, keep_charges=keep_charges,
+                                charge_tolerance=charge_tolerance)
+    return dl_framework
+
+
+def molecule_caps(dl_framework, sorbate_molecules, spacing=pores.DEFAULT_SPACING):
+    # The max_molecules of the CONFIG file: the one framework, then room for each sorbate sized from the pores
+    grid = pores.PoreGrid(dl_framework, spacing)
+    return [1, *(pores.molecule_cap(grid.analyse(pores.probe_diameter(sorbate)), sorbate)
+                 for sorbate in sorbate_molecules)]
+
+
+def write_config_field(dl_framework, output_directory, sorbate_molecules=[sorbates.Nitrogen], forcefield='UFF',
+                       precision=dlm.CONFIG_PRECISION, cutoff=12, max_molecules=None):
+    # Only reads dl_framework, so it may be a shared_framework.attach()ed framework
+    sim_title = dl_framework.name
+    output_directory = pathlib.Path(output_directory)
     config_location = output_directory / 'CONFIG'
     field_location = output_directory / 'FIELD'
-
-    dl_framework = dlm.from_ase(framework, sim_title, UFF_LJ)
-    config = dl_framework.make_config_empty_framework()
+    forcefield = ff.get_forcefield(forcefield)
     print(sim_title)
+    if max_molecules is None:
+        max_molecules = molecule_caps(dl_framework, sorbate_molecules)
+        print(f'{sim_title}: room for at most {max_molecules[1:]} sorbate molecules, from the pore volume')
+    # Streamed to the files, so large frameworks are never held in memory as one string
     with open(config_location, 'w') as f:
-        f.write(str(config))
+        dl_framework.write_config_empty_framework(f, max_molecules=max_molecules, precision=precision)
 
     with open(field_location, 'w') as f:
-        f.write(str(dlm.make_field(dl_framework, sorbate_molecules,
-                                   sim_title=f'{sim_title} + {[x.name for x in sorbate_molecules]}')))
+        dlm.write_field(f, dlm.make_field(dl_framework, sorbate_molecules, cutoff=cutoff, forcefield=forcefield,
+                                          sim_title=f'{sim_title} + {[x.name for x in sorbate_molecules]}'))
+
+
+def create_config_field(input_file, output_directory=pathlib.Path('/run/'), sorbate_molecules=[sorbates.Nitrogen],
+                        use_cif_hack = False, framework_cache=None, keep_charges=False, charge_tolerance=0.0,
+                        forcefield='UFF', validate=True, precision=dlm.CONFIG_PRECISION, cutoff=12, input_cache=None,
+                        max_molecules=None):
+    sim_title = cif_hack.cif_name(input_file)
+    output_directory = pathlib.Path(output_directory)
+    forcefield = ff.get_forcefield(forcefield)
+
+    if input_cache is not None:
+        # Everything the files are made from, so a hit skips reading the CIF file too
+        key = input_cache.key(input_file, forcefield, sorbate_molecules, name=sim_title, use_cif_hack=use_cif_hack,
+                              keep_charges=keep_charges, charge_tolerance=charge_tolerance, validate=validate,
+                              precision=precision, cutoff=cutoff, max_molecules=max_molecules)
+        if input_cache.restore(key, output_directory):
+            print(f'{sim_title}: CONFIG and FIELD reused from the input cache entry {input_cache.entry_path(key)}')
+            return
+
+    dl_framework = prepare_framework(input_file, use_cif_hack=use_cif_hack, framework_cache=framework_cache,
+                                     keep_charges=keep_charges, charge_tolerance=charge_tolerance,
+                                     forcefield=forcefield, validate=validate, cutoff=cutoff)
+    write_config_field(dl_framework, output_directory, sorbate_molecules, forcefield=forcefield,
+                       precision=precision, cutoff=cutoff, max_molecules=max_molecules)
+
+    if input_cache is not None:
+        input_cache.store(key, output_directory)
+        print(f'{sim_title}: CONFIG and FIELD stored in the input cache entry {input_cache.entry_path(key)}')
 
 
 if __name__ == "__main__":
@@ -6,22 +6,35 @@ global blocks, nested loops and multi-data values are not supported.
 The "latin-1" encoding is required by the IUCR specification.
 """
 
+import bz2
+import gzip
 import io
+import itertools
+import lzma
+import mmap
+import pathlib
 import re
 import shlex
+import tarfile
 import warnings
-from typing import Dict, List, Tuple, Optional, Union, Iterator, Any, Sequence
+import zipfile
+from typing import (Dict, List, Tuple, Optional, Union, Iterator, Any,
+                    Sequence, Mapping)
 import collections.abc
+import functools
 
 import numpy as np
 
 from ase import Atoms
+from ase.data import chemical_symbols
 from ase.cell import Cell
 from ase.spacegroup import crystal
 from ase.spacegroup.spacegroup import spacegroup_from_data, Spacegroup
 from ase.io.cif_unicode import format_unicode, handle_subscripts
 from ase.utils import iofunction
 
+import symmetry
+
 
 rhombohedral_spacegroups = {146, 148, 155, 160, 161, 166, 167}
 
@@ -36,6 +49,52 @@ old_spacegroup_names = {'Abm2': 'Aem2',
 CIFDataValue = Union[str, int, float]
 CIFData = Union[CIFDataValue, List[CIFDataValue]]
 
+# Precompiled patterns for the single-pass 'fast' reader.  _VALUE_RE folds
+# the chain of matches in convert_value() into a single match, and
+# _LOOP_TOKEN_RE splits loop rows the same way as shlex.split(posix=False).
+_VALUE_RE = re.compile(
+    r'(?P<quoted>".*"|\'.*\'$)'
+    r'|(?P<int>[+-]?\d+$)'
+    r'|(?P<number>[+-]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?)'
+    r'(?:(?P<esd>\(\d+\))|(?P<badesd>\(\d+))?$')
+_LOOP_TOKEN_RE = re.compile(r''''[^']*'|"[^"]*"|[^ \t\r\n'"][^ \t\r\n]*|['"]''')
+_CIF2_MAGIC_RE = re.compile(r'\n*#\\#CIF_2\.0[^\S\n]*(?:\n|$)')
+
+# Patterns for converting whole loop columns at once; they are applied to
+# the newline-joined tokens of a column rather than to each token.
+_NON_NUMERIC_CHAR_RE = re.compile(r'[^0-9+\-.eE()\n]')
+_FLOAT_CHAR_RE = re.compile(r'[.eE()]')
+_ESD_RE = re.compile(r'\([0-9]+\)')
+_MAYBE_CONVERTED_RE = re.compile(r'\n[-+.\d\'"]')
+
+# Start of a data block, or of a text field that may hide 'data_' lines; the
+# patterns are compiled for both str and bytes (memory-mapped) input.
+_BLOCK_START_PATTERN = r'^[^\S\n]*(?:(?P<data>[dD][aA][tT][aA]_)|;)'
+_TEXT_FIELD_END_PATTERN = r'^[^\S\n]*;'
+_BLOCK_START_RE = {str: re.compile(_BLOCK_START_PATTERN, re.M),
+                   bytes: re.compile(_BLOCK_START_PATTERN.encode(), re.M)}
+_TEXT_FIELD_END_RE = {str: re.compile(_TEXT_FIELD_END_PATTERN, re.M),
+                      bytes: re.compile(_TEXT_FIELD_END_PATTERN.encode(),
+                                        re.M)}
+
+# Compressed CIF files are recognised by their magic bytes rather than their
+# suffix; members of tar and zip archives are addressed as 'archive::member'.
+_COMPRESSED_MAGIC = {b'\x1f\x8b': gzip,
+                     b'\xfd7zXZ\x00': lzma,
+                     b'BZh': bz2}
+ARCHIVE_SEPARATOR = '::'
+CIF_SUFFIXES = ('.cif', '.cif.gz', '.cif.xz', '.cif.bz2')
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.xz', '.txz',
+                    '.tar.bz2', '.tbz2')
+
+# Rows of a loop formatted and written at a time by CIFLoop.write()
+CIF_WRITE_CHUNKSIZE = 10000
+
+# First line that ends the data rows of a loop (or opens a text field, which
+# has to be skipped explicitly); used to index loops without tokenizing them.
+_LOOP_DATA_END_RE = re.compile(
+    r'^[^\S\n]*(?:[_;]|(?i:loop_|data_))|^[^\S\n]+$', re.M)
+
 
 def convert_value(value: str) -> CIFDataValue:
     """Convert CIF value string to corresponding python type."""
@@ -202,15 +261,71 @@ class NoStructureData(RuntimeError):
     pass
 
 
+@functools.lru_cache(maxsize=256)
+def compiled_spacegroup(no: Optional[int], hm_symbol: Optional[str], sitesym: Optional[Tuple[str, ...]],
+                        subtrans_included: bool, setting_std: Optional[int],
+                        setting_name: Optional[str]) -> Tuple[Spacegroup, symmetry.SymmetryOperations]:
+    """Returns the Spacegroup and compiled symmetry operations described by
+    the symmetry tags of a CIF block, see CIFBlock.get_spacegroup().
+
+    Results are cached for the whole process, so blocks sharing a space
+    group and symop list reuse them.  Use compiled_spacegroup.cache_info()
+    for hit/miss counts and compiled_spacegroup.cache_clear() to reset.
+    Warnings about the setting are only issued on a cache miss."""
+    # XXX The logic in this function needs serious cleaning up!
+    # The setting needs to be passed as either 1 or two, not None (default)
+    setting = 1
+    spacegroup = 1
+    if sitesym is not None:
+        subtrans = [(0.0, 0.0, 0.0)] if subtrans_included else None
+        spacegroup = spacegroup_from_data(
+            no=no, symbol=hm_symbol, sitesym=list(sitesym), subtrans=subtrans,
+            setting=setting)
+    elif no is not None:
+        spacegroup = no
+    elif hm_symbol is not None:
+        spacegroup = hm_symbol
+    else:
+        spacegroup = 1
+
+    if setting_std is not None:
+        setting = setting_std
+
+    if setting_name:
+        no = Spacegroup(spacegroup).no
+        if no in rhombohedral_spacegroups:
+            if setting_name == 'hexagonal':
+                setting = 1
+            elif setting_name in ('trigonal', 'rhombohedral'):
+                setting = 2
+            else:
+                warnings.warn(
+                    'unexpected crystal system %r for space group %r' % (
+                        setting_name, spacegroup))
+        # FIXME - check for more crystal systems...
+        else:
+            warnings.warn(
+                'crystal system %r is not interpreted for space group %r. '
+                'This may result in wrong setting!' % (
+                    setting_name, spacegroup))
+
+    spg = Spacegroup(spacegroup, setting)
+    if no is not None:
+        assert int(spg) == no, (int(spg), no)
+    return spg, symmetry.SymmetryOperations.from_spacegroup(spg)
+
+
 class CIFBlock(collections.abc.Mapping):
     """A block (i.e., a single system) in a crystallographic information file.
 
-    Use this object to query CIF tags or import information as ASE objects."""
+    Use this object to query CIF tags or import information as ASE objects.
+    *tags* may be a dict or any mapping, such as the LazyCIFTags made by
+    the `lazy` reader."""
 
     cell_tags = ['_cell_length_a', '_cell_length_b', '_cell_length_c',
                  '_cell_angle_alpha', '_cell_angle_beta', '_cell_angle_gamma']
 
-    def __init__(self, name: str, tags: Dict[str, CIFData]):
+    def __init__(self, name: str, tags: Mapping[str, CIFData]):
         self.name = name
         self._tags = tags
 
@@ -221,6 +336,9 @@ class CIFBlock(collections.abc.Mapping):
     def __getitem__(self, key: str) -> CIFData:
         return self._tags[key]
 
+    def __contains__(self, key) -> bool:
+        return key in self._tags
+
     def __iter__(self) -> Iterator[str]:
         return iter(self._tags)
 
@@ -230,6 +348,16 @@ class CIFBlock(collections.abc.Mapping):
     def get(self, key, default=None):
         return self._tags.get(key, default)
 
+    def get_array(self, key, dtype=float) -> Optional[np.ndarray]:
+        """Return a loop column as a NumPy array, or None if it is missing.
+
+        Numeric columns read with the 'fast' reader are stored as arrays
+        already and are returned without copying."""
+        value = self.get(key)
+        if value is None:
+            return None
+        return np.asarray(value, dtype=dtype)
+
     def get_cellpar(self) -> Optional[List]:
         try:
             return [self[tag] for tag in self.cell_tags]
@@ -243,22 +371,22 @@ class CIFBlock(collections.abc.Mapping):
         return Cell.new(cellpar)
 
     def _raw_scaled_positions(self) -> Optional[np.ndarray]:
-        coords = [self.get(name) for name in ['_atom_site_fract_x',
-                                              '_atom_site_fract_y',
-                                              '_atom_site_fract_z']]
+        coords = [self.get_array(name) for name in ['_atom_site_fract_x',
+                                                    '_atom_site_fract_y',
+                                                    '_atom_site_fract_z']]
         # XXX Shall we try to handle mixed coordinates?
         # (Some scaled vs others fractional)
-        if None in coords:
+        if any(coord is None for coord in coords):
             return None
-        return np.array(coords).T
+        return np.stack(coords, axis=1)
 
     def _raw_positions(self) -> Optional[np.ndarray]:
-        coords = [self.get('_atom_site_cartn_x'),
-                  self.get('_atom_site_cartn_y'),
-                  self.get('_atom_site_cartn_z')]
-        if None in coords:
+        coords = [self.get_array('_atom_site_cartn_x'),
+                  self.get_array('_atom_site_cartn_y'),
+                  self.get_array('_atom_site_cartn_z')]
+        if any(coord is None for coord in coords):
             return None
-        return np.array(coords).T
+        return np.stack(coords, axis=1)
 
     def _get_site_coordinates(self):
         scaled = self._raw_scaled_positions()
@@ -353,60 +481,26 @@ class CIFBlock(collections.abc.Mapping):
                 f'Spacegroup setting must be 1 or 2, not {setting}')
         return setting
 
-    def get_spacegroup(self, subtrans_included) -> Spacegroup:
-        # XXX The logic in this method needs serious cleaning up!
-        # The setting needs to be passed as either 1 or two, not None (default)
-        no = self._get_spacegroup_number()
-        hm_symbol = self._get_spacegroup_name()
+    def _get_symmetry(self, subtrans_included) -> Tuple[Spacegroup, symmetry.SymmetryOperations]:
         sitesym = self._get_sitesym()
-
-        setting = 1
-        spacegroup = 1
         if sitesym is not None:
-            subtrans = [(0.0, 0.0, 0.0)] if subtrans_included else None
-            spacegroup = spacegroup_from_data(
-                no=no, symbol=hm_symbol, sitesym=sitesym, subtrans=subtrans,
-                setting=setting)
-        elif no is not None:
-            spacegroup = no
-        elif hm_symbol is not None:
-            spacegroup = hm_symbol
-        else:
-            spacegroup = 1
+            # Normalized so that differently spaced or cased symop tables share a cache entry
+            sitesym = tuple(''.join(op.split()).lower() for op in sitesym)
 
         setting_std = self._get_setting()
-
         setting_name = None
         if '_symmetry_space_group_setting' in self:
             assert setting_std is not None
-            setting = setting_std
         elif '_space_group_crystal_system' in self:
             setting_name = self['_space_group_crystal_system']
         elif '_symmetry_cell_setting' in self:
             setting_name = self['_symmetry_cell_setting']
 
-        if setting_name:
-            no = Spacegroup(spacegroup).no
-            if no in rhombohedral_spacegroups:
-                if setting_name == 'hexagonal':
-                    setting = 1
-                elif setting_name in ('trigonal', 'rhombohedral'):
-                    setting = 2
-                else:
-                    warnings.warn(
-                        'unexpected crystal system %r for space group %r' % (
-                            setting_name, spacegroup))
-            # FIXME - check for more crystal systems...
-            else:
-                warnings.warn(
-                    'crystal system %r is not interpreted for space group %r. '
-                    'This may result in wrong setting!' % (
-                        setting_name, spacegroup))
+        return compiled_spacegroup(self._get_spacegroup_number(), self._get_spacegroup_name(), sitesym,
+                                   bool(subtrans_included), setting_std, setting_name)
 
-        spg = Spacegroup(spacegroup, setting)
-        if no is not None:
-            assert int(spg) == no, (int(spg), no)
-        return spg
+    def get_spacegroup(self, subtrans_included) -> Spacegroup:
+        return self._get_symmetry(subtrans_included)[0]
 
     def get_unsymmetrized_structure(self) -> Atoms:
         """Return Atoms without symmetrizing coordinates.
@@ -443,7 +537,8 @@ class CIFBlock(collections.abc.Mapping):
             return True
 
     def get_atoms(self, store_tags=False, primitive_cell=False,
-                  subtrans_included=True, fractional_occupancies=True) -> Atoms:
+                  subtrans_included=True, fractional_occupancies=True,
+                  expansion='compiled') -> Atoms:
         """Returns an Atoms object from a cif tags dictionary.  See read_cif()
         for a description of the arguments."""
         if primitive_cell and subtrans_included:
@@ -457,7 +552,7 @@ class CIFBlock(collections.abc.Mapping):
 
         kwargs: Dict[str, Any] = {}
         if store_tags:
-            kwargs['info'] = self._tags.copy()
+            kwargs['info'] = dict(self._tags)
 
         if fractional_occupancies:
             occupancies = self._get_fractional_occupancies()
@@ -474,13 +569,19 @@ class CIFBlock(collections.abc.Mapping):
         unsymmetrized_structure = self.get_unsymmetrized_structure()
 
         if cell.rank == 3:
-            spacegroup = self.get_spacegroup(subtrans_included)
-            atoms = crystal(unsymmetrized_structure,
-                            spacegroup=spacegroup,
-                            setting=spacegroup.setting,
-                            occupancies=occupancies,
-                            primitive_cell=primitive_cell,
-                            **kwargs)
+            spacegroup, operations = self._get_symmetry(subtrans_included)
+            if expansion == 'compiled':
+                expand = functools.partial(symmetry.crystal, operations=operations)
+            elif expansion == 'ase':
+                expand = crystal
+            else:
+                raise ValueError('No such symmetry expansion: {}'.format(expansion))
+            atoms = expand(unsymmetrized_structure,
+                           spacegroup=spacegroup,
+                           setting=spacegroup.setting,
+                           occupancies=occupancies,
+                           primitive_cell=primitive_cell,
+                           **kwargs)
         else:
             atoms = unsymmetrized_structure
             if kwargs.get('info') is not None:
@@ -505,29 +606,145 @@ def parse_block(lines: List[str], line: str) -> CIFBlock:
 def parse_cif(fileobj, reader='ase') -> Iterator[CIFBlock]:
     if reader == 'ase':
         return parse_cif_ase(fileobj)
+    elif reader == 'fast':
+        return parse_cif_fast(fileobj)
+    elif reader == 'lazy':
+        return parse_cif_fast(fileobj, lazy=True)
     elif reader == 'pycodcif':
         return parse_cif_pycodcif(fileobj)
     else:
         raise ValueError(f'No such reader: {reader}')
 
 
-def parse_cif_ase(fileobj) -> Iterator[CIFBlock]:
-    """Parse a CIF file using ase CIF parser."""
+def _compression(head):
+    """Return the module (gzip, lzma or bz2) that decompresses data starting
+    with the bytes *head*, or None for uncompressed data."""
+    if isinstance(head, (bytes, bytearray, mmap.mmap)):
+        for magic, module in _COMPRESSED_MAGIC.items():
+            if head[:len(magic)] == magic:
+                return module
+    return None
+
 
+def decompress_cif(data: bytes) -> bytes:
+    """Return the contents of a CIF file read as bytes, decompressing them
+    if they are gzip, xz or bz2 compressed."""
+    module = _compression(data)
+    return module.decompress(data) if module else data
+
+
+def open_cif(path):
+    """Open a CIF file for reading bytes.
+
+    gzip, xz and bz2 compressed files are decompressed on the fly.  A path
+    of the form 'archive::member' reads a member of a tar or zip archive
+    (tar archives may themselves be compressed) without extracting it."""
+    path = str(path)
+    if ARCHIVE_SEPARATOR in path:
+        archive, member = path.split(ARCHIVE_SEPARATOR, 1)
+        if zipfile.is_zipfile(archive):
+            with zipfile.ZipFile(archive) as zf:
+                data = zf.read(member)
+        else:
+            with tarfile.open(archive, 'r:*') as tf:
+                data = tf.extractfile(member).read()
+        return io.BytesIO(decompress_cif(data))
+
+    with open(path, 'rb') as fd:
+        module = _compression(fd.read(6))
+    if module is not None:
+        return module.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def is_cif_name(name) -> bool:
+    """Whether a file or member name looks like a (compressed) CIF file."""
+    return str(name).lower().endswith(CIF_SUFFIXES)
+
+
+def is_cif_archive(name) -> bool:
+    """Whether a file name looks like a tar or zip archive."""
+    return str(name).lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def cif_name(path) -> str:
+    """The framework name of a CIF path or archive member path, i.e. its
+    file name without the CIF and compression suffixes."""
+    name = pathlib.PurePosixPath(str(path).split(ARCHIVE_SEPARATOR)[-1]).name
+    for suffix in sorted(CIF_SUFFIXES, key=len, reverse=True):
+        if name.lower().endswith(suffix):
+            return name[:-len(suffix)]
+    return pathlib.PurePath(name).stem
+
+
+def iter_cif_archive(path) -> Iterator[Tuple[str, bytes]]:
+    """Yield the name and raw (possibly compressed) contents of every CIF
+    member of a tar or zip archive, reading the archive once, in order."""
+    path = str(path)
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as zf:
+            for info in zf.infolist():
+                if not info.is_dir() and is_cif_name(info.filename):
+                    yield info.filename, zf.read(info)
+    else:
+        # Stream mode, so compressed tar archives are decompressed only once
+        with tarfile.open(path, 'r|*') as tf:
+            for info in tf:
+                if info.isfile() and is_cif_name(info.name):
+                    yield info.name, tf.extractfile(info).read()
+
+
+def find_cif(folder, name) -> Optional[str]:
+    """Return the path of the CIF file for framework *name* in *folder*:
+    name.cif, a compressed name.cif.gz/.xz/.bz2, or else an
+    'archive::member' path to such a file inside a tar or zip archive in
+    *folder*.  Return None if there is none."""
+    folder = pathlib.Path(folder)
+    for suffix in CIF_SUFFIXES:
+        path = folder / (name + suffix)
+        if path.is_file():
+            return str(path)
+
+    for archive in sorted(folder.iterdir()):
+        if not archive.is_file() or not is_cif_archive(archive.name):
+            continue
+        if zipfile.is_zipfile(archive):
+            with zipfile.ZipFile(archive) as zf:
+                members = zf.namelist()
+        else:
+            with tarfile.open(archive, 'r:*') as tf:
+                members = tf.getnames()
+        for member in members:
+            if is_cif_name(member) and cif_name(member) == name:
+                return f'{archive}{ARCHIVE_SEPARATOR}{member}'
+    return None
+
+
+def _read_cif_text(fileobj) -> str:
+    """Read a whole CIF file and return its decoded, unicode-formatted text."""
     if isinstance(fileobj, str):
-        with open(fileobj, 'rb') as fileobj:
+        with open_cif(fileobj) as fileobj:
             data = fileobj.read()
     else:
         data = fileobj.read()
 
+    module = _compression(data)
+    if module is not None:
+        data = module.decompress(data)
     if isinstance(data, bytes):
         data = data.decode('latin1')
     data = format_unicode(data)
-    lines = [e for e in data.split('\n') if len(e) > 0]
-    if len(lines) > 0 and lines[0].rstrip() == '#\\#CIF_2.0':
+    if _CIF2_MAGIC_RE.match(data):
         warnings.warn('CIF v2.0 file format detected; `ase` CIF reader might '
                       'incorrectly interpret some syntax constructions, use '
                       '`pycodcif` reader instead')
+    return data
+
+
+def parse_cif_ase(fileobj) -> Iterator[CIFBlock]:
+    """Parse a CIF file using ase CIF parser."""
+    data = _read_cif_text(fileobj)
+    lines = [e for e in data.split('\n') if len(e) > 0]
     lines = [''] + lines[::-1]    # all lines (reversed)
 
     while lines:
@@ -538,6 +755,346 @@ def parse_cif_ase(fileobj) -> Iterator[CIFBlock]:
         yield parse_block(lines, line)
 
 
+def _handle_subscripts(value: str) -> str:
+    # handle_subscripts() walks the string twice character by character;
+    # skip that for the vast majority of values without any markup.
+    if '~' in value or '^' in value:
+        return handle_subscripts(value)
+    return value
+
+
+def convert_token(value: str) -> CIFDataValue:
+    """Convert a stripped CIF value string to the corresponding python type.
+
+    Gives the same results as convert_value() with a single regex match."""
+    match = _VALUE_RE.match(value)
+    if match is None:
+        return _handle_subscripts(value)
+    kind = match.lastgroup
+    if kind == 'quoted':
+        return _handle_subscripts(value[1:-1])
+    elif kind == 'int':
+        return int(value)
+    elif kind == 'badesd':
+        warnings.warn('Badly formed number: "{0}"'.format(value))
+    return float(match.group('number'))
+
+
+def convert_column(tokens: List[str]) -> Union[np.ndarray, List[CIFDataValue]]:
+    """Convert a column of CIF loop tokens in bulk.
+
+    Columns holding only numbers, with or without uncertainties in
+    parentheses, become int64 or float64 arrays.  Columns of plain strings
+    are returned as they are; anything else is converted token by token."""
+    if not tokens:
+        return []
+    joined = '\n'.join(tokens)
+    if not _NON_NUMERIC_CHAR_RE.search(joined):
+        try:
+            if not _FLOAT_CHAR_RE.search(joined):
+                return np.array(tokens, dtype=np.int64)
+            if '(' in joined:
+                joined = _ESD_RE.sub('', joined)
+                if '(' in joined or ')' in joined:
+                    # Badly formed uncertainties are warned about below
+                    raise ValueError(joined)
+                tokens = joined.split('\n')
+            return np.array(tokens, dtype=np.float64)
+        except (ValueError, OverflowError):
+            pass
+    elif ('~' not in joined and '^' not in joined and
+          not _MAYBE_CONVERTED_RE.search('\n' + joined)):
+        return tokens
+    return [convert_token(token) for token in tokens]
+
+
+class CIFScanner:
+    """Forward-only line cursor over the text of a CIF file.
+
+    Empty lines are skipped, as in the line list of parse_cif_ase().  Callers
+    that need to 'undo' a read store ``pos`` beforehand and restore it."""
+
+    __slots__ = ('text', 'pos', 'size')
+
+    def __init__(self, text: str, pos: int = 0):
+        self.text = text
+        self.pos = pos
+        self.size = len(text)
+
+    def readline(self) -> Optional[str]:
+        """Return the next non-empty raw line, or None at the end of text."""
+        text = self.text
+        while self.pos < self.size:
+            end = text.find('\n', self.pos)
+            if end < 0:
+                end = self.size
+            line = text[self.pos:end]
+            self.pos = end + 1
+            if line:
+                return line
+        return None
+
+
+def scan_multiline_string(scanner: CIFScanner, line: str) -> str:
+    """Scan semicolon-enclosed multiline string and return it."""
+    assert line[0] == ';'
+    strings = [line[1:].lstrip()]
+    while True:
+        raw = scanner.readline()
+        if raw is None:
+            raise ValueError('CIF text field ended unexpectedly')
+        line = raw.strip()
+        if line[:1] == ';':
+            break
+        strings.append(line)
+    return '\n'.join(strings).strip()
+
+
+def scan_singletag(scanner: CIFScanner,
+                   line: str) -> Tuple[str, CIFDataValue]:
+    """Scan a CIF tag and its value.  Returns a key-value pair."""
+    kv = line.split(None, 1)
+    if len(kv) == 1:
+        key = line
+        while True:
+            raw = scanner.readline()
+            if raw is None:
+                raise ValueError('No value for CIF tag "{0}"'.format(key))
+            value = raw.strip()
+            if value and value[0] != '#':
+                break
+        if value[0] == ';':
+            value = scan_multiline_string(scanner, value)
+    else:
+        key, value = kv
+    return key, convert_token(value)
+
+
+def split_loop_line(line: str) -> List[str]:
+    tokens = _LOOP_TOKEN_RE.findall(line)
+    if "'" in tokens or '"' in tokens:
+        raise ValueError('No closing quotation')
+    return tokens
+
+
+def scan_loop_headers(scanner: CIFScanner) -> List[str]:
+    headers = []
+    while True:
+        mark = scanner.pos
+        raw = scanner.readline()
+        if raw is None:
+            break
+        line = raw.lstrip()
+        if line[:1] == '_':
+            headers.append(line.split(None, 1)[0].lower())
+        elif line[:1] != '#':
+            scanner.pos = mark
+            break
+    return headers
+
+
+def scan_loop(scanner: CIFScanner) -> Dict[str, CIFData]:
+    """Scan a CIF loop. Returns a dict with column tag names as keys
+    and the column content as values.
+
+    The loop is tokenized once and each column is converted as a whole with
+    convert_column(), so numeric columns come back as NumPy arrays."""
+    headers = scan_loop_headers(scanner)
+    ncolumns = len(headers)
+    values: List[str] = []
+    tokens: List[str] = []
+    has_text_fields = False
+    while True:
+        mark = scanner.pos
+        raw = scanner.readline()
+        if raw is None:
+            break
+        line = raw.strip()
+        if (not line or line[0] == '_' or
+                line[:5].lower() in ('data_', 'loop_')):
+            scanner.pos = mark
+            break
+
+        first = line[0]
+        if first == '#':
+            continue
+        elif first == ';':
+            tokens.append(scan_multiline_string(scanner, line))
+            has_text_fields = True
+        elif ncolumns == 1:
+            tokens.append(line)
+        else:
+            tokens += split_loop_line(line)
+
+        if len(tokens) < ncolumns:
+            continue
+        if len(tokens) == ncolumns:
+            values += tokens
+        else:
+            warnings.warn('Wrong number {} of tokens, expected {}: {}'
+                          .format(len(tokens), ncolumns, tokens))
+        tokens = []
+
+    if tokens:
+        raise RuntimeError('CIF loop ended unexpectedly with incomplete row')
+
+    columns_dict = {}
+    for i, header in enumerate(headers):
+        if header in columns_dict:
+            warnings.warn('Duplicated loop tags: {0}'.format(header))
+        elif has_text_fields:
+            # Multiline values would confuse the newline-joined column checks
+            columns_dict[header] = [convert_token(token)
+                                    for token in values[i::ncolumns]]
+        else:
+            columns_dict[header] = convert_column(values[i::ncolumns])
+    return columns_dict
+
+
+def scan_items(scanner: CIFScanner) -> Dict[str, CIFData]:
+    """Scan CIF data items up to the next data block and return a dict
+    with all tags."""
+    tags: Dict[str, CIFData] = {}
+
+    while True:
+        mark = scanner.pos
+        raw = scanner.readline()
+        if raw is None:
+            break
+        line = raw.strip()
+        if not line or line[0] == '#':
+            continue
+        first = line[0]
+        lowerstart = line[:5].lower()
+        if first == '_':
+            key, value = scan_singletag(scanner, line)
+            tags[key.lower()] = value
+        elif lowerstart == 'loop_':
+            tags.update(scan_loop(scanner))
+        elif lowerstart == 'data_':
+            scanner.pos = mark
+            break
+        elif first == ';':
+            scan_multiline_string(scanner, line)
+        else:
+            raise ValueError('Unexpected CIF file entry: "{0}"'.format(line))
+    return tags
+
+
+def skip_loop_data(scanner: CIFScanner) -> None:
+    """Move the scanner past the data rows of a loop without reading them."""
+    text = scanner.text
+    while True:
+        match = _LOOP_DATA_END_RE.search(text, scanner.pos)
+        if match is None:
+            scanner.pos = scanner.size
+            return
+        scanner.pos = match.start()
+        line = scanner.readline().strip()
+        if line[:1] != ';':
+            scanner.pos = match.start()
+            return
+        scan_multiline_string(scanner, line)
+
+
+def index_items(scanner: CIFScanner) -> Dict[str, Tuple[int, bool]]:
+    """Index CIF data items up to the next data block without decoding them.
+
+    Returns a dict mapping each tag to the offset of its line, or for loop
+    columns to the offset of the loop headers, and whether it is a loop."""
+    index: Dict[str, Tuple[int, bool]] = {}
+
+    while True:
+        mark = scanner.pos
+        raw = scanner.readline()
+        if raw is None:
+            break
+        line = raw.strip()
+        if not line or line[0] == '#':
+            continue
+        first = line[0]
+        lowerstart = line[:5].lower()
+        if first == '_':
+            kv = line.split(None, 1)
+            if len(kv) == 1:
+                scan_singletag(scanner, line)
+            index[kv[0].lower()] = (mark, False)
+        elif lowerstart == 'loop_':
+            offset = scanner.pos
+            for header in scan_loop_headers(scanner):
+                index[header] = (offset, True)
+            skip_loop_data(scanner)
+        elif lowerstart == 'data_':
+            scanner.pos = mark
+            break
+        elif first == ';':
+            scan_multiline_string(scanner, line)
+        else:
+            raise ValueError('Unexpected CIF file entry: "{0}"'.format(line))
+    return index
+
+
+class LazyCIFTags(collections.abc.Mapping):
+    """Tags of one CIF data block, decoded from the text on first access.
+
+    Single tags are decoded one by one; a loop is decoded as a whole the
+    first time any of its columns is looked up."""
+
+    def __init__(self, text: str, index: Dict[str, Tuple[int, bool]]):
+        self._text = text
+        self._index = index
+        self._decoded: Dict[int, Any] = {}
+
+    def __getitem__(self, key: str) -> CIFData:
+        offset, is_loop = self._index[key]
+        try:
+            value = self._decoded[offset]
+        except KeyError:
+            scanner = CIFScanner(self._text, offset)
+            if is_loop:
+                value = scan_loop(scanner)
+            else:
+                _, value = scan_singletag(scanner, scanner.readline().strip())
+            self._decoded[offset] = value
+        return value[key] if is_loop else value
+
+    def __contains__(self, key) -> bool:
+        return key in self._index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+
+def parse_cif_fast(fileobj, lazy=False) -> Iterator[CIFBlock]:
+    """Parse a CIF file using the single-pass tokenizing CIF parser.
+
+    Produces the same blocks as parse_cif_ase(), but walks the text forward
+    once and converts each value with a single precompiled match.
+
+    If *lazy* is true, each block is only indexed on a first cheap scan
+    and tags or loops are decoded when they are looked up, so tags which
+    are never used (citations, bonds, ...) are never converted."""
+    text = _read_cif_text(fileobj)
+    scanner = CIFScanner(text)
+
+    while True:
+        raw = scanner.readline()
+        if raw is None:
+            break
+        line = raw.strip()
+        if not line or line[0] == '#':
+            continue
+        assert line.lower().startswith('data_')
+        blockname = line.split('_', 1)[1].rstrip()
+        if lazy:
+            yield CIFBlock(blockname, LazyCIFTags(text, index_items(scanner)))
+        else:
+            yield CIFBlock(blockname, scan_items(scanner))
+
+
 def parse_cif_pycodcif(fileobj) -> Iterator[CIFBlock]:
     """Parse a CIF file using pycodcif CIF parser."""
     if not isinstance(fileobj, str):
@@ -563,9 +1120,165 @@ def parse_cif_pycodcif(fileobj) -> Iterator[CIFBlock]:
         yield CIFBlock(datablock['name'], tags)
 
 
+class CIFCollection:
+    """Streaming, random-access reader for files holding many CIF blocks.
+
+    The file is memory-mapped and only searched for the lines that start
+    data blocks; a block is decoded and parsed with *reader* only when it
+    is iterated over or looked up by position or name::
+
+        with CIFCollection('CoRE_MOFs.cif') as collection:
+            block = collection['Cu-BTC']
+            for block in collection:
+                ...
+
+    Compressed files and file objects without a file descriptor are read
+    into memory instead; see open_cif() for the paths accepted."""
+
+    def __init__(self, fileobj, reader='lazy'):
+        if reader not in ('ase', 'fast', 'lazy'):
+            raise ValueError(f'No such reader for CIF collections: {reader}')
+        self.reader = reader
+        self._file = None
+        self._map = None
+        self._blocks: Optional[List[Tuple[int, int, str]]] = None
+        self._names: Optional[Dict[str, int]] = None
+
+        if isinstance(fileobj, str):
+            fileobj = self._file = open_cif(fileobj)
+        try:
+            if not isinstance(fileobj, (io.BufferedReader, io.FileIO)):
+                # The descriptor of a decompressing reader is that of the compressed file
+                raise io.UnsupportedOperation
+            self._map = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+            self._data = self._map
+        except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+            # No file descriptor (e.g. io.BytesIO, compressed files), or an empty file
+            self._data = fileobj.read()
+        module = _compression(self._data[:6])
+        if module is not None:
+            # A compressed file object passed in directly; decompressed into memory
+            self._data = module.decompress(self._data)
+        self._kind = str if isinstance(self._data, str) else bytes
+
+        head = self._data[:256]
+        if isinstance(head, bytes):
+            head = head.decode('latin1')
+        if _CIF2_MAGIC_RE.match(format_unicode(head)):
+            warnings.warn('CIF v2.0 file format detected; `ase` CIF reader '
+                          'might incorrectly interpret some syntax '
+                          'constructions, use `pycodcif` reader instead')
+
+    def __enter__(self) -> 'CIFCollection':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _decode(self, chunk) -> str:
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode('latin1')
+        return chunk
+
+    def _scan_blocks(self) -> Iterator[Tuple[int, int, str]]:
+        """Yield the (start, end, name) of each data block in the file."""
+        data = self._data
+        newline = '\n' if self._kind is str else b'\n'
+        block_start = _BLOCK_START_RE[self._kind]
+        text_field_end = _TEXT_FIELD_END_RE[self._kind]
+
+        start, name = None, None
+        pos = 0
+        while True:
+            match = block_start.search(data, pos)
+            if match is None:
+                break
+            line_end = data.find(newline, match.end())
+            if line_end < 0:
+                line_end = len(data)
+            if match.group('data') is None:
+                # Skip the text field, whatever its lines start with
+                close = text_field_end.search(data, line_end + 1)
+                if close is None:
+                    break
+                pos = close.end()
+                continue
+            if start is not None:
+                yield start, match.start(), name
+            start = match.start()
+            name = format_unicode(
+                self._decode(data[match.end():line_end])).rstrip()
+            pos = line_end + 1
+        if start is not None:
+            yield start, len(data), name
+
+    def _index(self) -> List[Tuple[int, int, str]]:
+        if self._blocks is None:
+            self._blocks = list(self._scan_blocks())
+            self._names = {}
+            for i, (_, _, name) in enumerate(self._blocks):
+                self._names.setdefault(name, i)
+        return self._blocks
+
+    def _parse(self, start: int, end: int) -> CIFBlock:
+        chunk = self._data[start:end]
+        if isinstance(chunk, bytes):
+            chunk = io.BytesIO(chunk)
+        else:
+            chunk = io.StringIO(chunk)
+        return next(parse_cif(chunk, self.reader))
+
+    def names(self) -> List[str]:
+        """Return the names of all data blocks, in file order."""
+        return [name for _, _, name in self._index()]
+
+    def __len__(self) -> int:
+        return len(self._index())
+
+    def __getitem__(self, key: Union[int, str]) -> CIFBlock:
+        blocks = self._index()
+        if isinstance(key, str):
+            try:
+                key = self._names[key]
+            except KeyError:
+                raise KeyError(f'No CIF block named {key!r}') from None
+        start, end, _ = blocks[key]
+        return self._parse(start, end)
+
+    def __iter__(self) -> Iterator[CIFBlock]:
+        blocks = self._blocks if self._blocks is not None \
+            else self._scan_blocks()
+        for start, end, _ in blocks:
+            yield self._parse(start, end)
+
+
+def _select(blocks: Iterator[CIFBlock], index) -> Iterator[CIFBlock]:
+    """Select blocks like list(blocks)[index], without building the list
+    when the index does not count from the end."""
+    if index is None:
+        index = slice(None)
+    if isinstance(index, slice):
+        if all(i is None or i >= 0
+               for i in (index.start, index.stop, index.step)):
+            return itertools.islice(blocks, index.start, index.stop,
+                                    index.step)
+        return iter(list(blocks)[index])
+    if index >= 0:
+        return itertools.islice(blocks, index, index + 1)
+    return iter([list(blocks)[index]])
+
+
 def read_cif(fileobj, index, store_tags=False, primitive_cell=False,
              subtrans_included=True, fractional_occupancies=True,
-             reader='ase') -> Iterator[Atoms]:
+             reader='ase', expansion='compiled') -> Iterator[Atoms]:
     """Read Atoms object from CIF file. *index* specifies the data
     block number or name (if string) to return.
 
@@ -573,6 +1286,10 @@ def read_cif(fileobj, index, store_tags=False, primitive_cell=False,
     be returned. In the case of *index* is *None* or *slice(None)*,
     only blocks with valid crystal data will be included.
 
+    Except for the `pycodcif` reader, the file is read through a
+    CIFCollection: blocks are parsed one at a time, only as far as the
+    index requires, and only the selected blocks are turned into Atoms.
+
     If *store_tags* is true, the *info* attribute of the returned
     Atoms object will be populated with all tags in the corresponding
     cif data block.
@@ -597,23 +1314,43 @@ def read_cif(fileobj, index, store_tags=False, primitive_cell=False,
     that of the most dominant species.
 
     String *reader* is used to select CIF reader. Value `ase` selects
-    built-in CIF reader (default), while `pycodcif` selects CIF reader based
-    on `pycodcif` package.
+    built-in CIF reader (default), `fast` selects the single-pass tokenizing
+    reader, `lazy` the same reader decoding tags only when they are needed,
+    while `pycodcif` selects CIF reader based on `pycodcif` package.
+
+    String *expansion* selects how the asymmetric unit is expanded into
+    the unit cell. Value `compiled` (default) applies the symmetry
+    operations as arrays (see symmetry.py), while `ase` uses
+    ase.spacegroup.crystal. Both give identical structures.
     """
-    # Find all CIF blocks with valid crystal data
-    images = []
-    for block in parse_cif(fileobj, reader):
-        if not block.has_structure():
-            continue
-
-        atoms = block.get_atoms(
-            store_tags, primitive_cell,
-            subtrans_included,
-            fractional_occupancies=fractional_occupancies)
-        images.append(atoms)
+    if reader == 'pycodcif':
+        collection = None
+        blocks = parse_cif(fileobj, reader)
+    else:
+        collection = CIFCollection(fileobj, reader)
+        blocks = iter(collection)
 
-    for atoms in images[index]:
-        yield atoms
+    try:
+        if isinstance(index, str):
+            if collection is not None:
+                selected = iter([collection[index]])
+            else:
+                selected = itertools.islice(
+                    (block for block in blocks if block.name == index), 1)
+        else:
+            # Only blocks with valid crystal data count towards the index
+            selected = _select((block for block in blocks
+                                if block.has_structure()), index)
+
+        for block in selected:
+            yield block.get_atoms(
+                store_tags, primitive_cell,
+                subtrans_included,
+                fractional_occupancies=fractional_occupancies,
+                expansion=expansion)
+    finally:
+        if collection is not None:
+            collection.close()
 
 
 def format_cell(cell: Cell) -> str:
@@ -672,6 +1409,23 @@ class CIFLoop:
         append('')
         return '\n'.join(lines)
 
+    def write(self, fd, chunksize=CIF_WRITE_CHUNKSIZE) -> None:
+        """Write the same text as tostring() to the text file *fd*, *chunksize*
+        rows at a time.
+
+        Array columns are converted to Python scalars in one go with tolist(),
+        rather than indexed element by element, and each chunk of rows is
+        written as soon as it is formatted, so the text of the whole loop is
+        never held in memory."""
+        fd.write(''.join(['loop_\n'] + [f'  {name}\n' for name in self.names]))
+
+        template = '  ' + '  '.join(self.formats) + '\n'
+        nrows = len(self.arrays[0]) if self.arrays else 0
+        for start in range(0, nrows, chunksize):
+            columns = [array[start:start + chunksize] for array in self.arrays]
+            columns = [column.tolist() if isinstance(column, np.ndarray) else column for column in columns]
+            fd.write(''.join(map(template.format, *columns)))
+
 
 @iofunction('wb')
 def write_cif(fd, images, cif_format=None,
@@ -739,10 +1493,17 @@ def autolabel(symbols: Sequence[str]) -> List[str]:
 
 
 def chemical_formula_header(atoms):
-    counts = atoms.symbols.formula.count()
-    formula_sum = ' '.join(f'{sym}{count}' for sym, count
-                           in counts.items())
-    return (f'_chemical_formula_structural       {atoms.symbols}\n'
+    # The same text as from atoms.symbols.formula, counted with NumPy
+    numbers = atoms.numbers
+    starts = np.flatnonzero(np.diff(numbers, prepend=-1))
+    runs = np.diff(starts, append=len(numbers))
+    structural = ''.join(chemical_symbols[number] + (str(n) if n > 1 else '')
+                         for number, n in zip(numbers[starts].tolist(), runs.tolist()))
+    unique, first, counts = np.unique(numbers, return_index=True, return_counts=True)
+    order = np.argsort(first)
+    formula_sum = ' '.join(f'{chemical_symbols[number]}{count}' for number, count
+                           in zip(unique[order].tolist(), counts[order].tolist()))
+    return (f'_chemical_formula_structural       {structural}\n'
             f'_chemical_formula_sum              "{formula_sum}"\n')
 
 
@@ -753,40 +1514,42 @@ class BadOccupancies(ValueError):
 def expand_kinds(atoms, coords):
     # try to fetch occupancies // spacegroup_kinds - occupancy mapping
     symbols = list(atoms.symbols)
-    coords = list(coords)
-    occupancies = [1] * len(symbols)
     occ_info = atoms.info.get('occupancy')
     kinds = atoms.arrays.get('spacegroup_kinds')
-    if occ_info is not None and kinds is not None:
-        for i, kind in enumerate(kinds):
-            occ_info_kind = occ_info[str(kind)]
-            symbol = symbols[i]
-            if symbol not in occ_info_kind:
-                raise BadOccupancies('Occupancies present but no occupancy '
-                                     'info for "{symbol}"')
-            occupancies[i] = occ_info_kind[symbol]
-            # extend the positions array in case of mixed occupancy
-            for sym, occ in occ_info[str(kind)].items():
-                if sym != symbols[i]:
-                    symbols.append(sym)
-                    coords.append(coords[i])
-                    occupancies.append(occ)
-    return symbols, coords, occupancies
+    if occ_info is None or kinds is None:
+        # Nothing to expand, so the coordinates are kept as an array
+        return symbols, coords, np.ones(len(symbols))
+    coords = list(coords)
+    occupancies = [1] * len(symbols)
+    for i, kind in enumerate(kinds):
+        occ_info_kind = occ_info[str(kind)]
+        symbol = symbols[i]
+        if symbol not in occ_info_kind:
+            raise BadOccupancies('Occupancies present but no occupancy '
+                                 'info for "{symbol}"')
+        occupancies[i] = occ_info_kind[symbol]
+        # extend the positions array in case of mixed occupancy
+        for sym, occ in occ_info[str(kind)].items():
+            if sym != symbols[i]:
+                symbols.append(sym)
+                coords.append(coords[i])
+                occupancies.append(occ)
+    return symbols, np.array(coords).reshape(-1, 3), np.array(occupancies, dtype=float)
 
 
 def atoms_to_loop_data(atoms, wrap, labels, loop_keys):
     if atoms.cell.rank == 3:
         coord_type = 'fract'
-        coords = atoms.get_scaled_positions(wrap).tolist()
+        coords = atoms.get_scaled_positions(wrap)
     else:
         coord_type = 'Cartn'
-        coords = atoms.get_positions(wrap).tolist()
+        coords = atoms.get_positions(wrap)
 
     try:
         symbols, coords, occupancies = expand_kinds(atoms, coords)
     except BadOccupancies as err:
         warnings.warn(str(err))
-        occupancies = [1] * len(atoms)
+        occupancies = np.ones(len(atoms))
         symbols = list(atoms.symbols)
 
     if labels is None:
@@ -799,13 +1562,12 @@ def atoms_to_loop_data(atoms, wrap, labels, loop_keys):
     loopdata['_atom_site_label'] = (labels, '{:<8s}')
     loopdata['_atom_site_occupancy'] = (occupancies, '{:6.4f}')
 
-    _coords = np.array(coords)
     for i, key in enumerate(coord_headers):
-        loopdata[key] = (_coords[:, i], '{}')
+        loopdata[key] = (coords[:, i], '{}')
 
     loopdata['_atom_site_type_symbol'] = (symbols, '{:<2s}')
     loopdata['_atom_site_symmetry_multiplicity'] = (
-        [1.0] * len(symbols), '{}')
+        np.ones(len(symbols)), '{}')
 
     for key in loop_keys:
         # Should expand the loop_keys like we expand the occupancy stuff.
@@ -849,4 +1611,4 @@ def write_cif_image(blockname, atoms, fd, *, wrap,
         array, fmt = loopdata[header]
         loop.add(header, array, fmt)
 
-    fd.write(loop.tostring())
+    loop.write(fd)
@@ -10,7 +10,16 @@ import numpy as np
 import dlmontepython.htk.sources.dlfield as FIELD
 import dlmontepython.htk.sources.dlfieldspecies as FIELDSPECIES
 import dlmontepython.htk.sources.dlinteraction as INT
-from itertools import combinations, combinations_with_replacement
+from itertools import combinations, product
+from ase.build import niggli_reduce
+from ase.cell import Cell
+from ase.data import chemical_symbols
+import symmetry
+from forcefield import DEFAULT_MIXING_RULE, pair_table
+
+# Atoms formatted per write when streaming a CONFIG file, and the decimal places of their coordinates
+CONFIG_CHUNKSIZE = 10000
+CONFIG_PRECISION = 6
 
 
 class DLMolecule:
@@ -25,23 +34,99 @@ class DLMolecule:
         self.tags = tags
         self.potentials = potentials
 
+    # The tag index is rebuilt on the next lookup whenever the molecule, its tag names or its tags are replaced
+    @property
+    def molecule(self):
+        return self._molecule
+
+    @molecule.setter
+    def molecule(self, molecule):
+        self._molecule = molecule
+        self._tag_index = None
+
+    @property
+    def tags(self):
+        return self._tags
+
+    @tags.setter
+    def tags(self, tags):
+        self._tags = tags
+        self._tag_index = None
+
+    def set_tags(self, tag_list):
+        '''
+        This function sets the tags of the molecule's atoms and drops the tag index built from the old ones.
+        Tags set on self.molecule directly need a call to invalidate_tag_index() instead.
+
+        :param tag_list: (ndarray) the tag of each atom, as keys of self.tags
+        '''
+        self.molecule.set_tags(tag_list)
+        self.invalidate_tag_index()
+
+    def invalidate_tag_index(self):
+        self._tag_index = None
+
+    def get_tag_index(self):
+        '''
+        This function returns the tag index of the molecule, building it with a single np.unique over the tags the
+        first time it is needed.
+        Each tag maps to the index of its first atom, its number of atoms, and the mass and charge of its first atom,
+        which are all that the atom type, VDW and CONFIG generation need to know about it.
+
+        :return tag_index: (dict) {tag: (first index, count, mass, charge)...}
+        :return atom_tags: (ndarray) the position in tag_index of each atom's tag
+        '''
+        if self._tag_index is None:
+            tags, first, atom_tags, counts = np.unique(self.molecule.get_tags(), return_index=True,
+                                                       return_inverse=True, return_counts=True)
+            masses = self.molecule.get_masses()[first]
+            charges = self.molecule.get_initial_charges()[first]
+            tag_index = {tag: (index, count, mass, charge)
+                         for tag, index, count, mass, charge in zip(tags.tolist(), first.tolist(), counts.tolist(),
+                                                                    masses, charges)}
+            self._tag_index = tag_index, atom_tags
+        return self._tag_index
+
     def _config_atoms_stringify(self):
         '''
         This short function makes an appropriate molecule string for a CONFIG.CONFIG object.
         For each atom in the molecule, the atom name and DL_MONTE tag 'core' is added on line 1
         On line 2, the cartesian coordinates of the atom is then printed.
+        The atom names are looked up once per tag (cf. get_tag_index), and the positions are converted to Python
+        values a chunk of atoms at a time, so no per-atom ASE.Atom objects are made.
 
         :param ase_molecule: (ASE.Atoms) an ASE.Atoms object for one of your simulation molecules
         :param tag_dict: (dict) a dictionary which connects ASE.Atoms tags of struct to a string for DL_Monte
         :return output: (str) a string of the molecule positions for a DL_monte CONFIG.CONFIG object
         '''
+        tag_index, atom_tags = self.get_tag_index()
+        names = np.array([self.tags[tag] for tag in tag_index], dtype=object)[atom_tags].tolist()
+        positions = self.molecule.positions
         output = []
-        for i in self.molecule:
-            counter = i.tag
-            output.append(
-                '{0} core\n {1} {2} {3} 0'.format(self.tags[counter], i.position[0], i.position[1], i.position[2]))
+        for start in range(0, len(names), 10000):
+            chunk = slice(start, start + 10000)
+            output += ['{0} core\n {1} {2} {3} 0'.format(name, x, y, z)
+                       for name, (x, y, z) in zip(names[chunk], positions[chunk].tolist())]
         return output
 
+    def _config_atom_chunks(self, precision=None, chunksize=CONFIG_CHUNKSIZE):
+        '''
+        This function yields the CONFIG lines of the molecule's atoms, as in _config_atoms_stringify, a chunk of atoms
+        at a time. Each chunk is formatted from the position and tag arrays in one string.
+
+        :param precision: (int) the number of decimal places of the coordinates, or None for their full precision
+        :param chunksize: (int) the number of atoms per chunk
+        :return: (generator) strings of the newline-terminated lines of chunksize atoms
+        '''
+        tag_index, atom_tags = self.get_tag_index()
+        names = np.array([self.tags[tag] for tag in tag_index], dtype=object)
+        coordinate = '{}' if precision is None else '{{:.{0}f}}'.format(precision)
+        template = '{} core\n ' + ' '.join([coordinate] * 3) + ' 0\n'
+        positions = self.molecule.positions
+        for start in range(0, len(atom_tags), chunksize):
+            chunk = slice(start, start + chunksize)
+            yield ''.join(map(template.format, names[atom_tags[chunk]].tolist(), *positions[chunk].T.tolist()))
+
     def _config_molecule_dict_maker(self, ase_molecule, tag_dict, molecule_name):
         '''
         This function creates a dictionary of all the information you need to write a molecule to a CONFIG.CONFIG object
@@ -77,6 +162,28 @@ class DLMolecule:
                            molecules_list)
         return empty_box
 
+    def write_config_empty_framework(self, fd, box_name=None, max_molecules=[1000, 1000], precision=CONFIG_PRECISION):
+        '''
+        This function writes the CONFIG file of make_config_empty_framework straight to an open file.
+        The atoms are written a chunk at a time from the position and tag arrays (cf. _config_atom_chunks), so the
+        file is never held in memory as a whole, and their coordinates are written to a fixed number of decimal places.
+
+        :param fd: (file) a text file open for writing
+        :param box_name: (str) the CONFIG title, defaulting to the molecule name
+        :param max_molecules: (list) max num. of each molecule type in your simulation
+        :param precision: (int) the number of decimal places of the atom coordinates, or None for the full precision
+            written by make_config_empty_framework
+        '''
+        if not box_name:
+            box_name = self.name
+        fd.write('{0}\n0 1\n'.format(box_name))
+        for x, y, z in np.asarray(self.molecule.cell).tolist():
+            fd.write('{0} {1} {2}\n'.format(x, y, z))
+        fd.write('NUMMOL {0}\n'.format(' '.join(str(n) for n in [1, *max_molecules])))
+        fd.write('MOLECULE {0} {1}\n'.format(self.name, len(self.molecule)))
+        for chunk in self._config_atom_chunks(precision):
+            fd.write(chunk)
+
     def get_maxatom_moltype(self):
         '''
         This function takes an ASE.Atoms object along with a name and makes a FIELDSPECIES.Moltype object for it
@@ -106,24 +213,23 @@ class DLMolecule:
     def _get_field_atomtype(self, tag, atom_name):
         '''
         This function creates an Atomtype entry for an individual atom type from your simulation molecule ASE.Atoms objects
-        For a given tag, it identifies from the ASE.Atoms object the atom mass and charge, then invokes an Atomtype object
+        For a given tag, it looks up the atom mass and charge in the tag index, then invokes an Atomtype object
 
         :param name: (str) the name of your DL_Monte atom, as written in tag_dict
         :param ase_molecule: (ASE.Atoms) an ASE.Atoms object for one of your simulation molecules
         :param tag_dict: (dict) a dictionary which connects ASE.Atoms tags of struct to a string for DL_Monte
         :return: (FIELDspecies.Atomtype) An atomtype object for puttin ginto the Atomtypes section of a FIELD.FIELD object
         '''
-        tag_mask = self.molecule.get_tags() == tag
-        if np.any(tag_mask):
-            test_atom = self.molecule[tag_mask][0]
-        else:
+        tag_index, _ = self.get_tag_index()
+        if tag not in tag_index:
             print('Something weird has happened and you have a tag with no assigned atoms!')
             print('Better check your python script!')
-            raise
+            raise ValueError('No atoms have tag {0}'.format(tag))
+        _, _, mass, charge = tag_index[tag]
         return FIELDSPECIES.AtomType(atom_name,
                                      'core',
-                                     test_atom.mass,
-                                     round(test_atom.charge, 5))
+                                     mass,
+                                     round(charge, 5))
 
     def get_field_atomtypes(self):
         '''
@@ -149,15 +255,19 @@ class DLMolecule:
         '''
         output = []
         site = None
-        for i in self.molecule:
+        tag_index, atom_tags = self.get_tag_index()
+        names = np.array([self.tags[tag] for tag in tag_index], dtype=object)[atom_tags].tolist()
+        for name, (x, y, z), mass, charge in zip(names, self.molecule.positions.tolist(),
+                                                 self.molecule.get_masses().tolist(),
+                                                 self.molecule.get_initial_charges().tolist()):
             output.append(FIELDSPECIES.Atom(
-                self.tags[i.tag],
+                name,
                 'core',
-                i.position[0],
-                i.position[1],
-                i.position[2],
-                i.mass,
-                i.charge,
+                x,
+                y,
+                z,
+                mass,
+                charge,
                 site
             ))
         return output
@@ -199,69 +309,129 @@ class DLMolecule:
         output['molecule'] = self.molecule.todict()
         return output
 
-def get_vdw_interactions(interacting_molecules=[], self_excluding_molecules=[]):
+FRAMEWORK_DTYPE = np.dtype([('number', np.int32), ('position', np.float64, 3), ('tag', np.int32),
+                            ('mass', np.float64), ('charge', np.float64)])
+
+
+class FrameworkArrays:
     '''
-    This function creates a set of Van der Waals interactions for a FIELD.FIELD object.
-    First, it takes in a moldict consisting of the following information:
-        {'name': (str) the molecule name,
-        'molecule' (ASE.Atoms) the Atoms object for the molecule,
-        'tags': (dict) the tag_dict for the molecule,
-        'LJ_by_tag': (dict) a dict of {tag: [eps, sigma, q]...}}
+    A compact framework for DLMolecule, held as one structured NumPy array with a record per atom (atomic number,
+    position, tag, mass and charge) instead of an ASE.Atoms object.
+    It has the parts of the ASE.Atoms interface that dlmolecule uses: numbers, positions, cell, len() and the get/set
+    methods for tags, masses and initial charges, so it can be passed anywhere a framework ASE.Atoms object is.
+    Supercells are built by broadcasting the unit cell positions against the lattice shifts.
+    '''
+    __slots__ = ('atoms', 'cell', 'pbc')
 
-    It can optionally take in a moldict of a second species to get interaciton sof both species with one another
-    Finally, it can take in a moldict for a molecule whose self LJ-interactions you want to exclude i.e. your framework
+    def __init__(self, atoms, cell, pbc=True):
+        self.atoms = atoms
+        self.cell = Cell(cell)
+        self.pbc = np.ones(3, dtype=bool) & pbc
 
-    Based on these moldicts, it creates a list of all atom pairs minus the self_exclusion atompairs
-    It then calculates the Lorentz-Berthelot mixing interactions between these atom pairs.
-    For each atompair, it creates an INT.InteractionLJPlus object followed by a FIELD.VDW object from this
-    It finally returns a list of FIELD.VDW objects used to make a FIELD.FIELD file
+    @classmethod
+    def from_atoms(cls, ase_object, repeats=(1, 1, 1)):
+        '''
+        This function converts an ASE.Atoms object, repeated along its cell vectors, into a FrameworkArrays object.
+        The atoms are in the same order as in ase_object * repeats.
 
+        :param ase_object: (ASE.Atoms) your framework structure as an ASE.Atoms object
+        :param repeats: (tuple) the number of repeats along each cell vector
+        :return framework: (FrameworkArrays) the compact supercell
+        '''
+        repeats = tuple(int(x) for x in repeats)
+        shifts = np.array(list(product(*[range(n) for n in repeats])), dtype=float).reshape(-1, 3)
+        shifts = shifts @ ase_object.cell.array
+        atoms = np.empty(len(shifts) * len(ase_object), dtype=FRAMEWORK_DTYPE)
+        atoms['number'] = np.tile(ase_object.numbers, len(shifts))
+        atoms['position'] = (ase_object.positions[np.newaxis] + shifts[:, np.newaxis]).reshape(-1, 3)
+        atoms['tag'] = np.tile(ase_object.get_tags(), len(shifts))
+        atoms['mass'] = np.tile(ase_object.get_masses(), len(shifts))
+        atoms['charge'] = np.tile(ase_object.get_initial_charges(), len(shifts))
+        return cls(atoms, ase_object.cell.array * np.array(repeats)[:, np.newaxis], ase_object.pbc)
 
-    TODO: Split this up into smaller constituent functions, for better future flexibility
-    TODO: TEST instead of explicitly moldict_1 and moldict_2, make it a list to allow flexible numbers of molecules
-    :param moldict_1: (dict) a dictionary containing all the key information about your simulaiton molecule
-    :param moldict_2: (dict) as moldict_1, if you want multiples
-    :param self_exclusion_moldict: (dict) as moldict_1, if you want to exclude self-interactions for a molecules
-    :return output: (list) a list of FIELD.VDW objects used for making a FIELD.FIELD file
-    '''
+    def __len__(self):
+        return len(self.atoms)
 
-    output = []
-    interactions_by_name = {}
-    exclusion_interactions = {}
+    @property
+    def numbers(self):
+        return self.atoms['number']
+
+    @property
+    def positions(self):
+        return self.atoms['position']
+
+    def get_tags(self):
+        return self.atoms['tag'].copy()
+
+    def set_tags(self, tags):
+        self.atoms['tag'] = tags
 
-    # atompairs = set(list(combinations_with_replacement([x.molecule.atoms for x in interacting_molecules])))\
-    #            - [set(list(combinations_with_replacement([x.molecule.atoms for x in self_excluding_molecules])))]
+    def get_masses(self):
+        return self.atoms['mass'].copy()
 
+    def get_initial_charges(self):
+        return self.atoms['charge'].copy()
+
+    def set_initial_charges(self, charges=None):
+        self.atoms['charge'] = 0.0 if charges is None else charges
+
+    def todict(self):
+        # The layout of ASE.Atoms.todict, so DLMolecule.from_json reads it back as an ASE.Atoms object
+        return {'numbers': self.numbers.astype(int), 'positions': self.positions.copy(), 'cell': self.cell.array,
+                'pbc': self.pbc, 'tags': self.get_tags().astype(int), 'masses': self.get_masses(),
+                'initial_charges': self.get_initial_charges()}
+
+
+def get_vdw_interactions(interacting_molecules=[], self_excluding_molecules=[], mixing_rule=DEFAULT_MIXING_RULE,
+                         overrides=None):
+    '''
+    This function creates a set of Van der Waals interactions for a FIELD.FIELD object.
+    It takes in a list of DLMolecule objects whose atom types all interact with one another, and optionally a list of
+    molecules whose self LJ-interactions you want to exclude i.e. your framework.
+
+    The epsilon and sigma of every pair of atom types are mixed at once into a pair table (see forcefield.pair_table),
+    which is cached per set of atom types, so the same framework and sorbates are only ever mixed once.
+    Pairs of atom types of the self-excluding molecules, and pairs whose mixed epsilon rounds to zero, are left out.
+    For each remaining atompair, it creates an INT.InteractionLJLRC object followed by a FIELD.VDW object from this.
+    It finally returns a list of FIELD.VDW objects used to make a FIELD.FIELD file, in the order the atom types
+    first appear in the molecules.
+
+    :param interacting_molecules: (list) the DLMolecule objects in your simulation
+    :param self_excluding_molecules: (list) the DLMolecule objects whose self-interactions are excluded
+    :param mixing_rule: (str) the name of a mixing rule in forcefield.MIXING_RULES
+    :param overrides: (dict) {(name1, name2): (epsilon, sigma)} for pairs of atom types not given by the mixing rule
+    :return output: (list) a list of FIELD.VDW objects used for making a FIELD.FIELD file
+    '''
+    interactions_by_name = {}
     for molecule in interacting_molecules:
         # self interaction terms
         for tag, name in molecule.tags.items():
             interactions_by_name[name] = (
                 (molecule._get_field_atomtype(tag, name), molecule.potentials[tag]))
+    excluded_names = {name for molecule in self_excluding_molecules for name in molecule.tags.values()}
 
-    for molecule in self_excluding_molecules:
-        for tag, name in molecule.tags.items():
-            exclusion_interactions[name] = (
-                (molecule._get_field_atomtype(tag, name), molecule.potentials[tag]))
-
-    atompairs = set([i for i in combinations_with_replacement(interactions_by_name.keys(), 2)])
+    names = list(interactions_by_name)
+    potentials = np.array([interactions_by_name[name][1][:2] for name in names], dtype=float).reshape(-1, 2)
+    pair_epsilon, pair_sigma = pair_table(names, potentials[:, 0], potentials[:, 1], mixing_rule, overrides)
 
-    exclusion_atompairs = set([i for i in combinations_with_replacement(exclusion_interactions.keys(), 2)])
-    tested_atompairs = list(atompairs.difference(exclusion_atompairs))
-    print(tested_atompairs)
+    first, second = np.triu_indices(len(names))
+    excluded = np.array([name in excluded_names for name in names], dtype=bool)
+    epsilon = np.round(pair_epsilon[first, second], 3)
+    tested = ~(excluded[first] & excluded[second])
+    kept = tested & (epsilon > 0)
+    print('VDW interactions: {0} of {1} atom pairs tested'.format(np.count_nonzero(kept), np.count_nonzero(tested)))
 
-    for i in tested_atompairs:
-        name1 = interactions_by_name[i[0]][0]
-        name2 = interactions_by_name[i[1]][0]
-        sigma = round(0.5 * (interactions_by_name[i[0]][1][1] + interactions_by_name[i[1]][1][1]), 3)
-        epsilon = round(np.sqrt(interactions_by_name[i[0]][1][0] * interactions_by_name[i[1]][1][0]), 3)
-        if epsilon > 0:
-            output.append(FIELD.VDW(name1, name2, INT.InteractionLJLRC(epsilon, sigma)))
+    output = []
+    for i, j, pair_eps, sigma in zip(first[kept].tolist(), second[kept].tolist(), epsilon[kept],
+                                     pair_sigma[first[kept], second[kept]].tolist()):
+        output.append(FIELD.VDW(interactions_by_name[names[i]][0], interactions_by_name[names[j]][0],
+                                INT.InteractionLJLRC(pair_eps, round(sigma, 3))))
 
     return output
 
 
 def make_field(framework_molecule, sorbate_molecules=[], cutoff=12, sim_title='Test',
-               sorbent_self_interactions=False):
+               sorbent_self_interactions=False, forcefield=None):
     '''
     This function makes an entire FIELD.FIELD object for you.
     It pulls together a lot of functions to make a complete FIELD file for you.
@@ -282,6 +452,8 @@ def make_field(framework_molecule, sorbate_molecules=[], cutoff=12, sim_title='T
     :param cutoff: (float) your simulation cutoff, in A
     :param sim_title: (str) the name of your simulation
     :param sorbent_self_interactions: (bool) True if you want to consider framework self-LJ interactions (untested)
+    :param forcefield: (forcefield.Forcefield) the forcefield whose mixing rule and pair overrides are used, or None
+        for Lorentz-Berthelot mixing without overrides
     :return output: (FIELD.FIELD) a FIELD.FIELD object of your simulation parameters
     '''
     # Preamble
@@ -303,12 +475,14 @@ def make_field(framework_molecule, sorbate_molecules=[], cutoff=12, sim_title='T
         output.moltypes.append(sorbate.get_field_rigid_molecule())
 
     # VDW interactions
+    mixing = {} if forcefield is None else {'mixing_rule': forcefield.mixing_rule, 'overrides': forcefield.overrides}
     if len(sorbate_molecules) > 0:
-        for interaction in get_vdw_interactions([framework_molecule, *sorbate_molecules], [framework_molecule]):
+        for interaction in get_vdw_interactions([framework_molecule, *sorbate_molecules], [framework_molecule],
+                                                **mixing):
             output.vdw.append(interaction)
 
     elif sorbent_self_interactions:
-        for interaction in get_vdw_interactions(framework_molecule):
+        for interaction in get_vdw_interactions([framework_molecule], **mixing):
             output.vdw.append(interaction)
 
     print('number of interactions: ', len(output.vdw), 'max:',
@@ -316,20 +490,191 @@ def make_field(framework_molecule, sorbate_molecules=[], cutoff=12, sim_title='T
     return output
 
 
+def write_field(fd, field):
+    '''
+    This function writes a FIELD.FIELD object to an open file one entry at a time, giving the text of str(field)
+    without building the whole file as one string first.
+
+    :param fd: (file) a text file open for writing
+    :param field: (FIELD.FIELD) a FIELD.FIELD object, e.g. from make_field
+    '''
+    fd.write('{0}\nCUTOFF {1}\nUNITS {2}\nNCONFIGS {3}\n'.format(field.description, field.cutoff, field.units,
+                                                                 field.nconfigs))
+    ecap = '' if field.vdw_ecap is None else ' ecap {0}'.format(field.vdw_ecap)
+    sections = [('ATOMS {0}'.format(len(field.atomtypes)), field.atomtypes),
+                ('MOLTYPES {0}'.format(len(field.moltypes)), field.moltypes),
+                ('FINISH', []),
+                ('VDW {0}{1}'.format(len(field.vdw), ecap), field.vdw)]
+    if field.bonds2body:
+        sections.append(('BONDS {0}'.format(len(field.bonds2body)), field.bonds2body))
+    if field.angles:
+        sections.append(('ANGLES {0}'.format(len(field.angles)), field.angles))
+    for header, entries in sections:
+        fd.write(header + '\n')
+        for entry in entries:
+            fd.write('{0}\n'.format(entry))
+    fd.write('CLOSE\n')
+
+
 # region from ase functions:
 
-def calculate_supercell(ase_object, cutoff=12):
-    supercell = []
-    for i in range(3):
-        dim = np.linalg.norm(ase_object.cell[i])
-        if dim < cutoff * 2:
-            print('oh no! my x value is too small! ({0})'.format(dim))
-            supercell.append(np.ceil((cutoff * 2) / dim))
+def perpendicular_widths(cell):
+    '''
+    This function calculates the perpendicular widths of a cell, i.e. the distances between its opposite faces.
+    Periodic images of an atom are further apart than the cutoff only if every width is at least twice the cutoff.
+    For orthorhombic cells these are the lattice vector lengths, but for triclinic cells they are shorter.
+
+    :param cell: (ASE.Cell) the cell vectors as rows
+    :return widths: (ndarray) the widths across the a, b and c directions, in A
+    '''
+    cell = np.asarray(cell)
+    volume = abs(np.linalg.det(cell))
+    return volume / np.linalg.norm(np.cross(cell[[1, 2, 0]], cell[[2, 0, 1]]), axis=1)
+
+
+def lattice_translations(ase_object, symprec=1e-3):
+    '''
+    This function finds the pure translations that map a structure onto itself, e.g. the 4 of a face-centred cell.
+    Candidates are the vectors from one atom of the rarest element to the others, and a candidate is kept if it moves
+    every atom onto an atom of the same element, within symprec in scaled coordinates.
+
+    :param ase_object: (ASE.Atoms) a periodic structure
+    :param symprec: (float) the tolerance on matching positions, in scaled coordinates
+    :return translations: (ndarray) the scaled translation vectors, including the zero vector
+    '''
+    scaled = ase_object.get_scaled_positions()
+    numbers = ase_object.numbers
+    elements, counts = np.unique(numbers, return_counts=True)
+    rarest = np.flatnonzero(numbers == elements[np.argmin(counts)])
+    translations = [np.zeros(3)]
+    for candidate in (scaled[rarest[1:]] - scaled[rarest[0]]) % 1.0:
+        query_indices, _ = symmetry.close_pairs(scaled + candidate, scaled, symprec, numbers, numbers)
+        if len(np.unique(query_indices)) == len(ase_object):
+            translations.append(candidate)
+    return np.array(translations)
+
+
+def _lattice_basis(generators):
+    # Integer row reduction (Hermite normal form) of the generators into a basis of the lattice they span
+    rows = np.array(generators, dtype=np.int64)
+    basis = []
+    for column in range(3):
+        active = np.flatnonzero(rows[:, column])
+        while len(active) > 1:
+            pivot = active[np.argmin(np.abs(rows[active, column]))]
+            others = active[active != pivot]
+            rows[others] -= np.outer(rows[others, column] // rows[pivot, column], rows[pivot])
+            active = np.flatnonzero(rows[:, column])
+        basis.append(rows[active[0]])
+        rows = np.delete(rows, active[0], axis=0)
+    return np.array(basis)
+
+
+def primitive_cell(ase_object, symprec=1e-3):
+    '''
+    This function reduces a structure to its Niggli-reduced primitive cell.
+    The primitive lattice is spanned by the cell vectors and the lattice translations (cf. lattice_translations),
+    and one atom of each set of translation-equivalent atoms is kept, along with all of its per-atom arrays.
+
+    :param ase_object: (ASE.Atoms) a periodic structure, e.g. the conventional cell of a framework
+    :param symprec: (float) the tolerance on matching positions, in scaled coordinates
+    :return primitive: (ASE.Atoms) the primitive cell, or None if the atoms could not be divided between its images
+    '''
+    translations = lattice_translations(ase_object, symprec)
+    n_translations = len(translations)
+    if n_translations == 1:
+        primitive = ase_object.copy()
+        niggli_reduce(primitive)
+        return primitive
+    # The translations form a group, so in units of 1 / n_translations they are integer vectors
+    generators = np.vstack([n_translations * np.eye(3), np.rint(translations * n_translations)])
+    scaled_basis = _lattice_basis(generators) / n_translations
+    cell = scaled_basis @ ase_object.cell.array
+
+    scaled = np.linalg.solve(cell.T, ase_object.positions.T).T
+    query_indices, point_indices = symmetry.close_pairs(scaled, scaled, symprec, ase_object.numbers,
+                                                        ase_object.numbers)
+    keep = np.ones(len(ase_object), dtype=bool)
+    keep[query_indices[point_indices < query_indices]] = False
+    if keep.sum() * n_translations != len(ase_object):
+        return None
+
+    primitive = ase_object[keep]
+    primitive.set_cell(cell, scale_atoms=False)
+    primitive.wrap()
+    niggli_reduce(primitive)
+    return primitive
+
+
+def simulation_cells(ase_object, cells=('conventional', 'reduced', 'primitive')):
+    '''
+    This function makes the candidate unit cells of a framework to build the simulation supercell from.
+    'conventional' is the structure as given, 'reduced' is its Niggli-reduced cell (the same atoms in the most compact
+    cell shape) and 'primitive' is the Niggli-reduced primitive cell (cf. primitive_cell).
+    Only the conventional cell is used for structures which aren't periodic in all three directions.
+
+    :param ase_object: (ASE.Atoms) your framework structure as an ASE.Atoms object
+    :param cells: (tuple) the names of the cells to make
+    :return candidates: (dict) the ASE.Atoms object of each cell, by name
+    '''
+    candidates = {}
+    for name in cells:
+        if name == 'conventional':
+            candidates[name] = ase_object
+        elif not ase_object.pbc.all():
+            continue
+        elif name == 'reduced':
+            candidates[name] = ase_object.copy()
+            niggli_reduce(candidates[name])
+        elif name == 'primitive':
+            primitive = primitive_cell(ase_object)
+            if primitive is not None:
+                candidates[name] = primitive
         else:
-            supercell.append(1)
-    print(supercell)
-    assert len(supercell) == 3
-    superstructure = ase_object * (int(supercell[0]), int(supercell[1]), int(supercell[2]))
+            raise ValueError('Unknown simulation cell {0}'.format(name))
+    return candidates
+
+
+def select_supercell(ase_object, cutoff=12, cells=('conventional', 'reduced', 'primitive')):
+    '''
+    This function chooses the simulation supercell with the fewest framework atoms.
+    Each candidate cell (cf. simulation_cells) is repeated along each direction until its perpendicular width is at
+    least twice the cutoff, and the supercell with the fewest atoms is kept, preferring earlier cells on ties.
+    The cost of a DL_MONTE simulation scales with the number of framework atoms, so the number saved compared to
+    the conventional supercell is printed.
+
+    :param ase_object: (ASE.Atoms) your framework structure as an ASE.Atoms object
+    :param cutoff: (float) your simulation cutoff, in A
+    :param cells: (tuple) the names of the candidate cells, cf. simulation_cells
+    :return cell_atoms: (ASE.Atoms) the chosen cell
+    :return repeats: (tuple) the number of repeats of cell_atoms along each cell vector
+    '''
+    candidates = simulation_cells(ase_object, cells)
+    supercells = {}
+    for name, cell_atoms in candidates.items():
+        repeats = np.maximum(np.ceil(2 * cutoff / perpendicular_widths(cell_atoms.cell)), 1).astype(int)
+        supercells[name] = (len(cell_atoms) * int(np.prod(repeats)), tuple(int(x) for x in repeats))
+        print('{0} cell: {1} atoms, repeated {2} = {3} atoms'.format(name, len(cell_atoms), repeats,
+                                                                     supercells[name][0]))
+    name = min(supercells, key=lambda key: supercells[key][0])
+    n_atoms, repeats = supercells[name]
+    if 'conventional' in supercells:
+        print('Using the {0} cell x {1}: {2} framework atoms, {3} fewer than the conventional supercell'.format(
+            name, repeats, n_atoms, supercells['conventional'][0] - n_atoms))
+    return candidates[name], repeats
+
+
+def calculate_supercell(ase_object, cutoff=12, cells=('conventional', 'reduced', 'primitive')):
+    '''
+    This function builds the simulation supercell with the fewest framework atoms (cf. select_supercell).
+
+    :param ase_object: (ASE.Atoms) your framework structure as an ASE.Atoms object
+    :param cutoff: (float) your simulation cutoff, in A
+    :param cells: (tuple) the names of the candidate cells, cf. simulation_cells
+    :return superstructure: (ASE.Atoms) the simulation supercell
+    '''
+    cell_atoms, repeats = select_supercell(ase_object, cutoff, cells)
+    superstructure = cell_atoms * repeats
     return superstructure
 
 
@@ -349,7 +694,7 @@ def make_framework_indices(struct):
         structure_dictionary[i] = {}
         idx_mask = struct.numbers == i
         assert len(idx_mask) == len(struct)
-        structure_dictionary[i]['symbol'] = struct[np.where(idx_mask)[0][0]].symbol
+        structure_dictionary[i]['symbol'] = chemical_symbols[i]
         structure_dictionary[i]['idx_mask'] = idx_mask
     return structure_dictionary
 
@@ -378,7 +723,9 @@ def assign_all_framework_tags(struct, structure_dictionary, element_label_additi
     Atom types are subdivided by Lennard Jones rules ('moieties') and coulombic point charges, and so are tags
     It takes in a structure, the structure dictionary (cf. make_framework_indices), and a string to signify it's a sorbent
 
-    Based on the element and option moiety subdivision in the structure dictionary, tags are assigned to unique charges
+    Based on the element and option moiety subdivision in the structure dictionary, each atom is given a moiety
+    (one per element unless it has 'moieties'), and tags are then assigned to each unique (moiety, charge) pair
+    in a single pass over the structure (cf. assign_tags_by_charge)
     A list of unique tags is then made (tag_list) which can be applied directly on the to structure ASE.Atoms object
     This corresponds to keys in a dictionary (tag_dict), which can be read when writing a DL_MONTE FIELD and CONFIG file
 
@@ -387,81 +734,181 @@ def assign_all_framework_tags(struct, structure_dictionary, element_label_additi
     :return tag_dict: (dict) a dictionary which connects ASE.Atoms tags of struct to a string for DL_Monte
     :return tag_list: (ndarray) a list of the same length as struct, with the assigned tag values in it
     '''
-    tag_list = np.zeros_like(struct)
-    tag_dict = {}
-    tag_counter = 1
+    numbers = struct.numbers
+    moieties = np.full(len(struct), -1)
+    names = []
+    plain_elements, plain_moieties = [], []
     for element, element_dict in structure_dictionary.items():
-        print('Making tags for element', element)
         if 'moieties' in element_dict.keys():
             print('Subdividing element {0} into {1} moieties'.format(element, len(element_dict['moieties'])))
             for moiety, indices in element_dict['moieties'].items():
-                print('Making tags for element', moiety)
-                print('Assigning tag', tag_counter)
-                subtag_dict, subtag_list, tag_counter = assign_sub_tags_by_charge(struct, indices, element, moiety,
-                                                                                  tag_counter)
-                tag_dict = {**tag_dict, **subtag_dict}
-                tag_list += subtag_list
+                moieties[np.asarray(indices, dtype=bool) & (numbers == element)] = len(names)
+                names.append(moiety)
         else:
-            print('Assigning tag', tag_counter)
-            indices = element_dict['idx_mask']
-            moiety = '{0}_{1}'.format(element_dict['symbol'], element_label_addition)
-            subtag_dict, subtag_list, tag_counter = assign_sub_tags_by_charge(struct, indices, element, moiety,
-                                                                              tag_counter)
-            tag_dict = {**tag_dict, **subtag_dict}
-            tag_list += subtag_list
+            plain_elements.append(element)
+            plain_moieties.append(len(names))
+            names.append('{0}_{1}'.format(element_dict['symbol'], element_label_addition))
+
+    # Elements without moieties are looked up all at once
+    if plain_elements:
+        plain_elements, plain_moieties = np.array(plain_elements), np.array(plain_moieties)
+        order = np.argsort(plain_elements)
+        position = np.minimum(np.searchsorted(plain_elements[order], numbers), len(plain_elements) - 1)
+        plain = plain_elements[order][position] == numbers
+        moieties[plain] = plain_moieties[order][position[plain]]
+
+    tag_dict, tag_list, _ = assign_tags_by_charge(struct, moieties, names)
     print('Final tag assignments:', tag_dict)
     return tag_dict, tag_list
 
 
-def assign_sub_tags_by_charge(struct, indices, element, name, tag_counter):
+def assign_tags_by_charge(struct, moieties, names, tag_counter=1):
     '''
-    This function assigns tags to your ase object, according to the number of unique charge states present.
-    It takes the framework structure (struct), and first finds each unique charge in the index list.
-    Then, for each unique charge state, it adds a new tag to the Atoms object.
-    This tag then corresponds to a dictionary key, whose value is the string written to DL_MONTE as the atom type.
+    This function assigns tags to your ase object, one for each unique charge state of each moiety.
+    The atoms are sorted by (moiety, charge) once, and each run of equal keys in the sorted order gets the next tag,
+    so tags count up through the moieties in order and through the charges of each moiety from lowest to highest.
+    Each tag then corresponds to a dictionary key, whose value is the string written to DL_MONTE as the atom type.
 
-    Realistically, it's a very overcomplicated way of automatically splitting all atoms down into the following way:
-    [Element]_[index of LJ parameters]_[index of charge state]
+    It splits all atoms down into the following way:
+    [Element]_[index of LJ parameters]_[index of charge state], leaving off the charge state index for moieties
+    with a single charge state
 
     :param struct: (ASE.Atoms) your framework structure as an ASE.Atoms object
-    :param indices: (ndarray) ndarray which is true when the Atoms index == your element/moeity, otherwise false
-    :param element: (int) the atomic number of your element/moiety of choice
-    :param name: (str) the name of your element/moiety of choice e.g. O_COOH
-    :param tag_counter: (int) a counter for the number of tags assigned already
-    :return sub_tag_dict: (dict) a dictionary which connects ASE.Atoms tags of struct to a string for DL_Monte
-    :return sub_tag_list: (ndarray) A list of the same length as struct, with the assigned tag values in it
+    :param moieties: (ndarray) the index in names of each atom's moiety, or -1 to leave the atom untagged (tag 0)
+    :param names: (list) the name of each moiety e.g. O_COOH
+    :param tag_counter: (int) the first tag to assign
+    :return tag_dict: (dict) a dictionary which connects ASE.Atoms tags of struct to a string for DL_Monte
+    :return tag_list: (ndarray) A list of the same length as struct, with the assigned tag values in it
     :return tag_counter: (int) a counter to make sure there's no duplication of ASE.Atoms.tag values between objects
     '''
-    sub_tag_list = np.zeros_like(struct)
-    sub_tag_dict = {}
-    assert len(indices) == len(struct)
-    charge_states = np.unique(struct[indices].get_initial_charges())
-    for count, k in enumerate(charge_states):
-        k_indices = (struct.get_initial_charges() == k) & (struct.numbers == element) & (indices == True)
-        # NB this doesn't protect against 2 atom types having exactly the same charge. How do I do that?
-        # But also, is it a problem if the same element has the same charge type? isn't that what I'm trying to do here?
-        if len(charge_states) > 1:
-            sub_tag_dict[tag_counter] = '{0}_{1}'.format(name, count)
+    moieties = np.asarray(moieties)
+    charges = struct.get_initial_charges()
+    tagged = np.flatnonzero(moieties >= 0)
+    order = tagged[np.lexsort((charges[tagged], moieties[tagged]))]
+    sorted_moieties, sorted_charges = moieties[order], charges[order]
+
+    new_state = np.ones(len(order), dtype=bool)
+    new_state[1:] = (sorted_moieties[1:] != sorted_moieties[:-1]) | (sorted_charges[1:] != sorted_charges[:-1])
+    tag_list = np.zeros(len(struct), dtype=int)
+    tag_list[order] = tag_counter + np.cumsum(new_state) - 1
+
+    state_moieties = sorted_moieties[new_state]
+    n_states = np.bincount(state_moieties, minlength=len(names))
+    first_states = np.searchsorted(state_moieties, np.arange(len(names)))
+    tag_dict = {}
+    for state, moiety in enumerate(state_moieties.tolist()):
+        if n_states[moiety] > 1:
+            tag_dict[tag_counter] = '{0}_{1}'.format(names[moiety], state - first_states[moiety])
         else:
-            sub_tag_dict[tag_counter] = '{0}'.format(name)
-        sub_tag_list[k_indices] = tag_counter
+            tag_dict[tag_counter] = '{0}'.format(names[moiety])
         tag_counter += 1
-    return sub_tag_dict, sub_tag_list, tag_counter
+    return tag_dict, tag_list, tag_counter
+
+
+def compress_framework_types(struct, tag_dict, tag_list, potentials, charge_tolerance=0.0, decimals=5):
+    '''
+    This function merges framework atom types to keep the FIELD file small, since DL_MONTE needs a VDW entry for every
+    pair of types.
+    First, tags of the same element with the same LJ parameters are grouped, whatever their moiety name.
+    Within each group, the charges are then clustered: sorted, with a new cluster started whenever a charge is more
+    than charge_tolerance above the first charge of the current cluster.
+    Each cluster becomes one atom type, whose charge is the mean charge of its atoms rounded to decimals places.
+    The rounding error of the total charge is then taken back out of the types with the most atoms first, so the
+    framework keeps its (integer) net charge as closely as the written precision allows.
+    Types are named as in assign_tags_by_charge, after the LJ key of their group (e.g. C_S_0, C_S_1).
+
+    :param struct: (ASE.Atoms) your framework structure as an ASE.Atoms object, whose charges are updated in place
+    :param tag_dict: (dict) a dictionary which connects ASE.Atoms tags of struct to a string for DL_Monte
+    :param tag_list: (ndarray) a list of the same length as struct, with the assigned tag values in it
+    :param potentials: (dict) the LJ parameters [eps, sigma] of each tag
+    :param charge_tolerance: (float) the largest charge difference within a merged type, in e (0 merges equal charges)
+    :param decimals: (int) the number of decimal places the charges are written with
+    :return tag_dict: (dict) the dictionary of merged tags to DL_Monte atom type names
+    :return tag_list: (ndarray) the merged tag of each atom of struct
+    :return potentials: (dict) the LJ parameters of each merged tag
+    '''
+    tag_list = np.asarray(tag_list, dtype=int)
+    numbers = struct.numbers
+    charges = struct.get_initial_charges()
+
+    # Group the tags by element and LJ parameters, in tag order
+    groups, group_tags = {}, []
+    tag_group = np.full(max(tag_dict) + 1, -1)
+    for tag in sorted(tag_dict):
+        key = (numbers[np.argmax(tag_list == tag)], tuple(potentials[tag]))
+        if key not in groups:
+            groups[key] = len(group_tags)
+            group_tags.append(tag)
+        tag_group[tag] = groups[key]
+    tagged = np.flatnonzero(tag_list > 0)
+    atom_groups = tag_group[tag_list[tagged]]
+
+    # Cluster the distinct charges of each group
+    order = np.lexsort((charges[tagged], atom_groups))
+    sorted_groups, sorted_charges = atom_groups[order], charges[tagged][order]
+    new_value = np.ones(len(order), dtype=bool)
+    new_value[1:] = (sorted_groups[1:] != sorted_groups[:-1]) | (sorted_charges[1:] != sorted_charges[:-1])
+    value_clusters = []
+    cluster_groups, start = [], None
+    for group, charge in zip(sorted_groups[new_value].tolist(), sorted_charges[new_value].tolist()):
+        if not cluster_groups or group != cluster_groups[-1] or charge - start > charge_tolerance:
+            cluster_groups.append(group)
+            start = charge
+        value_clusters.append(len(cluster_groups) - 1)
+    atom_clusters = np.empty(len(tagged), dtype=int)
+    atom_clusters[order] = np.array(value_clusters, dtype=int)[np.cumsum(new_value) - 1]
+
+    cluster_sizes = np.bincount(atom_clusters)
+    cluster_charges = np.round(np.bincount(atom_clusters, charges[tagged]) / cluster_sizes, decimals)
+    net_charge = np.round(charges.sum())
+    untagged_charge = charges.sum() - charges[tagged].sum()
+    for cluster in np.argsort(-cluster_sizes, kind='stable'):
+        residual = net_charge - untagged_charge - np.dot(cluster_sizes, cluster_charges)
+        cluster_charges[cluster] = np.round(cluster_charges[cluster] + residual / cluster_sizes[cluster], decimals)
+
+    new_charges = charges.copy()
+    new_charges[tagged] = cluster_charges[atom_clusters]
+    struct.set_initial_charges(new_charges)
+
+    new_tag_list = np.zeros(len(struct), dtype=int)
+    new_tag_list[tagged] = atom_clusters + 1
+    new_tag_dict, new_potentials = {}, {}
+    cluster_groups = np.array(cluster_groups)
+    for cluster, group in enumerate(cluster_groups.tolist()):
+        tag = group_tags[group]
+        name = '_'.join(tag_dict[tag].split('_')[:2])
+        siblings = np.flatnonzero(cluster_groups == group)
+        if len(siblings) > 1:
+            name = '{0}_{1}'.format(name, cluster - siblings[0])
+        new_tag_dict[cluster + 1] = name
+        new_potentials[cluster + 1] = potentials[tag]
+
+    print('Framework atom types: {0} -> {1}, type pairs: {2} -> {3}, net charge: {4:.2e} -> {5:.2e}'.format(
+        len(tag_dict), len(new_tag_dict), len(tag_dict) * (len(tag_dict) + 1) // 2,
+        len(new_tag_dict) * (len(new_tag_dict) + 1) // 2, charges.sum(), new_charges.sum()))
+    return new_tag_dict, new_tag_list, new_potentials
 
 
 # endregion
 
 
-def from_ase(ase_object, name, interactions_dict, cutoff=12, heterogeneous_vdw=False):
+def from_ase(ase_object, name, interactions_dict, cutoff=12, heterogeneous_vdw=False, keep_charges=False,
+             charge_tolerance=0.0, compact=False):
     if heterogeneous_vdw:
         raise NotImplementedError
-    superstructure = calculate_supercell(ase_object, cutoff)
+    if compact:
+        # Built straight into the arrays of a FrameworkArrays object, without an intermediate ASE.Atoms supercell
+        superstructure = FrameworkArrays.from_atoms(*select_supercell(ase_object, cutoff))
+    else:
+        superstructure = calculate_supercell(ase_object, cutoff)
     atom_masks = make_framework_indices(superstructure)
-    charges = [0 for _ in range(len(superstructure))]
+    if keep_charges:
+        charges = superstructure.get_initial_charges()
+    else:
+        charges = [0 for _ in range(len(superstructure))]
     charged_structure = framework_charges(superstructure, charges)
 
     tag_dict, tag_mask = assign_all_framework_tags(charged_structure, atom_masks)
-    charged_structure.set_tags(tag_mask)
 
     molecule_LJ_by_tag = {}
     for key, value in tag_dict.items():
@@ -469,6 +916,10 @@ def from_ase(ase_object, name, interactions_dict, cutoff=12, heterogeneous_vdw=F
         LJ_key = split_char.join(value.split(split_char)[:2])
         # print("DEBUGGING: ", key, value, LJ_key)
         molecule_LJ_by_tag[key] = interactions_dict[LJ_key]
+
+    tag_dict, tag_mask, molecule_LJ_by_tag = compress_framework_types(charged_structure, tag_dict, tag_mask,
+                                                                      molecule_LJ_by_tag, charge_tolerance)
+    charged_structure.set_tags(tag_mask)
     print(molecule_LJ_by_tag)
 
     output = DLMolecule(
@@ -0,0 +1,184 @@
+"""On-disk cache of frameworks read from CIF files.
+
+Reading a framework means parsing its CIF and expanding the asymmetric unit
+into the unit cell, which is repeated on every simulation run even when the
+file has not changed.  FrameworkCache stores the per-atom arrays of the
+expanded structure (atomic numbers, positions, charges, masses, ...) together
+with its cell in an uncompressed .npz file.  Each entry is keyed by a hash of
+the CIF contents and the reading options, so editing a CIF or changing how it
+is read never returns a stale structure.
+
+Only the arrays, cell and pbc are cached: Atoms.info (spacegroup, occupancies,
+CIF tags) is not restored on a hit.
+
+The cache is bounded by max_bytes.  Entries are evicted least recently used
+first, using file modification times which are refreshed on every hit.
+"""
+
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+import zipfile
+
+import numpy as np
+
+from ase import Atoms
+
+import cif_hack
+
+# Bump this whenever the stored layout changes, so old entries are never read
+CACHE_FORMAT = 1
+
+DEFAULT_MAX_BYTES = 256 * 1024 ** 2
+
+
+def content_hash(cif_file) -> str:
+    """Returns the SHA-256 hex digest of the (decompressed) contents of
+    cif_file, which may be any path accepted by cif_hack.open_cif()."""
+    with cif_hack.open_cif(cif_file) as fd:
+        return hashlib.sha256(fd.read()).hexdigest()
+
+
+def save_atoms(path, atoms: Atoms):
+    """Writes the per-atom arrays, cell and pbc of atoms to the .npz file path."""
+    path = pathlib.Path(path)
+    arrays = {'array_' + name: array for name, array in atoms.arrays.items()}
+    # Written under a temporary name first, so concurrent runs never see a partial file
+    with tempfile.NamedTemporaryFile(dir=path.parent, suffix='.tmp', delete=False) as fd:
+        np.savez(fd, cell=atoms.cell.array, pbc=atoms.pbc, **arrays)
+    os.replace(fd.name, path)
+
+
+def load_atoms(path) -> Atoms:
+    """Reads an Atoms object written by save_atoms()."""
+    with np.load(path, allow_pickle=False) as data:
+        atoms = Atoms(cell=data['cell'], pbc=data['pbc'])
+        atoms.arrays = {key[len('array_'):]: data[key] for key in data.files if key.startswith('array_')}
+    return atoms
+
+
+class FrameworkCache:
+    """A directory of expanded frameworks, keyed by CIF content and reading options.
+
+    hits and misses count the calls to get_atoms() served from disk and
+    those that had to read the CIF file.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = pathlib.Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def entry_path(self, digest: str, options: dict) -> pathlib.Path:
+        key = json.dumps(dict(options, cache_format=CACHE_FORMAT), sort_keys=True)
+        options_hash = hashlib.sha256(key.encode()).hexdigest()[:16]
+        return self.directory / f'{digest}-{options_hash}.npz'
+
+    def get_atoms(self, cif_file, index=0, reader='ase', primitive_cell=False, subtrans_included=True,
+                  fractional_occupancies=True, expansion='compiled') -> Atoms:
+        """Returns the framework in data block *index* of cif_file, as
+        cif_hack.read_cif() would, reading it from the cache if possible."""
+        options = dict(reader=reader, primitive_cell=primitive_cell, subtrans_included=subtrans_included,
+                       fractional_occupancies=fractional_occupancies, expansion=expansion)
+        path = self.entry_path(content_hash(cif_file), dict(options, index=index))
+        try:
+            atoms = load_atoms(path)
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            # Missing, or unreadable (e.g. truncated by a crash), so read the CIF again
+            pass
+        else:
+            self.hits += 1
+            os.utime(path)
+            return atoms
+
+        self.misses += 1
+        atoms = next(cif_hack.read_cif(str(cif_file), index, **options))
+        self._store(path, atoms)
+        return atoms
+
+    def _store(self, path: pathlib.Path, atoms: Atoms):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        save_atoms(path, atoms)
+        self.evict(keep=path)
+
+    def entries(self):
+        """Returns the cache files, least recently used first."""
+        if not self.directory.is_dir():
+            return []
+        return sorted(self.directory.glob('*.npz'), key=lambda path: path.stat().st_mtime)
+
+    def size(self) -> int:
+        return sum(path.stat().st_size for path in self.entries())
+
+    def evict(self, keep=None):
+        """Removes the least recently used entries until the cache fits in max_bytes."""
+        entries = self.entries()
+        total = sum(path.stat().st_size for path in entries)
+        for path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            total -= path.stat().st_size
+            path.unlink()
+
+    def invalidate(self, cif_file=None):
+        """Removes every entry read from cif_file in its current state, or the
+        whole cache if cif_file is None."""
+        if cif_file is None:
+            entries = self.entries()
+        else:
+            entries = list(self.directory.glob(f'{content_hash(cif_file)}-*.npz'))
+        for path in entries:
+            path.unlink()
+
+
+class FrameworkStore:
+    """A directory of expanded frameworks indexed by name, as written by
+    ingest_frameworks.py.
+
+    manifest.json records, for every framework, the CIF file it was read
+    from, its SHA-256, the .npz file holding it and its number of atoms,
+    together with the reading options and the CIF files that failed.
+    """
+
+    MANIFEST = 'manifest.json'
+
+    def __init__(self, directory):
+        self.directory = pathlib.Path(directory)
+        manifest_path = self.directory / self.MANIFEST
+        if manifest_path.exists():
+            with open(manifest_path) as fd:
+                self.manifest = json.load(fd)
+        else:
+            self.manifest = {'format': CACHE_FORMAT, 'options': {}, 'frameworks': {}, 'failures': {}}
+
+    @property
+    def frameworks(self) -> dict:
+        return self.manifest['frameworks']
+
+    @property
+    def failures(self) -> dict:
+        return self.manifest['failures']
+
+    def __len__(self):
+        return len(self.frameworks)
+
+    def __contains__(self, name):
+        return name in self.frameworks
+
+    def __iter__(self):
+        return iter(self.frameworks)
+
+    def get_atoms(self, name) -> Atoms:
+        return load_atoms(self.directory / self.frameworks[name]['file'])
+
+    def write_manifest(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Replaced in one step, so readers never see a half-written manifest
+        with tempfile.NamedTemporaryFile('w', dir=self.directory, suffix='.tmp', delete=False) as fd:
+            json.dump(self.manifest, fd, indent=1, sort_keys=True)
+        os.replace(fd.name, self.directory / self.MANIFEST)
@@ -13,11 +13,15 @@ from glob import glob
 import pandas as pd
 import errno
 import cif2config as c2c
+import cif_hack
+from framework_cache import FrameworkCache
+from input_cache import InputCache
 from glob import glob
 import argparse
 import pathlib
 import json
 import sorbates
+import pores
 
 
 def Pa_to_katm(pressure: str) -> float:
@@ -116,22 +120,89 @@ parser.add_argument('-nmax',
                     required=False,
                     metavar='MAXIMUM_SORBATES',
                     type=int,
-                    default=200,
-                    help='Maximum number of sorbates to simulate in free energy simulations. Defaults to 200')
+                    default=None,
+                    help='Maximum number of sorbates to simulate in free energy simulations. Defaults to the number '
+                         'filling the accessible pore volume of the framework as densely as a liquid')
+parser.add_argument('--FrameworkCharges',
+                    action='store_true',
+                    help='Use the framework charges from the CIF file (_atom_site_charge) instead of neutral atoms.')
+
+parser.add_argument('--ChargeTolerance',
+                    type=float,
+                    action='store',
+                    required=False,
+                    metavar='CHARGE_TOLERANCE',
+                    default=0.0,
+                    help='Largest charge difference (in e) between framework atoms merged into one atom type.')
+
+parser.add_argument('--SkipPreflight',
+                    action='store_true',
+                    help='Write the CONFIG and FIELD files without first checking the framework for overlapping atoms, '
+                         'duplicate or partially occupied sites and (with --FrameworkCharges) a net charge.')
 
+parser.add_argument('--FrameworkCache',
+                    type=str,
+                    action='store',
+                    required=False,
+                    metavar='FRAMEWORK_CACHE',
+                    default=None,
+                    help='Directory caching frameworks read from CIF files. Defaults to INPUT_FOLDER/.framework_cache, '
+                         'set to "none" to always read the CIF file.')
+
+parser.add_argument('--ClearFrameworkCache',
+                    action='store_true',
+                    help='Empty the framework cache before reading the CIF file.')
+
+parser.add_argument('--InputCache',
+                    type=str,
+                    action='store',
+                    required=False,
+                    metavar='INPUT_CACHE',
+                    default=None,
+                    help='Directory storing prepared CONFIG and FIELD files. Defaults to INPUT_FOLDER/.input_cache, '
+                         'set to "none" to always prepare them.')
+
+parser.add_argument('--ClearInputCache',
+                    action='store_true',
+                    help='Empty the store of prepared CONFIG and FIELD files before the run.')
 args = parser.parse_args()
 
 # Now let's set up the paths to the input and output directories, and check they exist
-input_file = pathlib.Path(args.InputFolder, args.FrameworkName).with_suffix('.cif')
-assert input_file.exists(), '''Cannot find input file from specified location: {0}
+# The CIF file may also be compressed (.cif.gz, .cif.xz or .cif.bz2), or inside a tar or zip archive in the input folder
+input_file = cif_hack.find_cif(args.InputFolder, args.FrameworkName)
+assert input_file is not None, '''Cannot find input file for framework {0} in the specified location
 current directory: {1}
 {2}
 input directory: {3}
-{4}'''.format(input_file, os.getcwd(), os.listdir(), args.InputFolder, os.listdir(args.InputFolder))
+{4}'''.format(args.FrameworkName, os.getcwd(), os.listdir(), args.InputFolder, os.listdir(args.InputFolder))
 
 output_folder = pathlib.Path(args.OutputFolder)
 output_folder.mkdir(parents=True, exist_ok=True)  # Makes the directory, if it didn't already exist
 
+# Repeated runs on an unchanged CIF file read the expanded framework back from the cache
+framework_cache = None
+if args.FrameworkCache is None or args.FrameworkCache.lower() != 'none':
+    framework_cache = FrameworkCache(args.FrameworkCache or pathlib.Path(args.InputFolder, '.framework_cache'))
+    if args.ClearFrameworkCache:
+        framework_cache.invalidate()
+
+input_cache = None
+if args.InputCache is None or args.InputCache.lower() != 'none':
+    input_cache = InputCache(args.InputCache or pathlib.Path(args.InputFolder, '.input_cache'))
+    if args.ClearInputCache:
+        input_cache.invalidate()
+
+# The pores of the framework size the sweep and the room DL_MONTE allocates for sorbate molecules
+sorbate = sorbates.lookup[list(args.GasComposition.keys())[0]]
+pore_analysis = pores.analyse(c2c.prepare_framework(input_file, use_cif_hack=True, framework_cache=framework_cache,
+                                                    keep_charges=args.FrameworkCharges,
+                                                    charge_tolerance=args.ChargeTolerance,
+                                                    validate=not args.SkipPreflight), sorbate)
+if args.nmax is None:
+    args.nmax = pores.saturation_loading(pore_analysis, sorbate)
+# Never fewer than the sweep covers
+max_molecules = [1, max(pores.molecule_cap(pore_analysis, sorbate), args.nmax)]
+
 logging.debug(args)
 logging.info(f"""-------------------
 Beginning Automated free energy curve simulation
@@ -146,6 +217,9 @@ Simulation composition: {args.GasComposition} (N.B. gas pressures will only chan
 Simulation pressure (in Pa): {args.Pressure}
 Minimum number of sorbate molecules to consider: {args.nmin}
 Maximum number of sorbate molecules to consider: {args.nmax}
+Accessible pore volume fraction: {pore_analysis.accessible_fraction:.3f} ({pore_analysis.pockets} inaccessible pockets)
+Largest included sphere (in A): {pore_analysis.largest_included_sphere:.2f}
+Maximum number of sorbate molecules in the CONFIG file: {max_molecules[1]}
 -------------------
 """)
 
@@ -158,6 +232,11 @@ if not args.Charges:
     control_obj.main_block.statements['noewald'] = 'all'
 
 control_obj.main_block.statements['temperature'] = args.Temperature
+control_obj.use_block.fed_block.orderparam = fedorder.FEDOrderParameter(name='nmols',
+                                                                        ngrid=(args.nmax - args.nmin) + 1,
+                                                                        xmin=args.nmin - 0.5,
+                                                                        xmax=args.nmax + 0.5,
+                                                                        npow=1)
 
 control_obj.main_block.moves = fedsweep.define_molecule_movers(list(args.GasComposition.keys())[0],
                                                                molpot=args.Pressure)
@@ -168,7 +247,13 @@ config_field_location = pathlib.Path('/run/')
 c2c.create_config_field(input_file=input_file,
                         output_directory=config_field_location,
                         use_cif_hack=True,
-                        sorbate_molecules=[sorbates.lookup[list(args.GasComposition.keys())[0]]])
+                        framework_cache=framework_cache,
+                        keep_charges=args.FrameworkCharges,
+                        charge_tolerance=args.ChargeTolerance,
+                        validate=not args.SkipPreflight,
+                        input_cache=input_cache,
+                        max_molecules=max_molecules,
+                        sorbate_molecules=[sorbate])
 
 # DEBUG: print out the locations of the input files
 
@@ -0,0 +1,424 @@
+"""Henry coefficients and heats of adsorption at infinite dilution, from
+framework energy grids and Widom test-particle insertions.
+
+A GCMC isotherm takes tens of minutes per framework, but its low-loading end
+follows from the energy of a single rigid sorbate molecule in the empty
+framework.  EnergyGrid tabulates the Lennard-Jones energy of each sorbate site
+with the framework on a regular grid over the smallest periodic cell of the
+framework, using the parameters dlmolecule.get_vdw_interactions writes to the
+FIELD file: the same forcefield, mixing rule, pair overrides and rounding, and
+the same cutoff with its long-range correction.  With coulomb, the real-space
+part of the Ewald potential of the framework charges is tabulated as well and
+scaled by the charge of each site; the reciprocal-space part is left out.
+
+widom() inserts the molecule at random positions and orientations, all in
+NumPy: the energy U of each insertion is the sum of the grid energies at its
+sites, interpolated by cubic convolution (see interpolate()), which at the
+default 0.2 A spacing gives Henry coefficients within about 1% of summing over
+the framework atoms directly.  Averaging the Boltzmann factors W gives the
+Henry coefficient K_H = <W> / (R T rho) and the isosteric heat of adsorption at
+infinite dilution q = R T - R <U W> / <W>, with U in K.
+
+Grids take most of the time and only depend on the framework, the forcefield
+and the site type, so GridCache keeps them under a hash of those, in memory
+and, given a directory, on disk.
+"""
+
+import hashlib
+import json
+import math
+import os
+import pathlib
+import tempfile
+import time
+from itertools import product
+from typing import NamedTuple
+
+import numpy as np
+from scipy.special import erfc
+
+import dlmolecule as dlm
+import forcefield as ff
+from framework_cache import DEFAULT_MAX_BYTES
+from input_cache import molecule_hash
+
+# Bump this whenever the tabulated energies change, so old grids are never read
+CACHE_FORMAT = 1
+
+GAS_CONSTANT = 8.314462618  # J / mol / K
+ATOMIC_MASS = 1.66053906660e-27  # kg
+# e^2 / (4 pi epsilon_0 k_B): the energy in K of two unit charges 1 A apart
+ELECTROSTATIC_CONSTANT = 167101.0
+
+DEFAULT_SPACING = 0.2
+DEFAULT_ALPHA = 0.3
+# Charged sites closer than this to a framework atom are treated as overlapping it
+DEFAULT_OVERLAP_DISTANCE = 1.0
+# Grid energies are capped, in K, so interpolating next to an atom never overflows
+ENERGY_CAP = 1e5
+# Grid values, in K, above which interpolate() falls back from cubic to trilinear interpolation
+CUBIC_LIMIT = 2e4
+
+
+def prepare_framework(atoms, forcefield='UFF', keep_charges=False, charge_tolerance=0.0):
+    """Returns the framework DLMolecule of atoms on its smallest periodic cell,
+    with the atom types and potentials cif2config writes to the FIELD file."""
+    return dlm.from_ase(atoms, 'framework', ff.get_forcefield(forcefield), cutoff=0, keep_charges=keep_charges,
+                        charge_tolerance=charge_tolerance, compact=True)
+
+
+def site_parameters(framework, sorbate, forcefield='UFF'):
+    """Returns the mixed epsilon and sigma of every sorbate atom type with every
+    framework atom type, as {sorbate tag: (epsilon, sigma)} with one value per
+    tag of framework.tags, rounded as in the FIELD file.  Pairs the FIELD
+    file leaves out have an epsilon of zero."""
+    forcefield = ff.get_forcefield(forcefield)
+    framework_tags, sorbate_tags = list(framework.tags), list(sorbate.tags)
+    names = [framework.tags[tag] for tag in framework_tags] + [sorbate.tags[tag] for tag in sorbate_tags]
+    potentials = np.array([framework.potentials[tag][:2] for tag in framework_tags] +
+                          [sorbate.potentials[tag][:2] for tag in sorbate_tags], dtype=float).reshape(-1, 2)
+    pair_epsilon, pair_sigma = ff.pair_table(names, potentials[:, 0], potentials[:, 1], forcefield.mixing_rule,
+                                             forcefield.overrides)
+    n = len(framework_tags)
+    epsilon = np.round(pair_epsilon[n:, :n], 3)
+    sigma = np.round(pair_sigma[n:, :n], 3)
+    epsilon[epsilon <= 0] = 0.0
+    return {tag: (epsilon[i], sigma[i]) for i, tag in enumerate(sorbate_tags)}
+
+
+def _cubic_weights(offset):
+    # The cubic convolution weights (Keys, a = -1/2) of the grid points at -1, 0, 1 and 2 from each offset
+    x = np.abs(np.arange(-1, 3) - offset[..., np.newaxis])
+    return np.where(x <= 1, (1.5 * x - 2.5) * x * x + 1, np.where(x < 2, ((-0.5 * x + 2.5) * x - 4) * x + 2, 0.0))
+
+
+def interpolate(grid, fractional, limit=CUBIC_LIMIT):
+    """Interpolates the periodic grid at the fractional coordinates
+    fractional, an array of shape (..., 3).
+
+    Values are interpolated by cubic convolution over the 4 x 4 x 4 grid
+    points around each position, or trilinearly over the 8 nearest where any
+    of those exceeds limit in magnitude, as cubic weights overshoot next to the
+    steep walls around atoms.
+    """
+    shape = np.array(grid.shape)
+    scaled = np.asarray(fractional) % 1.0 * shape
+    base = np.floor(scaled).astype(np.int64)
+    offset = scaled - base
+    cubic_weights = _cubic_weights(offset)
+    values = grid.ravel()
+    cubic, linear = np.zeros(scaled.shape[:-1]), np.zeros(scaled.shape[:-1])
+    largest = np.zeros(scaled.shape[:-1])
+    for corner in product(range(-1, 3), repeat=3):
+        index = (base + corner) % shape
+        value = values[(index[..., 0] * shape[1] + index[..., 1]) * shape[2] + index[..., 2]]
+        cubic += np.prod(cubic_weights[..., np.arange(3), np.add(corner, 1)], axis=-1) * value
+        np.maximum(largest, np.abs(value), out=largest)
+        if min(corner) >= 0 and max(corner) <= 1:
+            linear += np.prod(np.where(corner, offset, 1.0 - offset), axis=-1) * value
+    return np.where(largest > limit, linear, cubic)
+
+
+class GridCache:
+    """Energy grids by key, held in memory and, given a directory, in .npy
+    files bounded by max_bytes, evicted least recently used first.
+
+    hits and misses count the calls to get() served from memory or disk and
+    those that found no grid.
+    """
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = None if directory is None else pathlib.Path(directory)
+        self.max_bytes = max_bytes
+        self.grids = {}
+        self.hits = 0
+        self.misses = 0
+
+    def entry_path(self, key: str) -> pathlib.Path:
+        return self.directory / f'{key}.npy'
+
+    def get(self, key: str):
+        """Returns the grid stored under key, or None if there is none."""
+        if key not in self.grids and self.directory is not None:
+            path = self.entry_path(key)
+            try:
+                self.grids[key] = np.load(path, allow_pickle=False)
+            except (OSError, ValueError):
+                # Missing, or unreadable (e.g. truncated by a crash), so the grid must be tabulated again
+                pass
+            else:
+                os.utime(path)
+        if key not in self.grids:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self.grids[key]
+
+    def store(self, key: str, grid):
+        self.grids[key] = grid
+        if self.directory is None:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Written under a temporary name first, so concurrent runs never see a partial file
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix='.tmp', delete=False) as fd:
+            np.save(fd, grid)
+        os.replace(fd.name, self.entry_path(key))
+        self.evict(keep=self.entry_path(key))
+
+    def entries(self):
+        """Returns the grid files, least recently used first."""
+        if self.directory is None or not self.directory.is_dir():
+            return []
+        return sorted(self.directory.glob('*.npy'), key=lambda path: path.stat().st_mtime)
+
+    def size(self) -> int:
+        return sum(path.stat().st_size for path in self.entries())
+
+    def evict(self, keep=None):
+        """Removes the least recently used grid files until they fit in max_bytes."""
+        entries = self.entries()
+        total = sum(path.stat().st_size for path in entries)
+        for path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            total -= path.stat().st_size
+            path.unlink()
+
+    def invalidate(self):
+        """Removes every grid, in memory and on disk."""
+        self.grids.clear()
+        for path in self.entries():
+            path.unlink()
+
+
+class EnergyGrid:
+    """The energies of sorbate sites in a framework, tabulated on a grid of
+    fractional coordinates spanning its periodic cell, about spacing A apart.
+
+    framework is a DLMolecule as made by prepare_framework(); its charges are
+    only used with coulomb.  Grids are tabulated on first use and kept in
+    cache, a GridCache.
+    """
+
+    def __init__(self, framework, forcefield='UFF', cutoff=12, spacing=DEFAULT_SPACING, coulomb=False,
+                 alpha=DEFAULT_ALPHA, overlap_distance=DEFAULT_OVERLAP_DISTANCE, cache=None):
+        self.framework = framework
+        self.forcefield = ff.get_forcefield(forcefield)
+        self.cutoff = cutoff
+        self.coulomb = coulomb
+        self.alpha = alpha
+        self.overlap_distance = overlap_distance
+        self.cache = GridCache() if cache is None else cache
+        self.cell = np.asarray(framework.molecule.cell, dtype=float)
+        self.shape = tuple(max(int(math.ceil(length / spacing)), 1) for length in np.linalg.norm(self.cell, axis=1))
+        self.volume = abs(np.linalg.det(self.cell))
+        # kg / m^3
+        self.density = framework.molecule.get_masses().sum() * ATOMIC_MASS / (self.volume * 1e-30)
+        self._framework_hash = molecule_hash(framework)
+
+    def _key(self, kind, parameters) -> str:
+        description = dict(framework=self._framework_hash, kind=kind, parameters=parameters, shape=self.shape,
+                           cutoff=self.cutoff, cache_format=CACHE_FORMAT)
+        return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+    def site_grids(self, sorbate) -> dict:
+        """Returns the Lennard-Jones energy grid of each atom type of sorbate, in K, by tag."""
+        parameters = site_parameters(self.framework, sorbate, self.forcefield)
+        keys = {tag: self._key('lj', [epsilon.tolist(), sigma.tolist()]) for tag, (epsilon, sigma) in
+                parameters.items()}
+        grids = {tag: self.cache.get(key) for tag, key in keys.items()}
+        missing = [tag for tag, grid in grids.items() if grid is None]
+        if missing:
+            tabulated = self._tabulate([parameters[tag] for tag in missing])
+            for tag, grid in zip(missing, tabulated):
+                grids[tag] = grid
+                self.cache.store(keys[tag], grid)
+        return grids
+
+    def electrostatic_grid(self):
+        """Returns the real-space Ewald potential of the framework charges, in K
+        per unit charge, and the mask of the grid points closer than
+        overlap_distance to a framework atom."""
+        key = self._key('coulomb', [self.alpha, self.overlap_distance])
+        grid = self.cache.get(key)
+        if grid is None:
+            grid = self._tabulate([], electrostatic=True)[0]
+            self.cache.store(key, grid)
+        # Stored together, with the overlapping points as NaN
+        return np.nan_to_num(grid, nan=ENERGY_CAP), np.isnan(grid)
+
+    def _stencil(self):
+        # The offsets in grid points, and the vectors, from a grid point to every grid point that can be within cutoff
+        # of an atom in the grid cell next to it, and the flat offsets in a grid padded by reach on every side
+        shape = np.array(self.shape)
+        reach = np.ceil(self.cutoff / dlm.perpendicular_widths(self.cell) * shape).astype(np.int64) + 1
+        offsets = np.stack(np.meshgrid(*(np.arange(-r, r + 1) for r in reach), indexing='ij'), axis=-1).reshape(-1, 3)
+        vectors = (offsets / shape) @ self.cell
+        squared = np.einsum('ij,ij->i', vectors, vectors)
+        diagonal = np.linalg.norm(self.cell, axis=1) @ (1 / shape)
+        near = squared < (self.cutoff + diagonal) ** 2
+        padded_shape = shape + 2 * reach
+        offsets = offsets[near]
+        flat = (offsets[:, 0] * padded_shape[1] + offsets[:, 1]) * padded_shape[2] + offsets[:, 2]
+        return reach, padded_shape, flat, vectors[near], squared[near]
+
+    def _tabulate(self, parameters, electrostatic=False):
+        # The grids of several site types at once, sharing the distances from each atom to the grid points around it.
+        # Every atom adds its energies to a grid padded by the cutoff through the same stencil, then the padding is
+        # folded back into the periodic grid.
+        framework_tags = list(self.framework.tags)
+        type_index = np.zeros(max(framework_tags) + 1, dtype=np.int64)
+        type_index[framework_tags] = np.arange(len(framework_tags))
+        atom_types = type_index[self.framework.molecule.get_tags()]
+        charges = self.framework.molecule.get_initial_charges()
+        counts = np.bincount(atom_types, minlength=len(framework_tags))
+
+        shape = np.array(self.shape)
+        reach, padded_shape, flat, vectors, squared = self._stencil()
+        scaled = np.linalg.solve(self.cell.T, np.asarray(self.framework.molecule.positions).T).T % 1.0
+        # x % 1.0 is 1.0 for tiny negative x
+        scaled[scaled >= 1.0] = 0.0
+        corners = np.floor(scaled * shape).astype(np.int64)
+        padded = [np.zeros(np.prod(padded_shape)) for _ in range(len(parameters) + 2 * electrostatic)]
+        for atom, atom_type in enumerate(atom_types.tolist()):
+            delta = (corners[atom] / shape - scaled[atom]) @ self.cell
+            distance_2 = squared + 2 * (vectors @ delta) + delta @ delta
+            inside = distance_2 < self.cutoff ** 2
+            inverse_2 = np.where(inside, 1 / np.maximum(distance_2, 1e-12), 0.0)
+            index = np.ravel_multi_index(corners[atom] + reach, padded_shape) + flat
+            for grid, (epsilon, sigma) in zip(padded, parameters):
+                if epsilon[atom_type] > 0:
+                    sigma_6 = (sigma[atom_type] ** 2 * inverse_2) ** 3
+                    grid[index] += 4.0 * epsilon[atom_type] * (sigma_6 * sigma_6 - sigma_6)
+            if electrostatic:
+                if charges[atom] != 0:
+                    distance = np.sqrt(distance_2)
+                    padded[-2][index] += charges[atom] * erfc(self.alpha * distance) * np.sqrt(inverse_2)
+                padded[-1][index] += distance_2 < self.overlap_distance ** 2
+        grids = [_fold(grid.reshape(padded_shape), reach, shape) for grid in padded]
+
+        if electrostatic:
+            overlapping = grids.pop() > 0
+            grids[-1] *= ELECTROSTATIC_CONSTANT
+            grids[-1][overlapping] = np.nan
+        # The long-range correction of the FIELD file's LJ interactions, for a uniform framework beyond the cutoff
+        densities = counts / self.volume
+        for grid, (epsilon, sigma) in zip(grids, parameters):
+            ratio_3 = (sigma / self.cutoff) ** 3
+            grid += np.sum(16 * np.pi * densities * epsilon * sigma ** 3 * (ratio_3 ** 3 / 9 - ratio_3 / 3))
+        for grid in grids[:len(parameters)]:
+            np.minimum(grid, ENERGY_CAP, out=grid)
+        return grids
+
+
+def _fold(padded, reach, shape):
+    # Adds the padding of a grid padded by reach on every side back onto the periodic grid of shape
+    for axis, (r, n) in enumerate(zip(reach.tolist(), shape.tolist())):
+        folded = np.zeros(padded.shape[:axis] + (n,) + padded.shape[axis + 1:])
+        for start in range(0, padded.shape[axis], n):
+            block = np.arange(start, min(start + n, padded.shape[axis]))
+            folded[(slice(None),) * axis + ((block - r) % n,)] += np.take(padded, block, axis=axis)
+        padded = folded
+    return padded
+
+
+def random_rotations(n, rng) -> np.ndarray:
+    """Returns n rotation matrices drawn uniformly, from random unit quaternions."""
+    q = rng.normal(size=(n, 4))
+    q /= np.linalg.norm(q, axis=1)[:, np.newaxis]
+    w, x, y, z = q.T
+    return np.stack([
+        np.stack([1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)], axis=-1),
+        np.stack([2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)], axis=-1),
+        np.stack([2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)], axis=-1),
+    ], axis=1)
+
+
+def insertion_sites(grid, sorbate, centres, rotations) -> np.ndarray:
+    """Returns the fractional coordinates of the sites of sorbate inserted with
+    its centre at the fractional coordinates centres, rotated by rotations,
+    as an array of shape (len(centres), number of sites, 3)."""
+    positions = np.asarray(sorbate.molecule.positions, dtype=float)
+    positions = positions - positions.mean(axis=0)
+    sites = centres[:, np.newaxis] @ grid.cell + positions @ rotations.transpose(0, 2, 1)
+    return sites @ np.linalg.inv(grid.cell)
+
+
+def insertion_energies(grid, sorbate, centres, rotations) -> np.ndarray:
+    """Returns the energy in K of each insertion of sorbate, see insertion_sites()."""
+    site_grids = grid.site_grids(sorbate)
+    sites = insertion_sites(grid, sorbate, centres, rotations)
+    tags = sorbate.molecule.get_tags()
+    energies = np.zeros(len(centres))
+    for site, tag in enumerate(tags.tolist()):
+        energies += interpolate(site_grids[tag], sites[:, site])
+    if grid.coulomb:
+        potential, overlapping = grid.electrostatic_grid()
+        for site, charge in enumerate(sorbate.molecule.get_initial_charges().tolist()):
+            if charge == 0:
+                continue
+            energies += charge * interpolate(potential, sites[:, site])
+            # Any overlapping corner blocks the insertion, or the charges could pull a site into an atom
+            energies[interpolate(overlapping.astype(float), sites[:, site], limit=-1) > 0] = ENERGY_CAP
+    return np.minimum(energies, ENERGY_CAP)
+
+
+class WidomResult(NamedTuple):
+    """The Henry coefficient (mol / kg / Pa) and heat of adsorption at infinite
+    dilution (kJ / mol) from Widom insertions, with their standard errors over
+    blocks of insertions."""
+    henry: float
+    henry_error: float
+    heat: float
+    heat_error: float
+    insertions: int
+    seconds: float
+
+
+def widom(grid, sorbate, temperature, insertions=100000, blocks=5, seed=None, chunksize=100000) -> WidomResult:
+    """Inserts the rigid molecule sorbate into the framework of grid at
+    uniformly random positions and orientations, insertions times, and returns
+    the Henry coefficient and heat of adsorption at temperature (K)."""
+    # Tabulated before the insertions, so they are not counted in the seconds
+    grid.site_grids(sorbate)
+    if grid.coulomb:
+        grid.electrostatic_grid()
+    start = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    block_sizes = np.diff(np.linspace(0, insertions, blocks + 1).astype(int))
+    weights, weighted_energies = np.zeros(blocks), np.zeros(blocks)
+    for block, size in enumerate(block_sizes):
+        for chunk_start in range(0, size, chunksize):
+            n = min(chunksize, size - chunk_start)
+            energies = insertion_energies(grid, sorbate, rng.random((n, 3)), random_rotations(n, rng))
+            boltzmann = np.exp(-energies / temperature)
+            weights[block] += boltzmann.sum()
+            weighted_energies[block] += (energies * boltzmann).sum()
+
+    def henry(weight, count):
+        return weight / count / (GAS_CONSTANT * temperature * grid.density)
+
+    def heat(weight, weighted_energy):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return GAS_CONSTANT * (temperature - weighted_energy / weight) / 1000
+
+    def error(values):
+        return float(np.std(values, ddof=1) / np.sqrt(blocks)) if blocks > 1 else float('nan')
+
+    return WidomResult(henry=float(henry(weights.sum(), insertions)), henry_error=error(henry(weights, block_sizes)),
+                       heat=float(heat(weights.sum(), weighted_energies.sum())),
+                       heat_error=error(heat(weights, weighted_energies)), insertions=insertions,
+                       seconds=time.perf_counter() - start)
+
+
+def henry_coefficient(atoms, sorbate, temperature, forcefield='UFF', cutoff=12, spacing=DEFAULT_SPACING,
+                      coulomb=False, insertions=100000, seed=None, cache=None) -> WidomResult:
+    """Returns the Henry coefficient and heat of adsorption of sorbate, a
+    DLMolecule such as sorbates.lookup['CO2'], in the framework atoms (an
+    ASE.Atoms object) at temperature (K).  With coulomb, the framework
+    charges in atoms are used."""
+    framework = prepare_framework(atoms, forcefield, keep_charges=coulomb)
+    grid = EnergyGrid(framework, forcefield, cutoff=cutoff, spacing=spacing, coulomb=coulomb, cache=cache)
+    return widom(grid, sorbate, temperature, insertions=insertions, seed=seed)
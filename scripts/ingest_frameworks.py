@@ -0,0 +1,199 @@
+"""Reads a directory of framework CIF files into a framework store in parallel.
+
+Every CIF file matching the pattern is parsed and expanded into its unit cell
+in a pool of worker processes, and written to the store directory as
+<name>.npz, where name is the file name without its CIF and compression
+suffixes.  CIF files may be gzip, xz or bz2 compressed, and tar or zip
+archives matching the pattern are read member by member without extracting
+them (see cif_hack.open_cif()).  The store's
+manifest.json indexes the frameworks and records the files that failed, so a
+single bad CIF does not stop the batch.  Files whose contents have not changed
+since they were last ingested with the same options are skipped.
+
+    python ingest_frameworks.py --InputFolder ../interface --OutputFolder ../interface/frameworks
+
+The frameworks are then read back with framework_cache.FrameworkStore.
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import hashlib
+import io
+import os
+import pathlib
+import time
+import warnings
+
+import cif_hack
+from framework_cache import FrameworkStore, save_atoms
+
+
+def ingest_file(cif_file, data, npz_path, options, previous=None):
+    '''
+    Reads the first structure in a CIF file and writes it to npz_path, catching any error.
+
+    :param cif_file: (str) the CIF file, or the 'archive::member' path of an archive member
+    :param data: (bytes) the raw contents of the archive member, or None to read cif_file
+    :param npz_path: (pathlib.Path) the file to write the expanded structure to
+    :param options: (dict) keyword arguments of cif_hack.read_cif
+    :param previous: (dict) the manifest record of the last ingestion of this framework, if any
+    :return record: (dict) the manifest record, with an 'error' entry if the file failed
+    '''
+    start = time.perf_counter()
+    record = {'cif': cif_file}
+    try:
+        if data is None:
+            with cif_hack.open_cif(cif_file) as fd:
+                data = fd.read()
+        data = cif_hack.decompress_cif(data)
+        record['sha256'] = hashlib.sha256(data).hexdigest()
+        if previous is not None and previous['sha256'] == record['sha256'] and npz_path.exists():
+            return dict(previous, cif=cif_file, unchanged=True)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            atoms = next(cif_hack.read_cif(io.BytesIO(data), 0, **options), None)
+        if atoms is None:
+            raise cif_hack.NoStructureData('No structure found in CIF file')
+        save_atoms(npz_path, atoms)
+    except Exception as error:
+        record['error'] = f'{type(error).__name__}: {error}'
+    else:
+        record.update(file=npz_path.name, atoms=len(atoms), formula=atoms.get_chemical_formula(),
+                      warnings=sorted({str(warning.message) for warning in caught}))
+    record['seconds'] = time.perf_counter() - start
+    return record
+
+
+def cif_sources(paths):
+    '''
+    Yields the CIF files among paths, and the CIF members of the tar and zip archives among them, one at a time.
+
+    :param paths: (list) paths of CIF files and archives; other files are ignored
+    :return: (generator) tuples of the framework name, the CIF path (see cif_hack.open_cif) and the raw contents of
+        archive members (None for files)
+    '''
+    for path in sorted(map(pathlib.Path, paths)):
+        if not path.is_file():
+            continue
+        if cif_hack.is_cif_name(path.name):
+            yield cif_hack.cif_name(path), str(path), None
+        elif cif_hack.is_cif_archive(path.name):
+            for member, data in cif_hack.iter_cif_archive(path):
+                yield cif_hack.cif_name(member), f'{path}{cif_hack.ARCHIVE_SEPARATOR}{member}', data
+
+
+def ingest(cif_files, store_directory, processes=None, force=False, **options):
+    '''
+    Reads CIF files into a framework store across a process pool and updates its manifest.
+
+    :param cif_files: (list) paths of the CIF files to ingest
+    :param store_directory: (pathlib.Path) the framework store directory
+    :param processes: (int) the number of worker processes, defaulting to the number of CPUs
+    :param force: (bool) re-read files even if they have not changed since they were last ingested
+    :param options: keyword arguments of cif_hack.read_cif, e.g. reader='fast'
+    :return store: (framework_cache.FrameworkStore) the updated store
+    '''
+    store = FrameworkStore(store_directory)
+    store.directory.mkdir(parents=True, exist_ok=True)
+    if store.manifest['options'] != options:
+        # Frameworks read with other options cannot be reused or mixed with these
+        store.manifest.update(options=options, frameworks={}, failures={})
+
+    def record_result(name, record):
+        nonlocal read, unchanged, failed
+        if 'error' in record:
+            failed += 1
+            store.frameworks.pop(name, None)
+            store.failures[name] = record
+        else:
+            if record.pop('unchanged', False):
+                unchanged += 1
+            else:
+                read += 1
+            store.failures.pop(name, None)
+            store.frameworks[name] = record
+
+    start = time.perf_counter()
+    read, unchanged, failed = 0, 0, 0
+    names = set()
+    processes = processes or os.cpu_count() or 1
+    with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+        # Archive members are read here and sent to the workers, so only a bounded number are held in memory
+        pending = collections.deque()
+        for name, cif_file, data in cif_sources(cif_files):
+            if name in names:
+                failed += 1
+                # Recorded under its path, so it cannot clash with the framework of that name
+                store.failures[cif_file] = {'cif': cif_file, 'error': f'duplicate framework name {name!r}'}
+                continue
+            names.add(name)
+            previous = None if force else store.frameworks.get(name)
+            pending.append((name, pool.submit(ingest_file, cif_file, data, store.directory / f'{name}.npz',
+                                              options, previous)))
+            if len(pending) >= 8 * processes:
+                name, future = pending.popleft()
+                record_result(name, future.result())
+        while pending:
+            name, future = pending.popleft()
+            record_result(name, future.result())
+    seconds = time.perf_counter() - start
+    store.write_manifest()
+
+    total = read + unchanged + failed
+    print(f'{total} CIF files in {seconds:.2f} s: {read} read, {unchanged} unchanged, {failed} failed '
+          f'({total / seconds if seconds else 0.0:.1f} structures/s)')
+    for name, record in store.failures.items():
+        print(f'  {name}: {record["error"]}')
+    return store
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-i', '--InputFolder',
+                        type=str,
+                        action='store',
+                        required=False,
+                        metavar='INPUT_FOLDER',
+                        default='.',
+                        help='Location of the framework CIF files.')
+
+    parser.add_argument('-g', '--Pattern',
+                        type=str,
+                        action='store',
+                        required=False,
+                        metavar='PATTERN',
+                        default='*',
+                        help='Glob pattern of the CIF files and archives within INPUT_FOLDER, e.g. "**/*.cif.gz". '
+                             'Other files are ignored.')
+
+    parser.add_argument('-o', '--OutputFolder',
+                        type=str,
+                        action='store',
+                        required=True,
+                        metavar='OUTPUT_FOLDER',
+                        help='Framework store directory.')
+
+    parser.add_argument('-n', '--Processes',
+                        type=int,
+                        action='store',
+                        required=False,
+                        metavar='PROCESSES',
+                        default=None,
+                        help='Number of worker processes. Defaults to the number of CPUs.')
+
+    parser.add_argument('-r', '--Reader',
+                        type=str,
+                        action='store',
+                        required=False,
+                        metavar='READER',
+                        default='fast',
+                        help='cif_hack reader: ase, fast, lazy or pycodcif.')
+
+    parser.add_argument('--Force',
+                        action='store_true',
+                        help='Re-read every CIF file, even those unchanged since they were last ingested.')
+    args = parser.parse_args()
+
+    cif_files = list(pathlib.Path(args.InputFolder).glob(args.Pattern))
+    ingest(cif_files, args.OutputFolder, processes=args.Processes, force=args.Force, reader=args.Reader)
@@ -0,0 +1,161 @@
+"""On-disk store of prepared DL_MONTE CONFIG and FIELD files.
+
+Preparing the inputs of a simulation means reading the framework CIF, building
+its supercell, tagging its atom types, mixing the VDW interactions and writing
+the files, all of which give the same result whenever the same framework is
+simulated with the same forcefield, cutoff and sorbates.  InputCache keeps the
+CONFIG and FIELD files of every preparation in a directory of their own, keyed
+by a hash of the CIF contents, the forcefield parameters, the sorbate molecules,
+the preparation options and the code that prepares them, so repeated runs copy
+the files instead of preparing them again.
+
+Like framework_cache.FrameworkCache, the store is bounded by max_bytes and
+evicts its least recently used entries first, using directory modification
+times which are refreshed on every hit.
+"""
+
+import functools
+import hashlib
+import importlib.metadata
+import json
+import os
+import pathlib
+import shutil
+import tempfile
+
+import numpy as np
+
+from framework_cache import DEFAULT_MAX_BYTES, content_hash
+
+# Bump this whenever the stored layout changes, so old entries are never read
+CACHE_FORMAT = 1
+
+# The modules whose code determines the prepared files, relative to this one
+CODE_FILES = ('cif_hack.py', 'symmetry.py', 'dlmolecule.py', 'forcefield.py', 'cif2config.py', 'pores.py')
+
+
+@functools.lru_cache(maxsize=1)
+def code_version() -> str:
+    """Returns a hash of the preparation code: the CODE_FILES sources and the
+    installed dlmontepython version."""
+    digest = hashlib.sha256()
+    directory = pathlib.Path(__file__).resolve().parent
+    for name in CODE_FILES:
+        digest.update((directory / name).read_bytes())
+    try:
+        digest.update(importlib.metadata.version('dlmontepython').encode())
+    except importlib.metadata.PackageNotFoundError:
+        pass
+    return digest.hexdigest()
+
+
+def forcefield_hash(forcefield) -> str:
+    """Returns a hash of the parameters, mixing rule and overrides of a forcefield.Forcefield."""
+    description = [forcefield.name, forcefield.types, forcefield.epsilon.tolist(), forcefield.sigma.tolist(),
+                   forcefield.mixing_rule, sorted([list(pair), list(value)] for pair, value in
+                                                  forcefield.overrides.items())]
+    return hashlib.sha256(json.dumps(description).encode()).hexdigest()
+
+
+def molecule_hash(molecule) -> str:
+    """Returns a hash of a dlmolecule.DLMolecule: its name, atom type names and
+    potentials, and the numbers, positions, tags, masses and charges of its atoms."""
+    digest = hashlib.sha256()
+    description = [molecule.name, {str(tag): name for tag, name in molecule.tags.items()},
+                   {str(tag): list(potential) for tag, potential in molecule.potentials.items()}]
+    digest.update(json.dumps(description, sort_keys=True).encode())
+    atoms = molecule.molecule
+    for array in (atoms.numbers, atoms.get_tags()):
+        digest.update(np.ascontiguousarray(array, dtype=np.int64).tobytes())
+    for array in (atoms.positions, atoms.get_masses(), atoms.get_initial_charges(), atoms.cell):
+        digest.update(np.ascontiguousarray(array, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+class InputCache:
+    """A directory of prepared CONFIG and FIELD files, one subdirectory per
+    combination of framework, forcefield, sorbates and options.
+
+    hits and misses count the calls to restore() served from the store and
+    those that found no entry.
+    """
+
+    FILES = ('CONFIG', 'FIELD')
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = pathlib.Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, cif_file, forcefield, sorbate_molecules, **options) -> str:
+        """Returns the key of the files prepared from cif_file with forcefield
+        and sorbate_molecules, and the create_config_field options, e.g. cutoff."""
+        description = dict(cif=content_hash(cif_file), forcefield=forcefield_hash(forcefield),
+                           sorbates=[molecule_hash(molecule) for molecule in sorbate_molecules],
+                           options=options, code=code_version(), cache_format=CACHE_FORMAT)
+        return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+    def entry_path(self, key: str) -> pathlib.Path:
+        return self.directory / key
+
+    def restore(self, key: str, output_directory) -> bool:
+        """Copies the files stored under key into output_directory, returning
+        False if there are none."""
+        path = self.entry_path(key)
+        try:
+            for name in self.FILES:
+                shutil.copyfile(path / name, pathlib.Path(output_directory) / name)
+        except OSError:
+            # Missing, or evicted while being copied, so the files must be prepared again
+            self.misses += 1
+            return False
+        self.hits += 1
+        os.utime(path)
+        return True
+
+    def store(self, key: str, output_directory):
+        """Stores the files prepared in output_directory under key."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Filled under a temporary name first, so concurrent runs never see a partial entry
+        staging = pathlib.Path(tempfile.mkdtemp(dir=self.directory, suffix='.tmp'))
+        for name in self.FILES:
+            shutil.copyfile(pathlib.Path(output_directory) / name, staging / name)
+        try:
+            os.replace(staging, self.entry_path(key))
+        except OSError:
+            # Another run stored the same entry first
+            shutil.rmtree(staging, ignore_errors=True)
+        self.evict(keep=self.entry_path(key))
+
+    def entries(self):
+        """Returns the entry directories, least recently used first."""
+        if not self.directory.is_dir():
+            return []
+        entries = [path for path in self.directory.iterdir() if path.is_dir() and path.suffix != '.tmp']
+        return sorted(entries, key=lambda path: path.stat().st_mtime)
+
+    @staticmethod
+    def entry_size(path: pathlib.Path) -> int:
+        return sum(file.stat().st_size for file in path.iterdir())
+
+    def size(self) -> int:
+        return sum(self.entry_size(path) for path in self.entries())
+
+    def evict(self, keep=None):
+        """Removes the least recently used entries until the store fits in max_bytes."""
+        entries = self.entries()
+        sizes = {path: self.entry_size(path) for path in entries}
+        total = sum(sizes.values())
+        for path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            total -= sizes[path]
+            shutil.rmtree(path, ignore_errors=True)
+
+    def invalidate(self):
+        """Removes every entry."""
+        for path in self.entries():
+            shutil.rmtree(path, ignore_errors=True)
@@ -12,6 +12,9 @@ import dlmontepython.simtask.measurement as measurement
 import dlmontepython.simtask.task as task
 import isotherm_control_generator as isotherm
 import cif2config as c2c
+import cif_hack
+from framework_cache import FrameworkCache
+from input_cache import InputCache
 from glob import glob
 import argparse
 import pathlib
@@ -102,21 +105,78 @@ parser.add_argument('-q', '--Charges',
                     type=bool,
                     default=True,
                     help='Ewald summation charges - set to False to turn off charges')
+
+parser.add_argument('--FrameworkCharges',
+                    action='store_true',
+                    help='Use the framework charges from the CIF file (_atom_site_charge) instead of neutral atoms.')
+
+parser.add_argument('--ChargeTolerance',
+                    type=float,
+                    action='store',
+                    required=False,
+                    metavar='CHARGE_TOLERANCE',
+                    default=0.0,
+                    help='Largest charge difference (in e) between framework atoms merged into one atom type.')
+
+parser.add_argument('--SkipPreflight',
+                    action='store_true',
+                    help='Write the CONFIG and FIELD files without first checking the framework for overlapping atoms, '
+                         'duplicate or partially occupied sites and (with --FrameworkCharges) a net charge.')
+
+parser.add_argument('--FrameworkCache',
+                    type=str,
+                    action='store',
+                    required=False,
+                    metavar='FRAMEWORK_CACHE',
+                    default=None,
+                    help='Directory caching frameworks read from CIF files. Defaults to INPUT_FOLDER/.framework_cache, '
+                         'set to "none" to always read the CIF file.')
+
+parser.add_argument('--ClearFrameworkCache',
+                    action='store_true',
+                    help='Empty the framework cache before reading the CIF file.')
+
+parser.add_argument('--InputCache',
+                    type=str,
+                    action='store',
+                    required=False,
+                    metavar='INPUT_CACHE',
+                    default=None,
+                    help='Directory storing prepared CONFIG and FIELD files. Defaults to INPUT_FOLDER/.input_cache, '
+                         'set to "none" to always prepare them.')
+
+parser.add_argument('--ClearInputCache',
+                    action='store_true',
+                    help='Empty the store of prepared CONFIG and FIELD files before the run.')
 args = parser.parse_args()
 
 logging.debug(args)
 
 # Now let's set up the paths to the input and output directories, and check they exist
-input_file = pathlib.Path(args.InputFolder,  args.FrameworkName).with_suffix('.cif')
-assert input_file.exists(), '''Cannot find input file from specified location: {0}
+# The CIF file may also be compressed (.cif.gz, .cif.xz or .cif.bz2), or inside a tar or zip archive in the input folder
+input_file = cif_hack.find_cif(args.InputFolder, args.FrameworkName)
+assert input_file is not None, '''Cannot find input file for framework {0} in the specified location
 current directory: {1}
 {2}
 input directory: {3}
-{4}'''.format(input_file, os.getcwd(), os.listdir(), args.InputFolder, os.listdir(args.InputFolder))
+{4}'''.format(args.FrameworkName, os.getcwd(), os.listdir(), args.InputFolder, os.listdir(args.InputFolder))
 
 output_folder = pathlib.Path(args.OutputFolder)
 output_folder.mkdir(parents=True, exist_ok=True) # Makes the directory, if it didn't already exist
 
+# Repeated runs on an unchanged CIF file read the expanded framework back from the cache
+framework_cache = None
+if args.FrameworkCache is None or args.FrameworkCache.lower() != 'none':
+    framework_cache = FrameworkCache(args.FrameworkCache or pathlib.Path(args.InputFolder, '.framework_cache'))
+    if args.ClearFrameworkCache:
+        framework_cache.invalidate()
+
+input_cache = None
+if args.InputCache is None or args.InputCache.lower() != 'none':
+    input_cache = InputCache(args.InputCache or pathlib.Path(args.InputFolder, '.input_cache'))
+    if args.ClearInputCache:
+        input_cache.invalidate()
+
 logging.info(f"""-------------------
 Beginning Automated isotherm simulation
 -------------------
@@ -152,6 +212,11 @@ config_field_location = pathlib.Path('/run/')
 c2c.create_config_field(input_file=input_file,
                         output_directory=config_field_location,
                         use_cif_hack=True,
+                        framework_cache=framework_cache,
+                        keep_charges=args.FrameworkCharges,
+                        charge_tolerance=args.ChargeTolerance,
+                        validate=not args.SkipPreflight,
+                        input_cache=input_cache,
                         sorbate_molecules=[sorbates.lookup[list(args.GasComposition.keys())[0]]])
 
 # DEBUG: print out the locations of the input files
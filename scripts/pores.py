@@ -0,0 +1,228 @@
+"""Pore geometry of a framework on a probe grid, and the molecule numbers it
+allows.
+
+The CONFIG file sets how many molecules of each type DL_MONTE allocates room
+for, and a TMMC sweep the largest number of molecules its order parameter
+covers.  Both used to be fixed (1000 and 200 molecules) whatever the framework,
+allocating far too much for small pores and truncating the order parameter of
+large ones.
+
+PoreGrid measures the clearance of each point of a regular grid over the
+framework cell, i.e. its distance to the nearest atom surface, taking half of
+each atom's Lennard-Jones sigma as its radius.  For a probe sphere,
+PoreGrid.analyse() then finds:
+
+* the points its centre can reach, i.e. whose clearance is at least its
+  radius, and their connected components, periodic images included.  A
+  component reaching its own image in the next cell is a channel; the others
+  are pockets a molecule could only be inserted into, never reach.
+* the pore diameter of each point, as the largest sphere of accessible centre
+  covering it, whose histogram over the channels is the pore-size
+  distribution, and whose extent is the volume a molecule can occupy.
+
+molecule_cap() and saturation_loading() turn the channel volume into the
+number of molecules of a sorbate filling it as tightly as spheres can pack, and
+as densely as a liquid: an upper bound for the CONFIG file, and the end of a
+TMMC sweep.
+"""
+
+import math
+from typing import NamedTuple
+
+import numpy as np
+from scipy import ndimage
+from scipy.spatial import cKDTree
+
+DEFAULT_SPACING = 0.4
+# The largest fraction of space equal spheres fill, and the fraction the sites of a liquid fill
+CLOSE_PACKING = math.pi / (3 * math.sqrt(2))
+LIQUID_PACKING = 0.45
+# Headroom of molecule_cap() over close packing, as sites may be pushed closer than sigma
+CAP_MARGIN = 1.2
+# The step (A) the radii of covering spheres are rounded down to, so spheres of similar size are stamped together
+RADIUS_STEP = 0.1
+# Nearest atoms searched for the nearest atom surface, which need not belong to the nearest atom
+NEIGHBOURS = 8
+
+
+def atom_radii(molecule) -> np.ndarray:
+    """Returns the radius of each atom of a DLMolecule, half its Lennard-Jones sigma."""
+    radii = {tag: potential[1] / 2 for tag, potential in molecule.potentials.items()}
+    return np.array([radii[tag] for tag in molecule.molecule.get_tags().tolist()], dtype=float)
+
+
+def probe_diameter(sorbate) -> float:
+    """Returns the diameter of the probe standing for sorbate: its largest
+    site, as the narrowest opening a molecule can pass."""
+    return 2 * float(atom_radii(sorbate).max())
+
+
+def molecular_volume(sorbate, spacing=0.05) -> float:
+    """Returns the volume in A^3 of the union of the site spheres of sorbate,
+    counted on a grid of the given spacing."""
+    positions = np.asarray(sorbate.molecule.positions, dtype=float)
+    radii = atom_radii(sorbate)
+    lower, upper = (positions - radii[:, np.newaxis]).min(axis=0), (positions + radii[:, np.newaxis]).max(axis=0)
+    axes = [np.arange(low + spacing / 2, high, spacing) for low, high in zip(lower, upper)]
+    points = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, 3)
+    inside = np.zeros(len(points), dtype=bool)
+    for position, radius in zip(positions, radii):
+        inside |= np.sum((points - position) ** 2, axis=1) <= radius ** 2
+    return float(inside.sum()) * spacing ** 3
+
+
+class PoreAnalysis(NamedTuple):
+    """The pore geometry of a framework cell for one probe diameter, with
+    volumes in A^3 and lengths in A.
+
+    accessible_volume is the volume a probe can occupy in the channels and
+    inaccessible_volume that only in pockets.  pore_sizes holds the pore
+    diameters of the pore-size distribution and pore_size_distribution the
+    fraction of accessible_volume within each.  dimensions is the number of
+    independent directions the channels run in, zero if there are none.
+    """
+    probe_diameter: float
+    cell_volume: float
+    accessible_volume: float
+    inaccessible_volume: float
+    largest_included_sphere: float
+    dimensions: int
+    pockets: int
+    pore_sizes: np.ndarray
+    pore_size_distribution: np.ndarray
+
+    @property
+    def accessible_fraction(self) -> float:
+        return self.accessible_volume / self.cell_volume
+
+
+class PoreGrid:
+    """The clearance of a framework DLMolecule on a grid of about spacing (A)
+    over its cell, from which analyse() finds the pores open to any probe."""
+
+    def __init__(self, framework, spacing=DEFAULT_SPACING):
+        atoms = framework.molecule
+        self.cell = np.asarray(atoms.cell, dtype=float)
+        self.shape = tuple(max(int(math.ceil(length / spacing)), 1) for length in np.linalg.norm(self.cell, axis=1))
+        self.cell_volume = abs(float(np.linalg.det(self.cell)))
+        self.voxel_volume = self.cell_volume / np.prod(self.shape)
+        self.clearance = self._clearance(np.asarray(atoms.positions, dtype=float), atom_radii(framework))
+
+    def _grid_positions(self, offsets):
+        # The Cartesian positions of grid offsets (..., 3) from a grid point
+        return (np.asarray(offsets) / self.shape) @ self.cell
+
+    def _clearance(self, positions, radii):
+        axes = [np.arange(n) for n in self.shape]
+        points = self._grid_positions(np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, 3))
+        # The atoms of the cell and its neighbours, which hold the nearest atom surface of every point in the cell
+        shifts = np.array(np.meshgrid([-1, 0, 1], [-1, 0, 1], [-1, 0, 1], indexing='ij')).reshape(3, -1).T
+        images = (positions[np.newaxis] + (shifts @ self.cell)[:, np.newaxis]).reshape(-1, 3)
+        image_radii = np.tile(radii, len(shifts))
+        k = min(NEIGHBOURS, len(images))
+        distances, index = cKDTree(images).query(points, k=k)
+        return np.min((distances - image_radii[index]).reshape(len(points), k), axis=1).reshape(self.shape)
+
+    def _stencil(self, radius):
+        # The grid offsets within radius of a grid point
+        widths = self.cell_volume / np.linalg.norm(np.cross(self.cell[[1, 2, 0]], self.cell[[2, 0, 1]]), axis=1)
+        reach = np.ceil(radius / widths * self.shape).astype(int)
+        offsets = np.stack(np.meshgrid(*(np.arange(-r, r + 1) for r in reach), indexing='ij'), axis=-1).reshape(-1, 3)
+        return offsets[np.linalg.norm(self._grid_positions(offsets), axis=1) <= radius]
+
+    def _components(self, accessible):
+        # Labels the connected components of the accessible points, and finds the directions each one runs in
+        # by joining components across the cell faces, keeping the cell shift between each and its root
+        labels, count = ndimage.label(accessible)
+        parent = list(range(count + 1))
+        shift = [np.zeros(3, dtype=int) for _ in range(count + 1)]
+        cycles = [[] for _ in range(count + 1)]
+
+        def find(label):
+            path = []
+            while parent[label] != label:
+                path.append(label)
+                label = parent[label]
+            # Compressed from the root down, so each shift is relative to the root
+            for node in reversed(path):
+                if parent[node] != label:
+                    shift[node] = shift[node] + shift[parent[node]]
+                    parent[node] = label
+            return label
+
+        for axis in range(3):
+            first, last = np.take(labels, 0, axis=axis), np.take(labels, -1, axis=axis)
+            joined = (first > 0) & (last > 0)
+            step = np.eye(3, dtype=int)[axis]
+            for low, high in np.unique(np.stack([last[joined], first[joined]], axis=1), axis=0).tolist():
+                # The component high continues low one cell along axis
+                root_low, root_high = find(low), find(high)
+                offset = shift[low] + step - shift[high]
+                if root_low == root_high:
+                    if offset.any():
+                        cycles[root_low].append(offset)
+                else:
+                    parent[root_high] = root_low
+                    shift[root_high] = offset
+                    cycles[root_low].extend(cycles[root_high])
+
+        roots = np.array([find(label) for label in range(count + 1)])
+        dimensions = np.array([np.linalg.matrix_rank(np.array(cycles[root])) if cycles[root] else 0
+                               for root in roots])
+        return roots[labels], dimensions
+
+    def _cover(self, centres):
+        # The diameter of the largest sphere of the centres (flat indices) covering each point, zero outside them.
+        # The spheres of each radius are stamped at once, as the periodic convolution of their centres with a ball
+        steps = np.floor(self.clearance.ravel()[centres] / RADIUS_STEP).astype(int)
+        diameters = np.zeros(self.clearance.size)
+        for step in np.unique(steps)[::-1].tolist():
+            found = np.zeros(self.clearance.size)
+            found[centres[steps == step]] = 1.0
+            ball = np.zeros(self.shape)
+            ball[tuple((self._stencil(step * RADIUS_STEP) % self.shape).T)] = 1.0
+            covered = np.fft.irfftn(np.fft.rfftn(found.reshape(self.shape)) * np.fft.rfftn(ball), s=self.shape) > 0.5
+            # Larger spheres come first, so a point keeps the first diameter it gets
+            diameters[covered.ravel() & (diameters == 0)] = 2 * step * RADIUS_STEP
+        return diameters
+
+    def analyse(self, probe_diameter, bin_width=0.5) -> PoreAnalysis:
+        """Returns the PoreAnalysis of a probe sphere of probe_diameter (A), with
+        a pore-size distribution in bins of bin_width (A)."""
+        accessible = self.clearance >= probe_diameter / 2
+        components, dimensions = self._components(accessible)
+        channels = (dimensions[components] > 0).ravel()
+        pockets = accessible.ravel() & ~channels
+        channel_diameters = self._cover(np.flatnonzero(channels))
+        pocket_diameters = self._cover(np.flatnonzero(pockets))
+        occupied = channel_diameters[channel_diameters > 0]
+
+        largest = 2 * max(float(self.clearance.max()), 0.0)
+        edges = np.arange(0, largest + bin_width, bin_width)
+        counts = np.histogram(occupied, bins=edges)[0] if len(edges) > 1 else np.zeros(0)
+        return PoreAnalysis(probe_diameter=probe_diameter, cell_volume=self.cell_volume,
+                            accessible_volume=len(occupied) * self.voxel_volume,
+                            inaccessible_volume=int(np.sum((pocket_diameters > 0) & (channel_diameters == 0))) *
+                            self.voxel_volume,
+                            largest_included_sphere=largest, dimensions=int(dimensions.max(initial=0)),
+                            pockets=len(np.unique(components.ravel()[pockets])),
+                            pore_sizes=(edges[:-1] + edges[1:]) / 2,
+                            pore_size_distribution=counts / max(len(occupied), 1))
+
+
+def analyse(framework, sorbate, spacing=DEFAULT_SPACING) -> PoreAnalysis:
+    """Returns the PoreAnalysis of a framework DLMolecule for a sorbate DLMolecule."""
+    return PoreGrid(framework, spacing).analyse(probe_diameter(sorbate))
+
+
+def molecule_cap(analysis, sorbate, margin=CAP_MARGIN) -> int:
+    """Returns the number of molecules of sorbate for DL_MONTE to allocate room
+    for in the analysed cell: those of molecular_volume() close-packed into its
+    channels, with margin to spare, and at least one."""
+    return max(int(math.ceil(margin * CLOSE_PACKING * analysis.accessible_volume / molecular_volume(sorbate))), 1)
+
+
+def saturation_loading(analysis, sorbate) -> int:
+    """Returns the number of molecules of sorbate filling the channels of the
+    analysed cell as densely as a liquid, the end of a TMMC sweep."""
+    return max(int(math.ceil(LIQUID_PACKING * analysis.accessible_volume / molecular_volume(sorbate))), 1)
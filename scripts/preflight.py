@@ -0,0 +1,157 @@
+"""Pre-flight checks of framework structures, run before any CONFIG or FIELD
+file is written.
+
+A framework whose CIF has overlapping atoms, sites duplicated by the symmetry
+expansion, partially occupied sites or a net charge gives DL_MONTE a
+meaningless system, which is otherwise only noticed after a whole simulation.
+validate_structure() finds these problems and check_structure() raises
+InvalidStructure on them, in milliseconds even for large supercells.
+
+Close atoms are found with a periodic cell list: the unit cell is divided into
+bins whose perpendicular widths are at least the cutoff, so every pair closer
+than the cutoff lies in neighbouring bins, for triclinic cells too.  Each atom
+is only compared with the atoms of the bins around it, which takes O(N) time.
+
+Occupancies are read from Atoms.info['occupancy'], as set by cif_hack.read_cif;
+frameworks read back from a framework_cache carry no occupancies, but
+disordered sites usually also show up as atoms that are too close.
+"""
+
+import itertools
+import time
+
+import numpy as np
+
+DEFAULT_MIN_DISTANCE = 0.5
+DEFAULT_DUPLICATE_DISTANCE = 0.1
+DEFAULT_CHARGE_TOLERANCE = 1e-2
+
+
+class InvalidStructure(ValueError):
+    """Raised by check_structure(), with the problems found as its issues attribute."""
+
+    def __init__(self, name, issues):
+        self.name = name
+        self.issues = issues
+        super().__init__('{0} failed the pre-flight checks:\n  {1}'.format(name, '\n  '.join(issues)))
+
+
+def neighbour_pairs(scaled_positions, cell, cutoff):
+    """Find every pair of atoms closer than cutoff in a periodic cell,
+    including atoms close to periodic images of themselves.
+
+    The scaled positions are binned into a grid of cells at least cutoff wide
+    across every pair of opposite faces.  A pair closer than cutoff is then at
+    most one bin apart along each axis (more if the cell itself is thinner than
+    cutoff), so only the bins around each atom are searched.
+
+    Returns three arrays: the indices i and j of each pair and their distance,
+    with i < j, or i == j for an atom and one of its images.  A pair appears
+    once for each of its images within cutoff.
+    """
+    scaled = np.asarray(scaled_positions, dtype=float).reshape(-1, 3) % 1.0
+    cell = np.asarray(cell, dtype=float)
+    # The columns of the inverse cell are the reciprocal lattice vectors, whose lengths are the inverse widths
+    widths = 1.0 / np.linalg.norm(np.linalg.inv(cell), axis=0)
+    nbins = np.maximum(np.floor(widths / cutoff).astype(np.int64), 1)
+    reach = np.ceil(cutoff * nbins / widths).astype(np.int64)
+
+    bins = np.minimum((scaled * nbins).astype(np.int64), nbins - 1)
+
+    def bin_keys(indices):
+        return (indices[:, 0] * nbins[1] + indices[:, 1]) * nbins[2] + indices[:, 2]
+
+    order = np.argsort(bin_keys(bins), kind='stable')
+    sorted_keys = bin_keys(bins)[order]
+
+    pair_i, pair_j, pair_distances = [], [], []
+    for offset in itertools.product(*(range(-r, r + 1) for r in reach.tolist())):
+        shifted = bins + offset
+        images = np.floor_divide(shifted, nbins)
+        keys = bin_keys(shifted - images * nbins)
+        first = np.searchsorted(sorted_keys, keys, side='left')
+        counts = np.searchsorted(sorted_keys, keys, side='right') - first
+        total = counts.sum()
+        if total == 0:
+            continue
+        qi = np.repeat(np.arange(len(scaled)), counts)
+        pj = order[np.arange(total) + np.repeat(first - (np.cumsum(counts) - counts), counts)]
+        shift = images[qi]
+        distances = np.linalg.norm((scaled[pj] + shift - scaled[qi]) @ cell, axis=1)
+        # Each pair is met from both of its atoms, and each image of an atom from both sides, so keep one of each
+        nonzero = shift != 0
+        positive = shift[np.arange(len(shift)), np.argmax(nonzero, axis=1)] > 0
+        close = (distances < cutoff) & ((qi < pj) | ((qi == pj) & positive))
+        pair_i.append(qi[close])
+        pair_j.append(pj[close])
+        pair_distances.append(distances[close])
+
+    if not pair_i:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+    return np.concatenate(pair_i), np.concatenate(pair_j), np.concatenate(pair_distances)
+
+
+def partially_occupied(atoms) -> np.ndarray:
+    """Returns a mask of the atoms on sites with a total occupancy below one
+    or shared between several species, from Atoms.info['occupancy']."""
+    occupancy = atoms.info.get('occupancy')
+    kinds = atoms.arrays.get('spacegroup_kinds')
+    if occupancy is None or kinds is None:
+        return np.zeros(len(atoms), dtype=bool)
+    partial_kinds = {int(kind) for kind, species in occupancy.items()
+                     if len(species) > 1 or any(float(occ) < 1.0 for occ in species.values())}
+    return np.isin(kinds, list(partial_kinds))
+
+
+def validate_structure(atoms, min_distance=DEFAULT_MIN_DISTANCE, duplicate_distance=DEFAULT_DUPLICATE_DISTANCE,
+                       check_charges=True, charge_tolerance=DEFAULT_CHARGE_TOLERANCE) -> list:
+    """Returns a description of every problem found in the periodic structure
+    atoms, or an empty list if there is none.
+
+    Pairs of atoms of the same element closer than duplicate_distance are
+    reported as duplicate sites, and other pairs closer than min_distance (in
+    A) as overlapping atoms.  With check_charges, a net charge larger than
+    charge_tolerance (in e) is reported too.
+    """
+    if len(atoms) == 0:
+        return ['the structure has no atoms']
+    if not atoms.pbc.all() or abs(atoms.cell.volume) < 1e-6:
+        return ['the structure has no three-dimensional periodic cell']
+
+    issues = []
+    symbols = np.array(atoms.get_chemical_symbols())
+    i, j, distances = neighbour_pairs(atoms.get_scaled_positions(wrap=False), atoms.cell,
+                                      max(min_distance, duplicate_distance))
+    duplicate = (symbols[i] == symbols[j]) & (distances < duplicate_distance)
+    descriptions = {
+        'duplicate sites (atoms of the same element closer than {0} A)'.format(duplicate_distance): duplicate,
+        'overlapping atoms (closer than {0} A)'.format(min_distance): ~duplicate & (distances < min_distance),
+    }
+    for description, mask in descriptions.items():
+        if mask.any():
+            closest = np.flatnonzero(mask)[np.argmin(distances[mask])]
+            issues.append('{0} {1}, e.g. {2} {3} and {4} {5} at {6:.3f} A'.format(
+                np.count_nonzero(mask), description, symbols[i[closest]], i[closest], symbols[j[closest]],
+                j[closest], distances[closest]))
+
+    partial = partially_occupied(atoms)
+    if partial.any():
+        issues.append('{0} atoms on partially occupied sites, e.g. {1} {2}'.format(
+            np.count_nonzero(partial), symbols[partial][0], np.flatnonzero(partial)[0]))
+
+    if check_charges:
+        net_charge = atoms.get_initial_charges().sum()
+        if abs(net_charge) > charge_tolerance:
+            issues.append('net charge of {0:.4f} e (tolerance {1} e)'.format(net_charge, charge_tolerance))
+    return issues
+
+
+def check_structure(atoms, name='structure', **kwargs):
+    """Raises InvalidStructure if validate_structure(atoms, **kwargs) finds
+    any problem, and otherwise prints how long the checks took."""
+    start = time.perf_counter()
+    issues = validate_structure(atoms, **kwargs)
+    if issues:
+        raise InvalidStructure(name, issues)
+    print('{0} passed the pre-flight checks: {1} atoms in {2:.1f} ms'.format(
+        name, len(atoms), 1000 * (time.perf_counter() - start)))
@@ -0,0 +1,514 @@
+"""Screens a directory of framework CIF files for one sorbate in stages of
+increasing cost.
+
+A full isotherm takes hours of DL_MONTE time per framework, which is wasted on
+frameworks that a cheaper estimate already ranks out.  Each framework goes
+through the stages in turn, and only the frameworks passing a stage reach the
+next one:
+
+* structure: the CIF file is read and passes the pre-flight checks (see
+  preflight.py).
+* pores: a probe of the sorbate's size travels through the framework, and its
+  accessible volume fraction, largest included sphere and channel
+  dimensionality reach their minima (see pores.py).
+* henry: the Henry coefficient from Widom insertions into energy grids (see
+  henry.py) reaches its minimum, and ranks within the best HenryKeep.
+* gcmc: a short, single GCMC run at the target pressure gives a loading that
+  reaches its minimum, and ranks within the best GCMCKeep.
+* isotherm: a full isotherm over the given pressures, as isotherm_runner.py
+  runs it.
+
+The frameworks of each stage are measured in a pool of worker processes.  The
+measurements and decisions are kept in the output folder's screening.json,
+so a repeated run only measures what is new: frameworks whose CIF contents
+changed, stages whose settings changed, and measurements that failed.  Cutoffs only change decisions,
+so tightening or loosening them reuses every measurement.  Keep values below 1
+are the fraction of the stage's frameworks to keep, others their number.
+
+    python screening.py --InputFolder ../interface --OutputFolder ../interface/screening --Sorbate CO2
+"""
+
+import argparse
+import concurrent.futures
+import copy
+import json
+import math
+import os
+import pathlib
+import tempfile
+import time
+
+import numpy as np
+import dlmontepython.simtask.dlmonteinterface as interface
+import dlmontepython.simtask.measurement as measurement
+import dlmontepython.simtask.task as task
+
+import cif2config as c2c
+import cif_hack
+import henry
+import ingest_frameworks
+import isotherm_control_generator as isotherm
+import pores
+import preflight
+import sorbates
+from framework_cache import FrameworkCache, content_hash
+
+STAGES = ('structure', 'pores', 'henry', 'gcmc', 'isotherm')
+# The result ranked by each stage, larger being better
+METRICS = {'henry': 'henry', 'gcmc': 'loading', 'isotherm': 'loading'}
+MANIFEST = 'screening.json'
+PA_TO_KATM = 9.86923e-9
+# g/cm^3 in amu/A^3
+AMU_PER_A3 = 1.66053906660
+
+
+def measure_structure(name, cif_file, settings, paths):
+    try:
+        atoms = FrameworkCache(paths['framework_cache']).get_atoms(cif_file)
+    except StopIteration:
+        raise cif_hack.NoStructureData('No structure found in CIF file') from None
+    preflight.check_structure(atoms, name, check_charges=settings['keep_charges'])
+    # Descriptors costing nothing to compute, for active_learning.py
+    symbols = atoms.get_chemical_symbols()
+    volume = atoms.get_volume()
+    return {'atoms': len(atoms), 'formula': atoms.get_chemical_formula(), 'cell': atoms.cell.cellpar().tolist(),
+            'volume': volume, 'density': float(np.sum(atoms.get_masses())) * AMU_PER_A3 / volume,
+            'composition': {symbol: symbols.count(symbol) / len(symbols) for symbol in sorted(set(symbols))}}
+
+
+def measure_pores(name, cif_file, settings, paths):
+    atoms = FrameworkCache(paths['framework_cache']).get_atoms(cif_file)
+    sorbate = sorbates.lookup[settings['sorbate']]
+    # The geometry repeats with the framework, so its smallest cell is enough
+    framework = henry.prepare_framework(atoms, settings['forcefield'])
+    analysis = pores.analyse(framework, sorbate, spacing=settings['spacing'])
+    return {'probe_diameter': analysis.probe_diameter, 'accessible_fraction': analysis.accessible_fraction,
+            'largest_included_sphere': analysis.largest_included_sphere, 'dimensions': analysis.dimensions,
+            'pockets': analysis.pockets}
+
+
+def measure_henry(name, cif_file, settings, paths):
+    atoms = FrameworkCache(paths['framework_cache']).get_atoms(cif_file)
+    framework = henry.prepare_framework(atoms, settings['forcefield'], keep_charges=settings['keep_charges'],
+                                        charge_tolerance=settings['charge_tolerance'])
+    grid = henry.EnergyGrid(framework, settings['forcefield'], spacing=settings['spacing'],
+                            coulomb=settings['keep_charges'], cache=henry.GridCache(paths['grid_cache']))
+    result = henry.widom(grid, sorbates.lookup[settings['sorbate']], settings['temperature'],
+                         insertions=settings['insertions'], seed=0)
+    # The loading at the target pressure, were the isotherm linear up to it
+    return dict(result._asdict(), loading=result.henry * settings['pressure'])
+
+
+def run_gcmc(name, cif_file, settings, paths, stage, precisions=None, maxsims=1, maxtime=None):
+    '''
+    Runs a GCMC measurement at each of the pressures in settings, in the directory of the framework within the stage
+    directory of the output folder.
+
+    :param name: (str) the framework name
+    :param cif_file: (str) the framework CIF file
+    :param settings: (dict) the stage settings: sorbate, temperature, pressures, steps and framework options
+    :param paths: (dict) the output folder, the framework cache and the DL_MONTE executable
+    :param stage: (str) the stage name
+    :param precisions: (float) the standard error of the number of molecules to reach, or None for a single run
+    :param maxsims: (int) the largest number of simulations per pressure
+    :param maxtime: (float) the longest time per pressure, in s
+    :return loadings: (ndarray) the loading and its standard error at each pressure, in mol/kg
+    '''
+    directory = pathlib.Path(paths['output']) / stage / name
+    directory.mkdir(parents=True, exist_ok=True)
+    sorbate = sorbates.lookup[settings['sorbate']]
+
+    control_obj = copy.deepcopy(isotherm.AdsorptionExample)
+    control_obj.use_block.use_statements.pop('ortho', None)
+    control_obj.main_block.statements['temperature'] = settings['temperature']
+    control_obj.main_block.statements['steps'] = settings['steps']
+    control_obj.main_block.moves = isotherm.define_molecule_movers(sorbate.name)
+    (directory / 'CONTROL').write_text(str(control_obj))
+
+    framework = c2c.prepare_framework(cif_file, use_cif_hack=True,
+                                      framework_cache=FrameworkCache(paths['framework_cache']),
+                                      keep_charges=settings['keep_charges'],
+                                      charge_tolerance=settings['charge_tolerance'],
+                                      forcefield=settings['forcefield'], validate=False)
+    c2c.write_config_field(framework, directory, [sorbate], forcefield=settings['forcefield'])
+
+    nmol_obs = task.Observable(('nmol', 1))
+    template = measurement.Measurement(interface.DLMonteInterface(paths['executable']), [nmol_obs],
+                                       precisions={nmol_obs: precisions} if precisions else {}, maxsims=maxsims,
+                                       maxtime=maxtime, inputdir=str(directory))
+    sweep = measurement.MeasurementSweep(param='molchempot',
+                                         paramvalues=[pressure * PA_TO_KATM for pressure in settings['pressures']],
+                                         measurement_template=template, outputdir=str(directory / 'sweep'))
+    sweep.run()
+    # Molecules per simulation cell, then mol/kg of framework
+    data = np.loadtxt(directory / 'sweep' / 'nmol_1_sweep.dat', ndmin=2)
+    return data[:, 1:3] * 1000 / float(np.sum(framework.molecule.get_masses()))
+
+
+def measure_gcmc(name, cif_file, settings, paths):
+    (loading, error), = run_gcmc(name, cif_file, dict(settings, pressures=[settings['pressure']]), paths, 'gcmc',
+                                 maxtime=settings['maxtime'])
+    return {'loading': float(loading), 'loading_error': float(error)}
+
+
+def measure_isotherm(name, cif_file, settings, paths):
+    # As isotherm_runner.py runs each pressure
+    loadings = run_gcmc(name, cif_file, settings, paths, 'isotherm', precisions=2, maxsims=20, maxtime=600)
+    target = settings['pressures'].index(settings['pressure'])
+    return {'loading': float(loadings[target, 0]), 'loading_error': float(loadings[target, 1]),
+            'isotherm': [[pressure, *map(float, row)] for pressure, row in zip(settings['pressures'], loadings)]}
+
+
+MEASURES = {'structure': measure_structure, 'pores': measure_pores, 'henry': measure_henry, 'gcmc': measure_gcmc,
+            'isotherm': measure_isotherm}
+
+
+def run_stage(stage, name, cif_file, settings, paths):
+    '''
+    Measures one framework for a stage in a worker process, catching any error.
+
+    :param stage: (str) the stage name
+    :param name: (str) the framework name
+    :param cif_file: (str) the framework CIF file
+    :param settings: (dict) the stage settings
+    :param paths: (dict) the output folder, caches and DL_MONTE executable
+    :return record: (dict) the stage record, with the measured 'result' or an 'error'
+    '''
+    start = time.perf_counter()
+    record = {'settings': settings}
+    try:
+        record['result'] = MEASURES[stage](name, cif_file, settings, paths)
+    except Exception as error:
+        record['error'] = f'{type(error).__name__}: {error}'
+    record['seconds'] = time.perf_counter() - start
+    return record
+
+
+def decide(records, minimum, keep=None, metric=None):
+    '''
+    Decides which frameworks pass a stage from their records, setting the 'passed' and 'reason' entries of each.
+
+    :param records: (dict) the stage record of each framework
+    :param minimum: (dict) the smallest passing value of results, e.g. {'dimensions': 1}
+    :param keep: (float) the fraction (below 1) or number of the passing frameworks kept, best first by metric,
+        or None to keep them all
+    :param metric: (str) the result ranking the frameworks, larger being better
+    :return passed: (list) the names of the frameworks passing, best first if ranked
+    '''
+    passed = []
+    for name, record in records.items():
+        record['passed'], record['reason'] = False, record.get('error')
+        if 'error' in record:
+            continue
+        below = [key for key, value in minimum.items() if not record['result'][key] >= value]
+        if below:
+            record['reason'] = 'below the minimum ' + ', '.join(below)
+            continue
+        passed.append(name)
+    if metric is not None:
+        passed.sort(key=lambda name: records[name]['result'][metric], reverse=True)
+    if keep is not None:
+        count = math.ceil(keep * len(passed)) if keep < 1 else int(keep)
+        for name in passed[count:]:
+            records[name]['reason'] = f'not among the best {count} by {metric}'
+        passed = passed[:count]
+    for name in passed:
+        records[name]['passed'] = True
+    return passed
+
+
+def default_settings(sorbate, temperature, pressure, pressures=(1e-2, 1e-1, 1e0, 1e1, 1e2, 1e3, 1e4, 1e5, 1e6),
+                     insertions=100000, gcmc_steps=int(1e5), gcmc_time=300.0, keep_charges=False,
+                     charge_tolerance=0.0):
+    '''
+    Returns the settings of each stage for screening a sorbate at a temperature and target pressure.
+
+    :param sorbate: (str) the gas name of the sorbate in sorbates.lookup
+    :param temperature: (float) the temperature, in K
+    :param pressure: (float) the target pressure, in Pa
+    :param pressures: (list) the pressures of the full isotherms, in Pa, to which the target pressure is added
+    :param insertions: (int) the Widom insertions per framework of the henry stage
+    :param gcmc_steps: (int) the steps of the short run of the gcmc stage
+    :param gcmc_time: (float) the longest time of the short run of the gcmc stage, in s
+    :param keep_charges: (bool) use the framework charges from the CIF files
+    :param charge_tolerance: (float) the largest charge difference between atoms merged into one atom type, in e
+    :return settings: (dict) the settings of each stage
+    '''
+    framework = dict(forcefield='UFF', keep_charges=keep_charges, charge_tolerance=charge_tolerance)
+    state = dict(framework, sorbate=sorbate, temperature=temperature, pressure=pressure)
+    return {
+        'structure': {'keep_charges': keep_charges},
+        'pores': dict(forcefield='UFF', sorbate=sorbate, spacing=pores.DEFAULT_SPACING),
+        'henry': dict(state, insertions=insertions, spacing=henry.DEFAULT_SPACING),
+        'gcmc': dict(state, steps=gcmc_steps, maxtime=gcmc_time),
+        'isotherm': dict(state, steps=int(1e6), pressures=sorted(set(pressures) | {pressure})),
+    }
+
+
+def read_manifest(output_directory):
+    path = pathlib.Path(output_directory) / MANIFEST
+    if path.exists():
+        with open(path) as fd:
+            return json.load(fd)
+    return {'frameworks': {}}
+
+
+def write_manifest(output_directory, manifest):
+    output_directory = pathlib.Path(output_directory)
+    output_directory.mkdir(parents=True, exist_ok=True)
+    # Replaced in one step, so an interrupted run never leaves a half-written manifest
+    with tempfile.NamedTemporaryFile('w', dir=output_directory, suffix='.tmp', delete=False) as fd:
+        json.dump(manifest, fd, indent=1, sort_keys=True)
+    os.replace(fd.name, output_directory / MANIFEST)
+
+
+def screen(cif_files, output_directory, settings, cutoffs, paths, last_stage='isotherm', processes=None):
+    '''
+    Screens CIF files through the stages up to last_stage, measuring the frameworks of each stage across a process
+    pool, and updates the screening manifest after each stage.
+
+    :param cif_files: (list) paths of CIF files and archives of them
+    :param output_directory: (pathlib.Path) the directory of the manifest and the GCMC runs
+    :param settings: (dict) the settings of each stage; a changed setting measures the stage again
+    :param cutoffs: (dict) the 'minimum' and 'keep' arguments of decide() for each stage
+    :param paths: (dict) the framework_cache and grid_cache directories and the DL_MONTE executable
+    :param last_stage: (str) the last stage run
+    :param processes: (int) the number of worker processes, defaulting to the number of CPUs
+    :return ranking: (list) the names of the frameworks passing last_stage, best first
+    '''
+    paths = dict(paths, output=str(output_directory))
+    manifest = read_manifest(output_directory)
+    frameworks = {}
+    for name, cif_file, _ in ingest_frameworks.cif_sources(cif_files):
+        if name in frameworks:
+            print(f'  {cif_file}: skipped, as it has the same framework name as {frameworks[name]["cif"]}')
+            continue
+        sha256 = content_hash(cif_file)
+        previous = manifest['frameworks'].get(name, {})
+        # A changed file is measured again from the start
+        stages = previous.get('stages', {}) if previous.get('sha256') == sha256 else {}
+        frameworks[name] = {'cif': cif_file, 'sha256': sha256, 'stages': stages}
+    manifest['frameworks'] = frameworks
+
+    candidates = sorted(frameworks)
+    processes = processes or os.cpu_count() or 1
+    for stage in STAGES[:STAGES.index(last_stage) + 1]:
+        start = time.perf_counter()
+        # Measured again if the settings changed, or if it failed, e.g. for want of the DL_MONTE executable
+        pending = [name for name in candidates if 'error' in frameworks[name]['stages'].get(stage, {'error': None}) or
+                   frameworks[name]['stages'][stage]['settings'] != settings[stage]]
+        if pending:
+            with concurrent.futures.ProcessPoolExecutor(min(processes, len(pending))) as pool:
+                futures = {name: pool.submit(run_stage, stage, name, frameworks[name]['cif'], settings[stage], paths)
+                           for name in pending}
+                for name, future in futures.items():
+                    frameworks[name]['stages'][stage] = future.result()
+        candidates = decide({name: frameworks[name]['stages'][stage] for name in candidates},
+                            metric=METRICS.get(stage), **cutoffs[stage])
+        # Decisions of later stages no longer hold for the frameworks rejected here
+        for name in set(frameworks) - set(candidates):
+            for later in STAGES[STAGES.index(stage) + 1:]:
+                frameworks[name]['stages'].get(later, {}).pop('passed', None)
+                frameworks[name]['stages'].get(later, {}).pop('reason', None)
+        write_manifest(output_directory, dict(manifest, cutoffs=cutoffs))
+        print(f'{stage}: {len(pending)} measured in {time.perf_counter() - start:.2f} s, '
+              f'{len(candidates)} passed')
+
+    for rank, name in enumerate(candidates, 1):
+        result = frameworks[name]['stages'][last_stage]['result']
+        metric = METRICS.get(last_stage)
+        print(f'  {rank}. {name}' + (f': {metric} {result[metric]:.4g}' if metric else ''))
+    return candidates
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-i', '--InputFolder',
+                        type=str,
+                        action='store',
+                        required=False,
+                        metavar='INPUT_FOLDER',
+                        default='.',
+                        help='Location of the framework CIF files.')
+
+    parser.add_argument('-g', '--Pattern',
+                        type=str,
+                        action='store',
+                        required=False,
+                        metavar='PATTERN',
+                        default='*',
+                        help='Glob pattern of the CIF files and archives within INPUT_FOLDER, e.g. "**/*.cif.gz". '
+                             'Other files are ignored.')
+
+    parser.add_argument('-o', '--OutputFolder',
+                        type=str,
+                        action='store',
+                        required=True,
+                        metavar='OUTPUT_FOLDER',
+                        help='Location of the screening manifest and the GCMC runs.')
+
+    parser.add_argument('-s', '--Sorbate',
+                        type=str,
+                        action='store',
+                        required=False,
+                        metavar='SORBATE',
+                        default='CO2',
+                        help='Gas name of the sorbate in sorbates.lookup.')
+
+    parser.add_argument('-t', '--Temperature',
+                        type=float,
+                        action='store',
+                        required=False,
+                        metavar='TEMPERATURE',
+                        default=298.0,
+                        help='Specified temperature (in K).')
+
+    parser.add_argument('-p', '--Pressure',
+                        type=float,
+                        action='store',
+                        required=False,
+                        metavar='PRESSURE',
+                        default=1e4,
+                        help='Target pressure the frameworks are ranked at, in Pa.')
+
+    parser.add_argument('--Pressures',
+                        type=lambda x: [float(y) for y in x.split(',')],
+                        action='store',
+                        required=False,
+                        metavar='PRESSURES',
+                        default='1e-2,1e-1,1e0,1e1,1e2,1e3,1e4,1e5,1e6',
+                        help='Comma-separated pressures of the full isotherms, in Pa. The target pressure is added.')
+
+    parser.add_argument('-n', '--Processes',
+                        type=int,
+                        action='store',
+                        required=False,
+                        metavar='PROCESSES',
+                        default=None,
+                        help='Number of worker processes. Defaults to the number of CPUs.')
+
+    parser.add_argument('--LastStage',
+                        type=str,
+                        action='store',
+                        required=False,
+                        choices=STAGES,
+                        default='isotherm',
+                        help='Last stage run.')
+
+    parser.add_argument('--FrameworkCharges',
+                        action='store_true',
+                        help='Use the framework charges from the CIF file (_atom_site_charge) instead of neutral '
+                             'atoms.')
+
+    parser.add_argument('--ChargeTolerance',
+                        type=float,
+                        action='store',
+                        required=False,
+                        metavar='CHARGE_TOLERANCE',
+                        default=0.0,
+                        help='Largest charge difference (in e) between framework atoms merged into one atom type.')
+
+    parser.add_argument('--MinAccessibleFraction',
+                        type=float,
+                        action='store',
+                        required=False,
+                        default=0.0,
+                        help='Smallest accessible pore volume fraction passing the pores stage.')
+
+    parser.add_argument('--MinPoreDiameter',
+                        type=float,
+                        action='store',
+                        required=False,
+                        default=0.0,
+                        help='Smallest largest included sphere diameter (in A) passing the pores stage.')
+
+    parser.add_argument('--MinDimensions',
+                        type=int,
+                        action='store',
+                        required=False,
+                        default=1,
+                        help='Fewest directions the channels must run in to pass the pores stage.')
+
+    parser.add_argument('--MinHenry',
+                        type=float,
+                        action='store',
+                        required=False,
+                        default=0.0,
+                        help='Smallest Henry coefficient (in mol/kg/Pa) passing the henry stage.')
+
+    parser.add_argument('--HenryKeep',
+                        type=float,
+                        action='store',
+                        required=False,
+                        default=0.25,
+                        help='Fraction (below 1) or number of the frameworks passing the henry stage, best first.')
+
+    parser.add_argument('--Insertions',
+                        type=int,
+                        action='store',
+                        required=False,
+                        default=100000,
+                        help='Widom insertions per framework in the henry stage.')
+
+    parser.add_argument('--MinLoading',
+                        type=float,
+                        action='store',
+                        required=False,
+                        default=0.0,
+                        help='Smallest loading at the target pressure (in mol/kg) passing the gcmc stage.')
+
+    parser.add_argument('--GCMCKeep',
+                        type=float,
+                        action='store',
+                        required=False,
+                        default=0.2,
+                        help='Fraction (below 1) or number of the frameworks passing the gcmc stage, best first.')
+
+    parser.add_argument('--GCMCSteps',
+                        type=int,
+                        action='store',
+                        required=False,
+                        default=int(1e5),
+                        help='Steps of the single short run of the gcmc stage.')
+
+    parser.add_argument('--GCMCTime',
+                        type=float,
+                        action='store',
+                        required=False,
+                        default=300.0,
+                        help='Longest time (in s) of the short run of the gcmc stage.')
+
+    parser.add_argument('--Executable',
+                        type=str,
+                        action='store',
+                        required=False,
+                        default='/usr/local/bin/DLMONTE-SRL.X',
+                        help='DL_MONTE executable.')
+
+    parser.add_argument('--FrameworkCache',
+                        type=str,
+                        action='store',
+                        required=False,
+                        metavar='FRAMEWORK_CACHE',
+                        default=None,
+                        help='Directory caching frameworks read from CIF files. Defaults to '
+                             'OUTPUT_FOLDER/.framework_cache.')
+    args = parser.parse_args()
+
+    stage_settings = default_settings(args.Sorbate, args.Temperature, args.Pressure, pressures=args.Pressures,
+                                      insertions=args.Insertions, gcmc_steps=args.GCMCSteps,
+                                      gcmc_time=args.GCMCTime, keep_charges=args.FrameworkCharges,
+                                      charge_tolerance=args.ChargeTolerance)
+    stage_cutoffs = {
+        'structure': {'minimum': {}},
+        'pores': {'minimum': {'accessible_fraction': args.MinAccessibleFraction,
+                              'largest_included_sphere': args.MinPoreDiameter, 'dimensions': args.MinDimensions}},
+        'henry': {'minimum': {'henry': args.MinHenry}, 'keep': args.HenryKeep},
+        'gcmc': {'minimum': {'loading': args.MinLoading}, 'keep': args.GCMCKeep},
+        'isotherm': {'minimum': {}},
+    }
+    output = pathlib.Path(args.OutputFolder)
+    cache_paths = {'framework_cache': args.FrameworkCache or str(output / '.framework_cache'),
+                   'grid_cache': str(output / '.grid_cache'), 'executable': args.Executable}
+    screen(list(pathlib.Path(args.InputFolder).glob(args.Pattern)), output, stage_settings, stage_cutoffs,
+           cache_paths, last_stage=args.LastStage, processes=args.Processes)
@@ -0,0 +1,123 @@
+"""Framework arrays shared between worker processes.
+
+Running several sorbates or state points against one framework in a pool of
+worker processes otherwise has every worker read the CIF and build its own
+copy of the supercell with dlmolecule.from_ase, which for large frameworks
+dominates both the startup time and the memory of each worker.
+
+SharedFramework copies the FrameworkArrays of a prepared framework DLMolecule
+(atomic numbers, positions, tags, masses and charges) into one
+multiprocessing.shared_memory block.  Its handle holds the name of the block
+and the small parts of the molecule (cell, atom type names and potentials), so
+it is cheap to pickle and send to the workers, where attach() wraps the block
+in a DLMolecule without copying it.  Every worker sees the same memory, so the
+attached atoms are read-only: CONFIG and FIELD files and analyses only read
+them, and a worker needing other tags or charges must copy the arrays first.
+
+The preparing process unlinks the block when the SharedFramework is closed,
+normally by leaving its with block once the workers' pool has shut down:
+
+    with SharedFramework(cif2config.prepare_framework(cif_file)) as shared:
+        with concurrent.futures.ProcessPoolExecutor() as pool:
+            pool.map(run_sorbate, itertools.repeat(shared.handle), sorbate_names)
+
+Unlinking only removes the name of the block; its memory is freed when the
+last process mapping it exits, so workers still running keep a valid framework.
+"""
+
+import sys
+from multiprocessing import resource_tracker, shared_memory
+from typing import NamedTuple
+
+import numpy as np
+
+from dlmolecule import FRAMEWORK_DTYPE, DLMolecule, FrameworkArrays
+
+
+class SharedFrameworkHandle(NamedTuple):
+    """What a worker needs to attach to a SharedFramework."""
+    block: str
+    length: int
+    cell: list
+    pbc: list
+    name: str
+    tags: dict
+    potentials: dict
+    tracker: int
+
+
+def _tracker_pid():
+    # The resource tracker that unlinks this process's blocks when it exits, shared by the processes it starts;
+    # None in processes spawned with their parent's tracker
+    return getattr(resource_tracker._resource_tracker, '_pid', None)
+
+
+# The blocks attached to by this process and their molecules, kept mapped until it exits
+_ATTACHED = {}
+
+
+class SharedFramework:
+    """The atoms of a framework DLMolecule in a shared memory block, owned by
+    the process that created it.
+
+    Frameworks held as ASE.Atoms objects are converted to FrameworkArrays
+    first.  The block is unlinked by close(), or on leaving a with block.
+    """
+
+    def __init__(self, framework: DLMolecule):
+        arrays = framework.molecule
+        if not isinstance(arrays, FrameworkArrays):
+            arrays = FrameworkArrays.from_atoms(arrays)
+        # Shared memory blocks cannot be empty
+        self._block = shared_memory.SharedMemory(create=True, size=max(arrays.atoms.nbytes, 1))
+        shared = np.ndarray(len(arrays), dtype=FRAMEWORK_DTYPE, buffer=self._block.buf)
+        shared[...] = arrays.atoms
+        # No view of the block may outlive it, or closing it fails
+        del shared
+        self.handle = SharedFrameworkHandle(block=self._block.name, length=len(arrays),
+                                            cell=np.asarray(arrays.cell).tolist(), pbc=arrays.pbc.tolist(),
+                                            name=framework.name, tags=dict(framework.tags),
+                                            potentials=dict(framework.potentials), tracker=_tracker_pid())
+
+    @property
+    def nbytes(self) -> int:
+        return self._block.size
+
+    def close(self):
+        """Unlinks the block, so no further worker can attach to it."""
+        if self._block is None:
+            return
+        self._block.close()
+        self._block.unlink()
+        self._block = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def attach(handle: SharedFrameworkHandle) -> DLMolecule:
+    """Returns the framework DLMolecule of handle, whose atoms are the shared
+    block itself, without copying them.
+
+    The block stays mapped until this process exits, and attaching to it again
+    returns the same molecule, so attach() can be called once per task or as
+    the initializer of a process pool.
+    """
+    if handle.block not in _ATTACHED:
+        if sys.version_info >= (3, 13):
+            block = shared_memory.SharedMemory(name=handle.block, track=False)
+        else:
+            block = shared_memory.SharedMemory(name=handle.block)
+            # Attaching also registers the block with this process's resource tracker, which would unlink it when
+            # this process exits if it has its own tracker, i.e. if this process was started before the owner's
+            if _tracker_pid() not in (None, handle.tracker):
+                resource_tracker.unregister(block._name, 'shared_memory')
+        atoms = np.ndarray(handle.length, dtype=FRAMEWORK_DTYPE, buffer=block.buf)
+        atoms.flags.writeable = False
+        molecule = DLMolecule(handle.name, FrameworkArrays(atoms, handle.cell, handle.pbc), dict(handle.tags),
+                              dict(handle.potentials))
+        _ATTACHED[handle.block] = (block, molecule)
+    return _ATTACHED[handle.block][1]